@@ -0,0 +1,231 @@
+"""Offline throughput benchmark for the automoderator.
+
+Generates a synthetic message corpus and runs it through
+``Automoderator.evaluate`` using the lightweight stand-ins for Discord
+objects below, so no Discord connection is needed. Run from the repository root:
+
+    python -m benchmarks.automod_bench --messages 1000000 --terms 50000
+"""
+import argparse
+from collections import namedtuple
+import gc
+import os
+import random
+import resource
+import string
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import yaml
+
+from src.automoderation.automod import Automoderator
+from src.automoderation.features import MessageFeatures
+
+DummyAuthor = namedtuple("DummyAuthor", ["id", "name"])
+DummyAttachment = namedtuple("DummyAttachment", ["filename"])
+DummyGuild = namedtuple("DummyGuild", ["id"])
+
+
+class DummyMessage:
+    def __init__(self, content, author, attachments=None, mentions=None, guild=None):
+        self.content = content
+        self.author = author
+        self.attachments = attachments or []
+        self.mentions = mentions or []
+        self.guild = guild
+
+
+WORDS = (
+    "the and you that was for are with his they this have from one had word what "
+    "all were when your can said there use each which she how their will other "
+    "about out many then them these some her would make like him into time has "
+    "look two more write see number way could people than first water been call"
+).split()
+
+SAFE_EXTENSIONS = (".png", ".jpg", ".gif", ".txt", ".pdf", ".mp4")
+
+
+def random_term(rng, low=5, high=12):
+    return "".join(rng.choices(string.ascii_lowercase, k=rng.randint(low, high)))
+
+
+def build_config(rng, terms, links):
+    return {
+        "badword_rule": {"bad_words": [random_term(rng) for _ in range(terms)]},
+        "link_blocking_rule": {
+            "blocked_links": [f"{random_term(rng)}.{rng.choice(('com', 'gg', 'ly', 'xyz'))}" for _ in range(links)]
+        },
+        "mass_mention_rule": {"max_mentions": 5},
+        "caps_rule": {"max_caps_ratio": 0.7, "min_length": 10},
+        "attachment_rule": {"blocked_filetypes": [".exe", ".bat", ".js", ".scr", ".msi"]},
+        "spam_rule": {"spam_interval": 10, "spam_threshold": 5},
+    }
+
+
+class Corpus:
+    """A pool of message templates plus the parameters used to vary them."""
+
+    def __init__(self, rng, config, templates=20_000, hit_rate=0.02, mean_words=12,
+                 attachment_rate=0.05, users=50_000, guilds=50):
+        self.rng = rng
+        self.users = [DummyAuthor(id=i, name=f"user{i}") for i in range(users)]
+        self.guilds = [DummyGuild(id=i) for i in range(guilds)]
+        bad_words = config["badword_rule"]["bad_words"]
+        links = config["link_blocking_rule"]["blocked_links"]
+        self.templates = [
+            self._template(bad_words, links, hit_rate, mean_words, attachment_rate)
+            for _ in range(templates)
+        ]
+
+    def _template(self, bad_words, links, hit_rate, mean_words, attachment_rate):
+        rng = self.rng
+        # Chat message lengths are heavily right-skewed: mostly a few words,
+        # occasionally a wall of text.
+        length = max(1, min(400, int(rng.lognormvariate(0, 0.9) * mean_words / 1.5)))
+        words = rng.choices(WORDS, k=length)
+        roll = rng.random()
+        if roll < hit_rate:
+            words.insert(rng.randrange(len(words) + 1), rng.choice(bad_words))
+        elif roll < hit_rate * 2:
+            words.append(f"https://{rng.choice(links)}/{random_term(rng)}")
+        elif roll < hit_rate * 3:
+            words = [w.upper() for w in words]
+        content = " ".join(words)
+
+        mentions = []
+        n_mentions = min(int(rng.expovariate(2.0)), 20)
+        if n_mentions:
+            mentions = rng.sample(self.users[:1000], n_mentions)
+
+        attachments = []
+        if rng.random() < attachment_rate:
+            ext = rng.choice((".exe", ".js")) if rng.random() < hit_rate * 5 else rng.choice(SAFE_EXTENSIONS)
+            attachments = [DummyAttachment(filename=random_term(rng) + ext)]
+        return content, attachments, mentions
+
+    def messages(self, count):
+        rng = self.rng
+        templates, users, guilds = self.templates, self.users, self.guilds
+        for _ in range(count):
+            content, attachments, mentions = rng.choice(templates)
+            yield DummyMessage(content, rng.choice(users), attachments=attachments, mentions=mentions,
+                               guild=rng.choice(guilds))
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))
+    return sorted_values[index]
+
+
+def max_rss_kb():
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is reported in bytes on macOS and kilobytes elsewhere.
+    return rss // 1024 if sys.platform == "darwin" else rss
+
+
+def run(args, out):
+    rng = random.Random(args.seed)
+    config = build_config(rng, args.terms, args.links)
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        yaml.safe_dump(config, f)
+        config_path = f.name
+    try:
+        started = time.perf_counter()
+        automod = Automoderator(config_path)
+        compile_s = time.perf_counter() - started
+    finally:
+        os.remove(config_path)
+
+    corpus = Corpus(rng, config, templates=args.templates, hit_rate=args.hit_rate,
+                    users=args.users, guilds=args.guilds)
+    out(f"terms={args.terms} links={args.links} messages={args.messages} users={args.users}")
+    out(f"config compile: {compile_s * 1000:.1f} ms")
+
+    if args.tracemalloc:
+        tracemalloc.start()
+    gc.collect()
+    rss_start = max_rss_kb()
+    traced_start = tracemalloc.get_traced_memory()[0] if args.tracemalloc else 0
+
+    # Whole-pipeline throughput, timed around evaluate() only.
+    evaluate = automod.evaluate
+    perf = time.perf_counter_ns
+    latencies = []
+    sample_every = max(1, args.messages // 200_000)
+    verdicts = {}
+    checkpoint = max(1, args.messages // 10)
+    total_ns = 0
+    for i, message in enumerate(corpus.messages(args.messages), 1):
+        t0 = perf()
+        rule = evaluate(message)
+        elapsed = perf() - t0
+        total_ns += elapsed
+        if i % sample_every == 0:
+            latencies.append(elapsed)
+        if rule is not None:
+            verdicts[rule.name] = verdicts.get(rule.name, 0) + 1
+        if i % checkpoint == 0:
+            traced = tracemalloc.get_traced_memory()[0] - traced_start if args.tracemalloc else 0
+            out(f"  {i:>10} msgs  rss +{max_rss_kb() - rss_start:>7} KiB"
+                f"  traced +{traced // 1024:>7} KiB  tracked keys {len(automod.spam_tracker)}")
+
+    latencies.sort()
+    out(f"throughput: {args.messages / (total_ns / 1e9):,.0f} msg/s")
+    out(f"evaluate latency: p50 {percentile(latencies, 50) / 1000:.1f} us"
+        f"  p99 {percentile(latencies, 99) / 1000:.1f} us")
+    out(f"verdicts: {verdicts}")
+
+    # Per-rule cost: run every rule on a sample of messages, regardless of
+    # whether an earlier rule already matched.
+    # Lazily computed features are charged to the first rule that needs them.
+    per_rule = {"(features)": [], **{rule.name: [] for rule in automod.plan.rules}}
+    for message in corpus.messages(min(args.messages, args.rule_sample)):
+        t0 = perf()
+        features = MessageFeatures.of(message)
+        per_rule["(features)"].append(perf() - t0)
+        for rule in automod.plan.rules:
+            t0 = perf()
+            rule.check(automod, message, features)
+            per_rule[rule.name].append(perf() - t0)
+    out("per-rule latency (us):")
+    for name, samples in per_rule.items():
+        samples.sort()
+        out(f"  {name:<20} p50 {percentile(samples, 50) / 1000:>8.2f}  p99 {percentile(samples, 99) / 1000:>8.2f}")
+
+    if args.tracemalloc:
+        tracemalloc.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200_000)
+    parser.add_argument("--terms", type=int, default=1_000, help="bad word list size (up to 50k)")
+    parser.add_argument("--links", type=int, default=500, help="blocked link list size")
+    parser.add_argument("--templates", type=int, default=20_000, help="distinct message bodies")
+    parser.add_argument("--users", type=int, default=50_000)
+    parser.add_argument("--guilds", type=int, default=50)
+    parser.add_argument("--hit-rate", type=float, default=0.02, help="share of messages seeded with a violation")
+    parser.add_argument("--rule-sample", type=int, default=50_000, help="messages used for per-rule timing")
+    parser.add_argument("--tracemalloc", action="store_true", help="track Python allocations (slower)")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="also append the report to this file")
+    args = parser.parse_args(argv)
+
+    lines = []
+
+    def out(line):
+        print(line, flush=True)
+        lines.append(line)
+
+    run(args, out)
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write("\n".join(lines) + "\n")
+
+
+if __name__ == "__main__":
+    main()
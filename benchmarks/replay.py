@@ -0,0 +1,490 @@
+"""Replay recorded gateway traffic into the cogs to load test them offline.
+
+Feeds a recording made with ``RECORD_EVENTS`` (see
+``src/utils/event_recorder.py``), or a synthetic one, into ``AutoModCog``
+and ``JoinRoleManager`` at N times real-time speed. The cogs run
+unmodified. Discord is replaced by ``FakeDiscord``, which adds a
+configurable latency to every API call and enforces per-route and global
+rate limits the way Discord does: a request over the limit gets a 429
+and waits out ``retry_after``, as discord.py's HTTP client would.
+
+Reports how fast events were dispatched and how long the cogs then took
+to finish the work they queued, event-loop lag, handler latency, the time
+from a message arriving to its deletion and from a join to its role, and
+how many requests were rate limited. Latencies are kept as raw samples, so
+percentiles stay exact when a raid pushes them to minutes. Run from the repository root:
+
+    python -m benchmarks.replay synth data/raid.jsonl.gz --messages 50000 --joins 1000
+    python -m benchmarks.replay run data/raid.jsonl.gz --speed 10 --latency-ms 80
+"""
+import argparse
+import asyncio
+from collections import defaultdict
+from datetime import datetime, timezone
+import logging
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+
+from src.utils.event_recorder import read_events, write_events
+
+# (requests, per seconds) for each route, per channel or guild like Discord's buckets.
+ROUTE_LIMITS = {
+    "delete_message": (5, 1.0),
+    "bulk_delete": (1, 1.0),
+    "send_message": (5, 5.0),
+    "add_role": (10, 10.0),
+    "kick": (5, 5.0),
+    "ban": (5, 5.0),
+}
+GLOBAL_LIMIT = (50, 1.0)
+
+
+class _Bucket:
+    __slots__ = ("limit", "per", "remaining", "reset_at")
+
+    def __init__(self, limit, per):
+        self.limit = limit
+        self.per = per
+        self.remaining = limit
+        self.reset_at = 0.0
+
+    def acquire(self, now):
+        """Take a request slot; returns 0 or the seconds to wait before retrying."""
+        if now >= self.reset_at:
+            self.remaining = self.limit
+            self.reset_at = now + self.per
+        if self.remaining > 0:
+            self.remaining -= 1
+            return 0.0
+        return self.reset_at - now
+
+
+class FakeDiscord:
+    """Stands in for Discord's REST API: latency plus rate limits."""
+
+    def __init__(self, latency_ms=80.0, jitter_ms=40.0, route_limits=ROUTE_LIMITS, global_limit=GLOBAL_LIMIT,
+                 seed=0):
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.route_limits = route_limits
+        self.global_bucket = _Bucket(*global_limit)
+        self._buckets = {}
+        self._rng = random.Random(seed)
+        self.requests = defaultdict(int)
+        self.rate_limited = 0
+        self.in_flight = 0
+
+    async def request(self, route, major_id):
+        self.in_flight += 1
+        try:
+            await self._request(route, major_id)
+        finally:
+            self.in_flight -= 1
+
+    async def _request(self, route, major_id):
+        while True:
+            now = time.monotonic()
+            bucket = self._buckets.get((route, major_id))
+            if bucket is None:
+                bucket = self._buckets[(route, major_id)] = _Bucket(*self.route_limits[route])
+            retry_after = bucket.acquire(now) or self.global_bucket.acquire(now)
+            if not retry_after:
+                break
+            self.rate_limited += 1
+            await asyncio.sleep(retry_after)
+        self.requests[route] += 1
+        await asyncio.sleep(max(0.0, self._rng.gauss(self.latency, self.jitter)))
+
+
+class FakeRole:
+    def __init__(self, id, name):
+        self.id = id
+        self.name = name
+
+
+class FakeChannel:
+    def __init__(self, id, guild, api):
+        self.id = id
+        self.guild = guild
+        self.api = api
+        self.sent = 0
+
+    async def delete_messages(self, messages):
+        await self.api.request("bulk_delete", self.id)
+        for message in messages:
+            message.deleted()
+
+    async def send(self, content, delete_after=None):
+        await self.api.request("send_message", self.id)
+        self.sent += 1
+
+
+class FakeGuild:
+    def __init__(self, id, api):
+        self.id = id
+        self.name = f"guild{id}"
+        self.api = api
+        self.roles = [FakeRole(id, "Member")]
+        self.channels = {}
+        self.public_updates_channel = self.channel(id)
+
+    def channel(self, channel_id):
+        channel = self.channels.get(channel_id)
+        if channel is None:
+            channel = self.channels[channel_id] = FakeChannel(channel_id, self, self.api)
+        return channel
+
+    def get_channel(self, channel_id):
+        return self.channels.get(channel_id)
+
+    def get_role(self, role_id):
+        return next((role for role in self.roles if role.id == role_id), None)
+
+
+class FakeUser:
+    __slots__ = ("id", "name", "mention", "bot")
+
+    def __init__(self, id, bot=False):
+        self.id = id
+        self.name = f"user{id}"
+        self.mention = f"<@{id}>"
+        self.bot = bot
+
+
+class FakeMessage:
+    def __init__(self, event, guild, channel, author, stats):
+        self.id = event["id"]
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.content = event["content"]
+        self.mentions = [FakeUser(user_id) for user_id in event["mentions"]]
+        self.attachments = [
+            SimpleNamespace(filename=name, size=size, url=f"https://cdn.invalid/{self.id}/{name}")
+            for name, size in event["attachments"]
+        ]
+        self.created_at = datetime.now(timezone.utc)
+        self._received = time.monotonic()
+        self._stats = stats
+
+    async def delete(self):
+        await self.channel.api.request("delete_message", self.channel.id)
+        self.deleted()
+
+    def deleted(self):
+        self._stats.deleted += 1
+        self._stats.delete_latency.observe(time.monotonic() - self._received)
+
+
+class FakeMember:
+    def __init__(self, event, guild, stats):
+        self.id = event["id"]
+        self.name = event["name"]
+        self.mention = f"<@{self.id}>"
+        self.guild = guild
+        self.bot = event["bot"]
+        self.pending = event["pending"]
+        self.avatar = "avatar" if event["avatar"] else None
+        self.created_at = datetime.fromtimestamp(event["created"], timezone.utc)
+        self._received = time.monotonic()
+        self._stats = stats
+
+    async def add_roles(self, *roles, reason=None):
+        await self.guild.api.request("add_role", self.guild.id)
+        self._stats.roles_given += 1
+        self._stats.role_latency.observe(time.monotonic() - self._received)
+
+    async def kick(self, reason=None):
+        await self.guild.api.request("kick", self.guild.id)
+
+
+class Samples:
+    """Raw measurements, so percentiles are exact however long the tail."""
+
+    def __init__(self):
+        self.values = []
+
+    def observe(self, value):
+        self.values.append(value)
+
+    def quantile(self, q):
+        if not self.values:
+            return 0.0
+        values = sorted(self.values)
+        return values[min(len(values) - 1, int(len(values) * q))]
+
+    def ms(self, q):
+        return round(self.quantile(q) * 1000, 2)
+
+
+class ReplayBot:
+    """Just enough of commands.Bot for the cogs: event dispatch to listeners."""
+
+    def __init__(self):
+        self.cogs = []
+        self._tasks = set()
+        # How long each listener took to handle an event.
+        self.handler_latency = Samples()
+
+    def dispatch(self, event, *args):
+        for cog in self.cogs:
+            for name, listener in cog.get_listeners():
+                if name == f"on_{event}":
+                    task = asyncio.get_running_loop().create_task(self._handle(listener, args))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+    def get_cog(self, name):
+        return next((cog for cog in self.cogs if cog.qualified_name == name), None)
+
+    async def _handle(self, listener, args):
+        started = time.perf_counter()
+        await listener(*args)
+        self.handler_latency.observe(time.perf_counter() - started)
+
+    async def idle(self):
+        while self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up a task sleeping ``interval`` seconds."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.lag = Samples()
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            expected = time.monotonic() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, time.monotonic() - expected)
+            self.lag.observe(lag)
+
+    def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+
+
+class Stats:
+    def __init__(self):
+        self.deleted = 0
+        self.roles_given = 0
+        self.delete_latency = Samples()
+        self.role_latency = Samples()
+
+
+def _prepare_environment(workdir, config_path):
+    # The cogs read their storage locations from the environment when they
+    # are imported; keep the replay's databases away from the real ones.
+    os.environ["AUTOMOD_CONFIG_DB"] = os.path.join(workdir, "automod_config.db")
+    os.environ["AUTOMOD_LOG_DB"] = os.path.join(workdir, "modlog.db")
+    os.environ["JOIN_ROLES_DB"] = os.path.join(workdir, "join_roles.db")
+    os.environ["AUTOMOD_CONFIG_POLL_INTERVAL"] = "0"
+    os.environ.pop("AUTOMOD_METRICS_PORT", None)
+    os.environ.pop("AUTOMOD_METRICS_LOG_INTERVAL", None)
+    if config_path:
+        os.environ["AUTOMOD_CONFIG_FILE"] = os.path.abspath(config_path)
+
+
+async def replay(events, api, speed=1.0, config_path=None):
+    """Play ``events`` into fresh cogs and return the report as a dict.
+
+    ``speed`` multiplies real time (10 plays a minute of traffic in six
+    seconds); 0 dispatches every event as fast as possible.
+    """
+    workdir = tempfile.mkdtemp(prefix="replay-")
+    _prepare_environment(workdir, config_path)
+    from src.automoderation import AutoModCog
+    from src.join_roles import JoinRoleManager
+
+    bot = ReplayBot()
+    automod_cog = AutoModCog(bot)
+    join_cog = JoinRoleManager(bot)
+    bot.cogs = [automod_cog, join_cog]
+    for cog in bot.cogs:
+        await cog.cog_load()
+
+    stats = Stats()
+    guilds = {}
+    users = {}
+    counts = defaultdict(int)
+    monitor = LoopLagMonitor()
+    monitor.start()
+
+    def guild_for(guild_id):
+        guild = guilds.get(guild_id)
+        if guild is None:
+            guild = guilds[guild_id] = FakeGuild(guild_id, api)
+        return guild
+
+    def message_for(event):
+        guild = guild_for(event["guild"])
+        author = users.get(event["author"])
+        if author is None:
+            author = users[event["author"]] = FakeUser(event["author"], event["bot"])
+        return FakeMessage(event, guild, guild.channel(event["channel"]), author, stats)
+
+    started = time.monotonic()
+    for event in events:
+        if speed > 0:
+            delay = started + event["t"] / speed - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        else:
+            # Still let the loop breathe, like a gateway read would.
+            await asyncio.sleep(0)
+        kind = event["type"]
+        counts[kind] += 1
+        if kind == "message":
+            bot.dispatch("message", message_for(event))
+        elif kind == "edit":
+            message = message_for(event)
+            bot.dispatch("raw_message_edit", SimpleNamespace(message=message, cached_message=None))
+        elif kind == "join":
+            bot.dispatch("member_join", FakeMember(event, guild_for(event["guild"]), stats))
+    dispatched = time.monotonic()
+
+    # Drain: handlers, queued role assignments, then deletions and
+    # warnings until nothing is queued or on the wire twice in a row.
+    await bot.idle()
+    await join_cog.pipeline.join()
+    idle_polls = 0
+    while idle_polls < 2:
+        await asyncio.sleep(0.01)
+        busy = automod_cog.automod.actions.depth or api.in_flight
+        idle_polls = 0 if busy else idle_polls + 1
+    finished = time.monotonic()
+    monitor.stop()
+    for cog in bot.cogs:
+        await cog.cog_unload()
+
+    total = sum(counts.values())
+    return {
+        "events": dict(counts),
+        "replay_seconds": round(dispatched - started, 3),
+        "dispatch_events_per_s": round(total / max(dispatched - started, 1e-9), 1),
+        "drain_seconds": round(finished - dispatched, 3),
+        "handler_p50_ms": bot.handler_latency.ms(0.5),
+        "handler_p99_ms": bot.handler_latency.ms(0.99),
+        "loop_lag_p50_ms": monitor.lag.ms(0.5),
+        "loop_lag_p99_ms": monitor.lag.ms(0.99),
+        "loop_lag_max_ms": monitor.lag.ms(1.0),
+        "messages_deleted": stats.deleted,
+        "delete_p50_ms": stats.delete_latency.ms(0.5),
+        "delete_p99_ms": stats.delete_latency.ms(0.99),
+        "delete_max_ms": stats.delete_latency.ms(1.0),
+        "roles_given": stats.roles_given,
+        "role_p50_ms": stats.role_latency.ms(0.5),
+        "role_p99_ms": stats.role_latency.ms(0.99),
+        "role_max_ms": stats.role_latency.ms(1.0),
+        "raid_held": sum(join_cog.pipeline.status(guild_id)["held"] for guild_id in guilds),
+        "api_requests": dict(api.requests),
+        "rate_limited": api.rate_limited,
+    }
+
+
+def synthesize(messages=10_000, joins=200, duration=60.0, guilds=5, channels=10, users=5_000,
+               raid_at=0.5, raid_share=0.5, hit_rate=0.02, seed=1234):
+    """Build a synthetic recording: steady chatter, then a raid.
+
+    From ``raid_at`` (a fraction of ``duration``) ``raid_share`` of the
+    joins arrive within a few seconds in the first guild, from new
+    accounts without avatars that then spam the same message.
+    """
+    rng = random.Random(seed)
+    words = "the and you that was for are with they this have from one had what all were when your can".split()
+    ids = iter(range(10**17, 10**18))
+    now = time.time()
+    events = []
+    raid_start = duration * raid_at
+    raid_joins = int(joins * raid_share)
+    raiders = []
+    guild_ids = [next(ids) for _ in range(guilds)]
+    channel_ids = {guild: [next(ids) for _ in range(channels)] for guild in guild_ids}
+    user_ids = [next(ids) for _ in range(users)]
+
+    for _ in range(joins - raid_joins):
+        events.append(_join(rng, next(ids), rng.choice(guild_ids), rng.uniform(0, duration), now, age_days=400))
+    for _ in range(raid_joins):
+        member_id = next(ids)
+        raiders.append(member_id)
+        events.append(_join(rng, member_id, guild_ids[0], raid_start + rng.uniform(0, 5), now, age_days=0,
+                            avatar=False))
+
+    spam = "join my server discord.gg/" + "".join(rng.choices(string.ascii_lowercase, k=8))
+    for _ in range(messages):
+        t = rng.uniform(0, duration)
+        if raiders and t > raid_start + 1 and rng.random() < 0.3:
+            guild, author, content = guild_ids[0], rng.choice(raiders), spam
+        else:
+            guild, author = rng.choice(guild_ids), rng.choice(user_ids)
+            content = " ".join(rng.choices(words, k=max(1, int(rng.lognormvariate(1.8, 0.8)))))
+            if rng.random() < hit_rate:
+                content = content.upper()
+        events.append({
+            "type": "message", "t": round(t, 4), "id": next(ids), "guild": guild,
+            "channel": rng.choice(channel_ids[guild]), "author": author, "bot": False,
+            "content": content, "mentions": [], "attachments": [],
+        })
+    events.sort(key=lambda event: event["t"])
+    return events
+
+
+def _join(rng, member_id, guild, t, now, age_days, avatar=True):
+    return {
+        "type": "join", "t": round(t, 4), "guild": guild, "id": member_id, "name": f"user{member_id % 100000}",
+        "created": now - age_days * 86400 - rng.uniform(0, 86400), "avatar": avatar, "bot": False,
+        "pending": False,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    synth = commands.add_parser("synth", help="write a synthetic recording")
+    synth.add_argument("output")
+    synth.add_argument("--messages", type=int, default=10_000)
+    synth.add_argument("--joins", type=int, default=200)
+    synth.add_argument("--duration", type=float, default=60.0, help="seconds of traffic")
+    synth.add_argument("--guilds", type=int, default=5)
+    synth.add_argument("--raid-share", type=float, default=0.5, help="share of joins that are a raid")
+    synth.add_argument("--seed", type=int, default=1234)
+
+    run = commands.add_parser("run", help="replay a recording into the cogs")
+    run.add_argument("recording")
+    run.add_argument("--speed", type=float, default=1.0, help="times real time; 0 for as fast as possible")
+    run.add_argument("--latency-ms", type=float, default=80.0, help="mean Discord API latency")
+    run.add_argument("--jitter-ms", type=float, default=40.0)
+    run.add_argument("--config", help="automod config file (defaults to config/automod_config.yaml)")
+    args = parser.parse_args(argv)
+
+    if args.command == "synth":
+        events = synthesize(args.messages, args.joins, args.duration, args.guilds,
+                            raid_share=args.raid_share, seed=args.seed)
+        write_events(args.output, events)
+        print(f"Wrote {len(events)} events to {args.output}")
+        return
+
+    # The cogs log every action they take; keep the report readable.
+    logging.disable(logging.INFO)
+    events = list(read_events(args.recording))
+    api = FakeDiscord(args.latency_ms, args.jitter_ms)
+    report = asyncio.run(replay(events, api, args.speed, args.config))
+    width = max(map(len, report))
+    for key, value in report.items():
+        print(f"{key:<{width}}  {value}", file=sys.stdout)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,190 @@
+import asyncio
 import discord
-from discord.ext import commands
+from discord.ext import commands, tasks
 from discord import app_commands
+import json
+import logging
 import os
-import yaml
+import time
 
+from .attachments import AttachmentInspector
 from .automod import Automoderator
+from .config_store import ConfigStore
+from .counters import SharedCounter, open_backend
+from .metrics import start_metrics_server
+from .modlog import ModLog
+from .offload import ProcessOffload
+from .verdicts import VerdictCache
+from .watcher import ConfigWatcher
+
+logger = logging.getLogger(__name__)
 
 # Define the path to the YAML config file.
-CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "..", "config", "automod_config.yaml")
+CONFIG_FILE = os.getenv("AUTOMOD_CONFIG_FILE") or os.path.join(os.path.dirname(__file__), "..", "..", "config", "automod_config.yaml")
+# Versioned copy of the config shared with the web panel; the YAML file is synced into it.
+CONFIG_DB = os.getenv("AUTOMOD_CONFIG_DB") or os.path.join(os.path.dirname(__file__), "..", "..", "data", "automod_config.db")
+# Moderation event log, also read by the web panel.
+MODLOG_DB = os.getenv("AUTOMOD_LOG_DB") or os.path.join(os.path.dirname(__file__), "..", "..", "data", "modlog.db")
+
+# How often /scan_channel updates its progress message, in seconds.
+SCAN_PROGRESS_INTERVAL = 3
+# Flagged messages linked in the /scan_channel summary.
+SCAN_REPORT_LINKS = 10
 
 class AutoModCog(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         # Initialize the Automoderator with the config file path.
-        self.automod = Automoderator(CONFIG_FILE)
+        self.automod = Automoderator(CONFIG_FILE, config_store=ConfigStore(CONFIG_DB))
+        retention_days = float(os.getenv("AUTOMOD_LOG_RETENTION_DAYS") or 0)
+        self.modlog = ModLog(MODLOG_DB, retention_days=retention_days or None)
+        self.automod.actions.modlog = self.modlog
+        self.automod.metrics.add_gauge("modlog_buffered", lambda: len(self.modlog))
+        self.automod.metrics.add_gauge("modlog_dropped", lambda: self.modlog.dropped)
+        # Metrics are only collected when they are exported somewhere.
+        self.metrics_port = int(os.getenv("AUTOMOD_METRICS_PORT") or 0)
+        self.metrics_log_interval = float(os.getenv("AUTOMOD_METRICS_LOG_INTERVAL") or 0)
+        self.automod.metrics.enabled = bool(self.metrics_port or self.metrics_log_interval)
+        self._metrics_runner = None
+        # Poll the config files for edits (e.g. from the web panel); 0 disables.
+        poll_interval = float(os.getenv("AUTOMOD_CONFIG_POLL_INTERVAL") or 2)
+        self.watcher = ConfigWatcher(self.automod, interval=poll_interval) if poll_interval > 0 else None
+        # Reads the first bytes of attachments for attachment rules with inspect set.
+        self.automod.inspector = AttachmentInspector(
+            concurrency=int(os.getenv("AUTOMOD_ATTACHMENT_CONCURRENCY") or 8),
+            timeout=float(os.getenv("AUTOMOD_ATTACHMENT_TIMEOUT") or 5),
+        )
+        self.automod.metrics.add_gauge("attachment_fetches", lambda: self.automod.inspector.fetches)
+        self.automod.metrics.add_gauge("attachment_fetch_failures", lambda: self.automod.inspector.failures)
+        # Verdicts remembered for repeated content; 0 disables the cache.
+        verdict_cache_size = int(os.getenv("AUTOMOD_VERDICT_CACHE_SIZE") or 10_000)
+        self.automod.verdict_cache = VerdictCache(verdict_cache_size) if verdict_cache_size > 0 else None
+        counter_url = os.getenv("AUTOMOD_COUNTER_BACKEND")
+        if counter_url:
+            self.automod.shared_counter = SharedCounter(open_backend(counter_url))
+        # Worker processes for word list and link checks on long messages; 0 keeps them in-process.
+        workers = int(os.getenv("AUTOMOD_WORKERS") or 0)
+        if workers > 0:
+            self.automod.offload = ProcessOffload(
+                workers=workers,
+                min_length=int(os.getenv("AUTOMOD_OFFLOAD_MIN_LENGTH") or 200),
+                timeout=float(os.getenv("AUTOMOD_OFFLOAD_TIMEOUT") or 2),
+            )
+            self.automod.metrics.add_gauge("offload_timeouts", lambda: self.automod.offload.timeouts)
+
+    async def cog_load(self):
+        self.modlog.start()
+        if self.watcher is not None:
+            self.watcher.start()
+        if self.automod.shared_counter is not None:
+            self.automod.shared_counter.start()
+        if self.automod.offload is not None:
+            self.automod.offload.start()
+        if self.metrics_port:
+            host = os.getenv("AUTOMOD_METRICS_HOST", "127.0.0.1")
+            self._metrics_runner = await start_metrics_server(self.automod.metrics, host, self.metrics_port)
+        if self.metrics_log_interval:
+            self.log_metrics.change_interval(seconds=self.metrics_log_interval)
+            self.log_metrics.start()
+
+    async def cog_unload(self):
+        if self.watcher is not None:
+            await self.watcher.stop()
+        if self.automod.shared_counter is not None:
+            await self.automod.shared_counter.close()
+        self.log_metrics.cancel()
+        if self._metrics_runner is not None:
+            await self._metrics_runner.cleanup()
+        await self.automod.actions.close()
+        await self.modlog.close()
+        await self.automod.inspector.close()
+        if self.automod.offload is not None:
+            self.automod.offload.close()
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
         if message.author.bot:
             return
+        metrics = self.automod.metrics
+        if not metrics.enabled:
+            await self.automod.check_message(message)
+            return
+        started = time.perf_counter()
         await self.automod.check_message(message)
+        metrics.handler_latency.observe(time.perf_counter() - started)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # The raw event also covers messages that are no longer cached.
+        message = payload.message
+        if message.author.bot:
+            return
+        before = payload.cached_message
+        if (before is not None and before.content == message.content
+                and len(before.attachments) == len(message.attachments)):
+            # Embeds being unfurled, pins and the like.
+            return
+        # Edits don't count towards the spam and duplicate rules; unchanged
+        # or repeated content is answered from the verdict cache.
+        await self.automod.check_message(message, edited=True)
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        # Judge the join by the guild's own raid settings, not the default's.
+        await self.automod.guild_configs.get_plan(member.guild.id)
+        report = self.automod.check_join(member)
+        if report is None:
+            return
+        logger.warning(f"Raid detected in guild {member.guild.id}: {report.describe()}")
+        # Lets other cogs react, e.g. JoinRoleManager pauses auto-roles.
+        self.bot.dispatch("raid_detected", member.guild, report)
+        await self.automod.send_mod_alert(member.guild, report.describe())
+
+    @tasks.loop(seconds=60)
+    async def log_metrics(self):
+        logger.info(json.dumps({"event": "automod_metrics", **self.automod.metrics.snapshot()}))
 
     # Optional: a slash command to reload configuration.
     @app_commands.command(name="reload_automod", description="Reload automoderation configuration")
     async def reload_automod(self, interaction: discord.Interaction):
-        self.automod.load_config()
-        await interaction.response.send_message("Automoderation config reloaded.", ephemeral=True)
+        if await self.automod.reload_config():
+            await interaction.response.send_message("Automoderation config reloaded.", ephemeral=True)
+        else:
+            await interaction.response.send_message("Config is invalid; keeping the previous rules.", ephemeral=True)
+
+    @app_commands.command(name="scan_channel", description="Check a channel's message history against the current rules")
+    @app_commands.default_permissions(manage_messages=True)
+    async def scan_channel(self, interaction: discord.Interaction, channel: discord.TextChannel,
+                           limit: app_commands.Range[int, 1, 100_000] = 1000):
+        """Report past messages that break the current rules; nothing is deleted"""
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        scanned = 0
+        counts = {}
+        links = []
+        last_report = time.monotonic()
+        try:
+            async for message, rule in self.automod.scan_async(channel.history(limit=limit)):
+                scanned += 1
+                if rule is not None and not message.author.bot:
+                    counts[rule.name] = counts.get(rule.name, 0) + 1
+                    if len(links) < SCAN_REPORT_LINKS:
+                        links.append(message.jump_url)
+                if time.monotonic() - last_report >= SCAN_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    await interaction.edit_original_response(
+                        content=f"Scanned {scanned}/{limit} messages in {channel.mention}; "
+                                f"{sum(counts.values())} flagged so far..."
+                    )
+        except discord.Forbidden:
+            await interaction.edit_original_response(content=f"I can't read the history of {channel.mention}.")
+            return
+
+        lines = [f"Scanned {scanned} messages in {channel.mention}; {sum(counts.values())} break the current rules."]
+        lines += [f"**{name}:** {count}" for name, count in sorted(counts.items())]
+        lines += links
+        await interaction.edit_original_response(content="\n".join(lines))
 
-def setup(bot):
-    bot.add_cog(AutoModCog(bot))
\ No newline at end of file
+async def setup(bot):
+    # Building the cog reads the config and compiles the rules; do it off the
+    # event loop so other extensions can load meanwhile.
+    await bot.add_cog(await asyncio.to_thread(AutoModCog, bot))
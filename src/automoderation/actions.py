@@ -0,0 +1,286 @@
+"""Asynchronous enforcement of automod verdicts.
+
+Detection only records what has to happen; ``ModerationQueue`` performs the
+REST calls in the background. Work is coalesced per channel: messages
+removed from the same channel within one flush go out as a single bulk
+delete, and each user gets at most one warning per channel per
+``warn_window`` seconds however many of their messages tripped a rule.
+Channels are flushed concurrently, but calls for one channel (which share
+Discord's per-route rate limit bucket) are kept serial.
+
+Warnings are sent by a separate task per channel, outside the delete lock,
+so a raid's next bulk delete never waits behind warnings (message sends
+are limited to 5 per 5 seconds per channel). Users waiting to be warned
+in a channel are mentioned together in one message.
+
+When a ``ModLog`` is attached, every action is recorded once its outcome
+is known, with the time it took from detection.
+"""
+import asyncio
+import logging
+import time
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Discord refuses bulk deletes of more than 100 messages per call.
+BULK_DELETE_LIMIT = 100
+# Discord refuses messages longer than this.
+MESSAGE_LIMIT = 2000
+
+
+def _warning_messages(users):
+    """Combine ``(mention, warnings)`` pairs into as few messages as fit.
+
+    Users given the same warnings share one line.
+    """
+    by_text = {}
+    for mention, warnings in users:
+        by_text.setdefault(" ".join(warnings), []).append(mention)
+    lines = []
+    for text, mentions in by_text.items():
+        suffix = f", {text}"
+        line = mentions[0]
+        for mention in mentions[1:]:
+            if len(line) + 1 + len(mention) + len(suffix) > MESSAGE_LIMIT:
+                lines.append(line + suffix)
+                line = mention
+            else:
+                line = f"{line} {mention}"
+        lines.append(line + suffix)
+    message = ""
+    for line in lines:
+        if message and len(message) + 1 + len(line) > MESSAGE_LIMIT:
+            yield message
+            message = line
+        else:
+            message = f"{message}\n{line}" if message else line
+    if message:
+        yield message
+
+
+class _ChannelBatch:
+    __slots__ = ("channel", "messages", "warnings")
+
+    def __init__(self, channel):
+        self.channel = channel
+        self.messages = {}
+        self.warnings = {}
+
+
+class _ChannelWarnings:
+    __slots__ = ("channel", "users", "task")
+
+    def __init__(self, channel):
+        self.channel = channel
+        # user id -> (mention, warnings) still to be sent.
+        self.users = {}
+        self.task = None
+
+
+class _ChannelLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Flushes holding or waiting for the lock; it is dropped at zero.
+        self.users = 0
+
+
+class ModerationQueue:
+    def __init__(self, flush_delay=0.5, warn_window=10, max_concurrency=5, max_pending=5000, metrics=None,
+                 modlog=None):
+        self.flush_delay = flush_delay
+        self.metrics = metrics
+        self.modlog = modlog
+        self.warn_window = warn_window
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending = {}
+        self._pending_count = 0
+        self._warned = {}
+        self._channel_locks = {}
+        self._warnings = {}
+        self._wakeup = asyncio.Event()
+        self._task = None
+        # The flush _run is performing, so close() can wait for it.
+        self._flushing = None
+
+    @property
+    def depth(self):
+        """Number of messages waiting to be deleted."""
+        return self._pending_count
+
+    def enqueue(self, message, rule, term=None):
+        """Schedule deletion of ``message`` and a warning for its author.
+
+        ``term`` is the word or link that matched, if any, for the log.
+        Never waits on the network; must be called from the event loop.
+        """
+        if self._pending_count >= self.max_pending:
+            logger.warning(f"Moderation queue full; dropping action for message {message.id}")
+            self._log(message, rule, term, "dropped")
+            return False
+
+        channel = message.channel
+        batch = self._pending.get(channel.id)
+        if batch is None:
+            batch = self._pending[channel.id] = _ChannelBatch(channel)
+        if message.id not in batch.messages:
+            batch.messages[message.id] = (message, time.monotonic(), rule, term)
+            self._pending_count += 1
+
+        author = message.author
+        if not self._recently_warned(channel.id, author.id):
+            mention, warnings = batch.warnings.setdefault(author.id, (author.mention, []))
+            if rule.warning not in warnings:
+                warnings.append(rule.warning)
+
+        self._ensure_worker()
+        self._wakeup.set()
+        return True
+
+    def _log(self, message, rule, term, action, enqueued_at=None):
+        if self.modlog is None:
+            return
+        guild = getattr(message, "guild", None)
+        latency = (time.monotonic() - enqueued_at) * 1000 if enqueued_at is not None else None
+        self.modlog.record(
+            guild.id if guild is not None else None, message.channel.id, message.author.id, message.id,
+            rule.name, action, term=term, latency_ms=latency,
+        )
+
+    def _recently_warned(self, channel_id, user_id):
+        warned_at = self._warned.get((channel_id, user_id))
+        return warned_at is not None and time.monotonic() - warned_at < self.warn_window
+
+    def _ensure_worker(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await self._wakeup.wait()
+            # Give a burst a moment to accumulate so it can be coalesced.
+            await asyncio.sleep(self.flush_delay)
+            # Shielded so that cancelling _run never abandons a half-sent
+            # batch; close() waits for it instead.
+            self._flushing = asyncio.ensure_future(self.flush())
+            try:
+                await asyncio.shield(self._flushing)
+            finally:
+                if self._flushing.done():
+                    self._flushing = None
+
+    async def flush(self):
+        """Perform all pending actions now."""
+        self._wakeup.clear()
+        batches, self._pending = self._pending, {}
+        self._pending_count = 0
+        self._prune_warned()
+        if batches:
+            await asyncio.gather(*(self._flush_channel(batch) for batch in batches.values()))
+
+    def _prune_warned(self):
+        cutoff = time.monotonic() - self.warn_window
+        for key in [k for k, t in self._warned.items() if t < cutoff]:
+            del self._warned[key]
+
+    async def _flush_channel(self, batch):
+        channel_id = batch.channel.id
+        entry = self._channel_locks.get(channel_id)
+        if entry is None:
+            entry = self._channel_locks[channel_id] = _ChannelLock()
+        entry.users += 1
+        try:
+            async with self._semaphore, entry.lock:
+                await self._perform(batch)
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._channel_locks[channel_id]
+        self._queue_warnings(batch)
+
+    async def _perform(self, batch):
+        try:
+            await self._delete(batch.channel, [entry[0] for entry in batch.messages.values()])
+        except Exception as e:
+            logger.error(f"Failed to delete messages in channel {batch.channel.id}: {e}")
+            for message, enqueued_at, rule, term in batch.messages.values():
+                self._log(message, rule, term, "delete_failed", enqueued_at)
+        else:
+            for message, enqueued_at, rule, term in batch.messages.values():
+                if self.metrics is not None:
+                    self.metrics.observe_action(enqueued_at, getattr(message, "created_at", None))
+                self._log(message, rule, term, "delete", enqueued_at)
+
+    def _queue_warnings(self, batch):
+        channel_id = batch.channel.id
+        now = time.monotonic()
+        pending = None
+        for user_id, (mention, warnings) in batch.warnings.items():
+            if self._recently_warned(channel_id, user_id):
+                continue
+            self._warned[(channel_id, user_id)] = now
+            if pending is None:
+                pending = self._warnings.get(channel_id)
+                if pending is None:
+                    pending = self._warnings[channel_id] = _ChannelWarnings(batch.channel)
+            pending.users[user_id] = (mention, warnings)
+        if pending is not None and pending.task is None:
+            pending.task = asyncio.get_running_loop().create_task(self._send_warnings(channel_id, pending))
+
+    async def _send_warnings(self, channel_id, pending):
+        # Users queued while a send waits on the rate limit go out together
+        # in the next message.
+        try:
+            while pending.users:
+                users, pending.users = pending.users, {}
+                for content in _warning_messages(users.values()):
+                    try:
+                        await pending.channel.send(content, delete_after=5)
+                    except Exception as e:
+                        logger.error(f"Failed to warn users in channel {channel_id}: {e}")
+        finally:
+            del self._warnings[channel_id]
+
+    async def _delete(self, channel, messages):
+        if len(messages) > 1 and hasattr(channel, "delete_messages"):
+            for start in range(0, len(messages), BULK_DELETE_LIMIT):
+                chunk = messages[start:start + BULK_DELETE_LIMIT]
+                try:
+                    await channel.delete_messages(chunk)
+                    continue
+                except discord.NotFound:
+                    pass
+                except discord.HTTPException as e:
+                    # Bulk delete rejects messages older than 14 days; fall
+                    # back to deleting those one at a time.
+                    logger.debug(f"Bulk delete failed, deleting individually: {e}")
+                await self._delete_each(chunk)
+        else:
+            await self._delete_each(messages)
+
+    async def _delete_each(self, messages):
+        for message in messages:
+            try:
+                await message.delete()
+            except discord.NotFound:
+                pass
+
+    async def close(self):
+        """Flush anything still pending and stop the background worker."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self._flushing is not None:
+            await self._flushing
+            self._flushing = None
+        await self.flush()
+        if self._warnings:
+            await asyncio.gather(*(pending.task for pending in list(self._warnings.values())))
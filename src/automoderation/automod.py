@@ -1,25 +1,21 @@
+import asyncio
+from collections import OrderedDict, namedtuple
 import discord
-from discord.ext import commands
-from datetime import datetime, timedelta
-from collections import defaultdict, deque
 import os
 import yaml
 import logging
-
-# Settings for moderation filters
-BAD_WORDS = {"badword1", "badword2"}
-BLOCKED_LINKS = {"discord.gg", "bit.ly"}
-MAX_MENTIONS = 5
-MAX_CAPS_RATIO = 0.7
-BLOCKED_FILETYPES = {".exe", ".bat", ".js"}
-
-# Spam detection settings
-SPAM_INTERVAL = 10  # seconds window
-SPAM_THRESHOLD = 5  # messages allowed in SPAM_INTERVAL
-
-# Anti-raid settings
-JOIN_TIME_FRAME = 10  # seconds window for join tracking
-JOIN_THRESHOLD = 5    # number of joins allowed in JOIN_TIME_FRAME
+import time
+
+from .actions import ModerationQueue
+from .features import MessageFeatures
+from .fingerprint import DuplicateIndex
+from .guild_config import GuildConfigStore
+from .metrics import AutomodMetrics
+from .offload import FAILED
+from .raid import RaidDetector
+from .ratelimit import SpamTracker
+from .rules import RulePlan, compile_rules, recompile
+from .verdicts import MISS, VerdictCache
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -28,251 +24,412 @@ formatter = logging.Formatter('%(asctime)s - %(levelname)s - %(message)s')
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-class Automoderator:
-    def __init__(self, config_path):
-        self.config_path = config_path
-        self.config = {}
-        # Tracking recent messages per user for spam detection
-        self.spam_logs = defaultdict(deque)
-        self.load_config()
+# Result of a batch scan: the message and the first rule it violates, if any.
+Verdict = namedtuple("Verdict", ["message", "rule"])
 
-    def load_config(self):
-        try:
-            with open(self.config_path, 'r') as f:
-                self.config = yaml.safe_load(f) or {}
-            logger.info("Automod rules loaded from config.")
-        except Exception as e:
-            logger.error(f"Failed to load automod config: {e}")
-            self.config = {}
+# Messages evaluated together by scan() and scan_async().
+SCAN_CHUNK_SIZE = 200
 
-    async def send_mod_alert(self, guild: discord.Guild, message: str):
-        if self.mod_channel_id:
-            channel = guild.get_channel(self.mod_channel_id)
-            if channel:
-                await channel.send(message)
-
-    @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.author.bot:
-            return
-
-        content = message.content
-        now = datetime.utcnow()
+# Recent messages whose MessageFeatures are kept for reuse by other listeners.
+FEATURE_CACHE_SIZE = 256
 
-        # --- Bad Words Filter ---
-        for word in BAD_WORDS:
-            if word in content.lower():
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, please refrain from using inappropriate language.", delete_after=5)
-                return
-
-        # --- Link Blocking ---
-        if any(link in content for link in BLOCKED_LINKS):
-            await message.delete()
-            await message.channel.send(f"{message.author.mention}, posting that kind of link is not allowed.", delete_after=5)
-            return
-
-        # --- Mass Mention Protection ---
-        if len(message.mentions) > MAX_MENTIONS:
-            await message.delete()
-            await message.channel.send(f"{message.author.mention}, you mentioned too many people at once.", delete_after=5)
-            return
-
-        # --- Caps Lock Filter ---
-        if len(content) > 10:
-            caps_count = sum(1 for c in content if c.isupper())
-            if (caps_count / len(content)) > MAX_CAPS_RATIO:
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, please avoid excessive use of caps.", delete_after=5)
-                return
-
-        # --- Attachment/File Type Filter ---
-        for attachment in message.attachments:
-            if any(attachment.filename.lower().endswith(ft) for ft in BLOCKED_FILETYPES):
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, that file type is not allowed.", delete_after=5)
-                return
-
-        # --- Spam Detection ---
-        user_log = self.spam_logs[message.author.id]
-        user_log.append(now)
-        # Remove messages older than SPAM_INTERVAL
-        while user_log and (now - user_log[0]).total_seconds() > SPAM_INTERVAL:
-            user_log.popleft()
-        if len(user_log) >= SPAM_THRESHOLD:
-            await message.delete()
-            await message.channel.send(f"{message.author.mention}, you're sending messages too quickly. Please slow down.", delete_after=5)
-            # Optionally, add further actions like temporary mute here.
-            return
-
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
-        now = datetime.utcnow()
-        guild = member.guild
-        join_deque = self.join_times[guild.id]
-        join_deque.append(now)
-        # Remove join entries older than JOIN_TIME_FRAME seconds
-        while join_deque and (now - join_deque[0]).total_seconds() > JOIN_TIME_FRAME:
-            join_deque.popleft()
-        if len(join_deque) > JOIN_THRESHOLD:
-            # Detected potential raid activity.
-            alert = f"Raid alert: More than {JOIN_THRESHOLD} members have joined within {JOIN_TIME_FRAME} seconds."
-            await self.send_mod_alert(guild, alert)
-
-    # --- Slash Command for Automoderation Status ---
-    # This uses discord.app_commands which is integrated in discord.py 2.0+
-    @discord.app_commands.command(name="automod_status", description="Shows current automoderation settings")
-    async def automod_status(self, interaction: discord.Interaction):
-        settings = (
-            f"**Bad Words:** {', '.join(BAD_WORDS)}\n"
-            f"**Blocked Links:** {', '.join(BLOCKED_LINKS)}\n"
-            f"**Max Mentions:** {MAX_MENTIONS}\n"
-            f"**Max Caps Ratio:** {MAX_CAPS_RATIO}\n"
-            f"**Blocked Filetypes:** {', '.join(BLOCKED_FILETYPES)}\n"
-            f"**Spam Settings:** Max {SPAM_THRESHOLD} messages every {SPAM_INTERVAL} seconds\n"
-            f"**Anti-Raid:** More than {JOIN_THRESHOLD} joins in {JOIN_TIME_FRAME} seconds triggers an alert."
-        )
-        await interaction.response.send_message(settings, ephemeral=True)
-
-    # To register the slash command, add this to the Cog's setup
-    async def cog_load(self):
-        self.bot.tree.add_command(self.automod_status)
+def _stateless(rules):
+    return [rule for rule in rules if not getattr(rule, "stateful", False)]
 
 class Automoderator:
-    def __init__(self, config_path):
+    def __init__(self, config_path, guild_config_dir=None, config_store=None):
         self.config_path = config_path
+        # Optional ConfigStore holding the versioned default config; the
+        # config file is then synced into it rather than read directly.
+        self.config_store = config_store
+        self.config_version = 0
         self.config = {}
-        self.spam_logs = {}
+        self.plan = RulePlan()
+        if guild_config_dir is None:
+            guild_config_dir = os.path.join(os.path.dirname(config_path), "guilds")
+        self.guild_configs = GuildConfigStore(guild_config_dir)
+        self.spam_tracker = SpamTracker()
+        # Optional SharedCounter so spam is counted across shards/processes.
+        self.shared_counter = None
+        # Optional ProcessOffload that runs text-only rules in worker processes.
+        self.offload = None
+        self.duplicate_index = DuplicateIndex()
+        self._features = OrderedDict()
+        # Optional AttachmentInspector for attachment rules with ``inspect`` set.
+        self.inspector = None
+        # Optional VerdictCache so repeated content skips the content rules.
+        self.verdict_cache = VerdictCache()
+        self.raid_detector = RaidDetector()
+        self.metrics = AutomodMetrics()
+        self.actions = ModerationQueue(metrics=self.metrics)
+        self.metrics.add_gauge("queue_depth", lambda: self.actions.depth)
+        self.metrics.add_gauge("spam_tracked_keys", lambda: len(self.spam_tracker))
+        self.metrics.add_gauge("duplicate_clusters", lambda: len(self.duplicate_index))
+        self.metrics.add_gauge("cached_guild_plans", lambda: len(self.guild_configs))
+        self.metrics.add_gauge("verdict_cache_entries", lambda: len(self.verdict_cache or ()))
+        self.metrics.add_gauge(
+            "verdict_cache_hit_rate", lambda: round(self.verdict_cache.hit_rate, 4) if self.verdict_cache else 0.0
+        )
         self.load_config()
 
+    def read_config(self):
+        """Read and compile the config without applying it.
+
+        Returns ``(config, plan, version)``; version is None without a
+        config store. Blocking; safe to call from a worker thread. Raises
+        on a missing, unparsable or invalid config; with a config store a
+        broken config file is logged and the store's newest version used.
+        """
+        store = self.config_store
+        if store is None:
+            with open(self.config_path, "r") as f:
+                config = yaml.safe_load(f) or {}
+            return config, compile_rules(config), None
+        try:
+            store.sync_file(self.config_path, validate=compile_rules)
+        except Exception as e:
+            # A broken file must not hide what the web panel committed.
+            logger.warning(f"Failed to sync {self.config_path} into the config store: {e}")
+        version, config = store.current()
+        if self.config_version and version >= self.config_version:
+            # Only recompile the sections committed since the running plan.
+            changed = store.changed_rules(self.config_version, version)
+            return config, recompile(self.plan, config, changed), version
+        return config, compile_rules(config), version
+
+    def apply_config(self, config, plan, version=None):
+        """Swap in a compiled plan. Must be called on the event loop thread.
+
+        The plan is built completely before it replaces the old one, so a
+        message being checked always sees either the old or the new rules.
+        """
+        if version is not None:
+            # A reload that raced a newer one must not roll the plan back.
+            if version <= self.config_version:
+                return
+            self.config_version = version
+        self.config, self.plan = config, plan
+        self.guild_configs.set_default(config, plan)
+        if self.verdict_cache is not None:
+            # Verdicts are per plan; drop them rather than keep old plans alive.
+            self.verdict_cache.clear()
+        spam_rule = plan.get("spam_rule")
+        if spam_rule is not None:
+            self.spam_tracker.max_entries = spam_rule.max_tracked
+        duplicate_rule = plan.get("duplicate_rule")
+        if duplicate_rule is not None:
+            self.duplicate_index.max_entries = duplicate_rule.max_tracked
+        suffix = f", version {version}" if version is not None else ""
+        logger.info(f"Automod rules loaded from config ({len(plan.rules)} active{suffix}).")
+
     def load_config(self):
+        """Reload the config, keeping the previous plan if the new one is broken."""
         try:
-            with open(self.config_path, "r") as f:
-                self.config = yaml.safe_load(f) or {}
-            logger.info("Automod rules loaded from config.")
+            config, plan, version = self.read_config()
         except Exception as e:
             logger.error(f"Failed to load automod config: {e}")
-            self.config = {}
+            return False
+        self.apply_config(config, plan, version)
+        return True
 
-    def check_message(self, message):
-        content = message.content.lower()
+    async def reload_config(self):
+        """Like load_config, but reads and compiles in a worker thread."""
+        try:
+            config, plan, version = await asyncio.to_thread(self.read_config)
+        except Exception as e:
+            logger.error(f"Failed to load automod config: {e}")
+            return False
+        self.apply_config(config, plan, version)
+        return True
 
+    async def reload_guild(self, guild_id):
+        """Recompile one guild's plan in a worker thread if it is cached."""
+        if not self.guild_configs.is_cached(guild_id):
+            return
+        generation = self.guild_configs.generation
         try:
-            if self.config.get("badword_rule"):
-                bad_words = set(self.config["badword_rule"].get("bad_words", []))
-                if any(word in content for word in bad_words):
-                    self.handle_warning(message.author, "Bad Word")
-                    return
-
-            if self.config.get("link_blocking_rule"):
-                blocked_links = set(self.config["link_blocking_rule"].get("blocked_links", []))
-                if any(link in content for link in blocked_links):
-                    self.handle_warning(message.author, "Blocked Link")
-                    return
-
-            if self.config.get("mass_mention_rule"):
-                max_mentions = self.config["mass_mention_rule"].get("max_mentions", 5)
-                if len(message.mentions) > max_mentions:
-                    self.handle_warning(message.author, "Mass Mention")
-                    return
-
-            if self.config.get("caps_rule"):
-                max_caps_ratio = self.config["caps_rule"].get("max_caps_ratio", 0.7)
-                min_length = self.config["caps_rule"].get("min_length", 10)
-                if len(content) >= min_length:
-                    caps_count = sum(1 for c in message.content if c.isupper())
-                    if len(message.content) and (caps_count / len(message.content)) > max_caps_ratio:
-                        self.handle_warning(message.author, "Excessive Caps")
-                        return
-
-            if self.config.get("attachment_rule"):
-                blocked_filetypes = set(self.config["attachment_rule"].get("blocked_filetypes", []))
-                for attachment in message.attachments:
-                    if any(attachment.filename.lower().endswith(ft.lower()) for ft in blocked_filetypes):
-                        self.handle_warning(message.author, "Blocked Filetype")
-                        return
-
-            if self.config.get("spam_rule"):
-                spam_interval = self.config["spam_rule"].get("spam_interval", 10)
-                spam_threshold = self.config["spam_rule"].get("spam_threshold", 5)
-                now = datetime.utcnow()
-                user_id = message.author.id
-                if user_id not in self.spam_logs:
-                    self.spam_logs[user_id] = deque()
-                logs = self.spam_logs[user_id]
-                logs.append(now)
-                while logs and (now - logs[0]).total_seconds() > spam_interval:
-                    logs.popleft()
-                if len(logs) >= spam_threshold:
-                    self.handle_warning(message.author, "Spam")
-                    return
-        except Exception as ex:
-            logger.exception(f"Error while checking message: {ex}")
+            plan = await asyncio.to_thread(self.guild_configs.compile, guild_id)
+        except Exception as e:
+            logger.error(f"Failed to reload automod config for guild {guild_id}: {e}")
+            return
+        self.guild_configs.replace(guild_id, plan, generation)
+        if self.verdict_cache is not None:
+            self.verdict_cache.clear()
+
+    def plan_for(self, message):
+        """Return the rule plan for the guild the message was sent in."""
+        guild = getattr(message, "guild", None)
+        return self.guild_configs.get(guild.id if guild is not None else None)
+
+    async def plan_for_async(self, message):
+        """Like plan_for, but waits for a guild's plan the first time it is seen."""
+        guild = getattr(message, "guild", None)
+        return await self.guild_configs.get_plan(guild.id if guild is not None else None)
+
+    def features(self, message):
+        """Return the MessageFeatures of a message.
+
+        The features of recent messages are kept, so other cogs handling
+        the same message get them without extracting them again. An
+        edited message (same id, new content or fewer attachments) is extracted
+        afresh.
+        """
+        message_id = getattr(message, "id", None)
+        if message_id is None:
+            return MessageFeatures.of(message)
+        cache = self._features
+        features = cache.get(message_id)
+        if (features is not None and features.content == message.content
+                and len(features.filenames) == len(message.attachments)):
+            cache.move_to_end(message_id)
+            return features
+        features = cache[message_id] = MessageFeatures.of(message)
+        if len(cache) > FEATURE_CACHE_SIZE:
+            cache.popitem(last=False)
+        return features
+
+    def evaluate(self, message, stateful=True):
+        """Return the first rule the message violates, or None.
+
+        ``stateful=False`` skips the rules that count messages (spam,
+        duplicates), for re-checking a message that was edited.
+        """
+        features = self.features(message)
+        plan = self.plan_for(message)
+        cache = self.verdict_cache
+        if cache is not None:
+            cached = cache.get(plan, features)
+            if cached is not MISS:
+                return self._evaluate_cached(plan, message, features, cached, stateful)
+        rules = plan.rules if stateful else _stateless(plan.rules)
+        if self.metrics.enabled:
+            rule = self._evaluate_instrumented(rules, message, features)
+        else:
+            rule = next((rule for rule in rules if rule.check(self, message, features)), None)
+        if cache is not None:
+            self._remember(plan, features, rule)
+        return rule
+
+    async def evaluate_async(self, message, stateful=True):
+        """Like evaluate, but runs text-only rules in the offload pool when
+        one is configured and the message is long enough to be worth it."""
+        # Once the plan is loaded evaluate() finds it in the cache.
+        plan = await self.plan_for_async(message)
+        offload = self.offload
+        if offload is None:
+            return self.evaluate(message, stateful)
+        features = self.features(message)
+        if not offload.wants(plan, features.text):
+            return self.evaluate(message, stateful)
+        cache = self.verdict_cache
+        if cache is not None:
+            cached = cache.get(plan, features)
+            if cached is not MISS:
+                return self._evaluate_cached(plan, message, features, cached, stateful)
+        if self.metrics.enabled:
+            self.metrics.messages += 1
+        offloaded = await offload.first_match(plan, features.text)
+        failed = offloaded is FAILED
+        rule = None
+        for candidate in plan.rules if stateful else _stateless(plan.rules):
+            if getattr(candidate, "offload", False):
+                # After a failure the offloaded rules are skipped: running
+                # them here would put the slow input on the event loop.
+                if candidate.name == offloaded:
+                    rule = candidate
+                    break
+            elif candidate.check(self, message, features):
+                rule = candidate
+                break
+        # Nothing is cached after a failure, so the next copy is checked again.
+        if cache is not None and not failed:
+            self._remember(plan, features, rule)
+        return rule
+
+    def _evaluate_cached(self, plan, message, features, cached, stateful):
+        # The content rules already ran on this content; only the rules that
+        # keep state between messages have to see it again.
+        if self.metrics.enabled:
+            self.metrics.messages += 1
+        for rule in plan.rules:
+            if getattr(rule, "stateful", False):
+                if stateful and rule.check(self, message, features):
+                    return rule
+            elif rule.name == cached:
+                return rule
+        return None
+
+    def _remember(self, plan, features, rule):
+        # A stateful match means the content rules after it were never run,
+        # so there is no verdict to keep.
+        if rule is None:
+            self.verdict_cache.put(plan, features, None)
+        elif not getattr(rule, "stateful", False):
+            self.verdict_cache.put(plan, features, rule.name)
+
+    def _evaluate_instrumented(self, rules, message, features):
+        metrics = self.metrics
+        metrics.messages += 1
+        perf = time.perf_counter_ns
+        for rule in rules:
+            stats = metrics.rule(rule.name)
+            start = perf()
+            matched = rule.check(self, message, features)
+            stats.time_ns += perf() - start
+            stats.evaluations += 1
+            if matched:
+                stats.matches += 1
+                return rule
+        return None
+
+    def evaluate_batch(self, messages):
+        """Evaluate a list of messages without side effects.
+
+        Returns the first violated rule (or None) for each message. Each
+        rule looks at the whole batch at once, and rules that depend on
+        message history (spam, duplicates) are skipped, so nothing is
+        recorded and the result only depends on the messages themselves.
+        """
+        verdicts = [None] * len(messages)
+        features = [MessageFeatures.of(m) for m in messages]
+        by_plan = {}
+        for i, message in enumerate(messages):
+            plan = self.plan_for(message)
+            by_plan.setdefault(id(plan), (plan, []))[1].append(i)
+        for plan, pending in by_plan.values():
+            for rule in plan.rules:
+                if not pending:
+                    break
+                if getattr(rule, "stateful", False):
+                    continue
+                batch = [messages[i] for i in pending]
+                batch_features = [features[i] for i in pending]
+                if hasattr(rule, "check_batch"):
+                    hits = rule.check_batch(self, batch, batch_features)
+                else:
+                    hits = [rule.check(self, m, f) for m, f in zip(batch, batch_features)]
+                remaining = []
+                for i, hit in zip(pending, hits):
+                    if hit:
+                        verdicts[i] = rule
+                    else:
+                        remaining.append(i)
+                pending = remaining
+        return verdicts
+
+    def scan(self, messages, chunk_size=SCAN_CHUNK_SIZE):
+        """Yield a Verdict for every message in an iterable, in order."""
+        chunk = []
+        for message in messages:
+            chunk.append(message)
+            if len(chunk) >= chunk_size:
+                yield from map(Verdict, chunk, self.evaluate_batch(chunk))
+                chunk = []
+        if chunk:
+            yield from map(Verdict, chunk, self.evaluate_batch(chunk))
+
+    async def scan_async(self, messages, chunk_size=SCAN_CHUNK_SIZE):
+        """Like scan(), for an async iterable such as ``channel.history()``."""
+        chunk = []
+        async for message in messages:
+            chunk.append(message)
+            if len(chunk) >= chunk_size:
+                await self._load_plans(chunk)
+                for verdict in map(Verdict, chunk, self.evaluate_batch(chunk)):
+                    yield verdict
+                chunk = []
+        if chunk:
+            await self._load_plans(chunk)
+            for verdict in map(Verdict, chunk, self.evaluate_batch(chunk)):
+                yield verdict
+
+    async def _load_plans(self, messages):
+        """Make sure the plans evaluate_batch will ask for are cached."""
+        guild_ids = {getattr(getattr(m, "guild", None), "id", None) for m in messages}
+        for guild_id in guild_ids:
+            await self.guild_configs.get_plan(guild_id)
+
+    def find_matches(self, message):
+        """Return every bad word and blocked link match in the message.
+
+        Each match carries its position in the normalized text and the name
+        of the rule whose list it came from.
+        """
+        features = self.features(message)
+        matches = []
+        for rule in self.plan_for(message).rules:
+            if hasattr(rule, "matches"):
+                matches.extend(rule.matches(features))
+        return matches
+
+    async def inspect_attachments(self, message):
+        """Return the attachment rule if an attachment's content is a blocked type.
+
+        Only runs when the guild's attachment rule has ``inspect`` set; the
+        attachments' names have already been checked by ``evaluate``.
+        """
+        if self.inspector is None or not message.attachments:
+            return None
+        rule = self.plan_for(message).get("attachment_rule")
+        if rule is None or not rule.inspect:
+            return None
+        kinds = await self.inspector.inspect_many(message.attachments)
+        return rule if any(rule.blocks_type(kind) for kind in kinds) else None
+
+    def check_join(self, member):
+        """Feed a member join to the raid detector.
+
+        Returns a RaidReport the first time a raid is detected in the
+        guild, otherwise None.
+        """
+        settings = self.guild_configs.get(member.guild.id).raid
+        if settings is None:
+            return None
+        burst_count = None
+        if self.shared_counter is not None:
+            window_ms = int(settings.join_window * 1000)
+            burst_count = self.shared_counter.add(("join", member.guild.id), window_ms)
+        return self.raid_detector.observe(member, settings, burst_count)
+
+    async def send_mod_alert(self, guild: discord.Guild, message: str):
+        """Post to the guild's configured mod channel, or its moderator updates channel."""
+        settings = self.guild_configs.get(guild.id).raid
+        channel = None
+        if settings is not None and settings.mod_channel_id:
+            channel = guild.get_channel(settings.mod_channel_id)
+        if channel is None:
+            channel = guild.public_updates_channel
+        if channel is None:
+            logger.warning(f"No mod channel for guild {guild.id}: {message}")
+            return
+        try:
+            await channel.send(message)
+        except discord.HTTPException as e:
+            logger.error(f"Failed to send mod alert to guild {guild.id}: {e}")
 
     def handle_warning(self, user, reason):
         logger.info(f"Issuing warning to {user} for {reason}.")
 
-    async def check_message(self, message):
+    async def check_message(self, message, edited=False):
         """Check a message against all automod rules"""
-        content = message.content.lower()
-
-        # Bad Words Check
-        if self.config.get("badword_rule"):
-            bad_words = set(self.config["badword_rule"].get("bad_words", []))
-            if any(word in content for word in bad_words):
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, watch your language!", delete_after=5)
-                return
-
-        # Link Blocking Check
-        if self.config.get("link_blocking_rule"):
-            blocked_links = set(self.config["link_blocking_rule"].get("blocked_links", []))
-            if any(link in content for link in blocked_links):
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, that kind of link is not allowed!", delete_after=5)
-                return
-
-        # Mass Mention Check
-        if self.config.get("mass_mention_rule"):
-            max_mentions = self.config["mass_mention_rule"].get("max_mentions", 5)
-            if len(message.mentions) > max_mentions:
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, too many mentions!", delete_after=5)
-                return
-
-        # Caps Check
-        if self.config.get("caps_rule"):
-            max_caps_ratio = self.config["caps_rule"].get("max_caps_ratio", 0.7)
-            min_length = self.config["caps_rule"].get("min_length", 10)
-            if len(message.content) >= min_length:
-                caps_count = sum(1 for c in message.content if c.isupper())
-                if caps_count / len(message.content) > max_caps_ratio:
-                    await message.delete()
-                    await message.channel.send(f"{message.author.mention}, please avoid excessive caps!", delete_after=5)
-                    return
-
-        # Attachment Check
-        if self.config.get("attachment_rule"):
-            blocked_filetypes = set(self.config["attachment_rule"].get("blocked_filetypes", []))
-            for attachment in message.attachments:
-                if any(attachment.filename.lower().endswith(ft) for ft in blocked_filetypes):
-                    await message.delete()
-                    await message.channel.send(f"{message.author.mention}, that file type is not allowed!", delete_after=5)
-                    return
-
-        # Spam Check
-        if self.config.get("spam_rule"):
-            spam_interval = self.config["spam_rule"].get("spam_interval", 10)
-            spam_threshold = self.config["spam_rule"].get("spam_threshold", 5)
-            
-            now = datetime.utcnow()
-            user_log = self.spam_logs[message.author.id]
-            user_log.append(now)
-            
-            while user_log and (now - user_log[0]).total_seconds() > spam_interval:
-                user_log.popleft()
-                
-            if len(user_log) >= spam_threshold:
-                await message.delete()
-                await message.channel.send(f"{message.author.mention}, you're sending messages too quickly!", delete_after=5)
-                return
\ No newline at end of file
+        try:
+            rule = await self.evaluate_async(message, stateful=not edited)
+            if rule is None:
+                rule = await self.inspect_attachments(message)
+        except Exception as ex:
+            logger.exception(f"Error while checking message: {ex}")
+            return None
+        if rule is None:
+            return None
+
+        self.handle_warning(message.author, rule.reason)
+        term = None
+        if self.actions.modlog is not None and hasattr(rule, "matches"):
+            # Re-scanning a message that already matched is cheap and rare.
+            matches = rule.matches(self.features(message))
+            term = matches[0].term if matches else None
+        # Deleting and warning happen in the background so the listener
+        # returns without waiting on Discord.
+        if self.actions.enqueue(message, rule, term) and self.metrics.enabled:
+            self.metrics.rule(rule.name).actions += 1
+        return rule
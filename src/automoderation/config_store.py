@@ -0,0 +1,210 @@
+"""Versioned automod config in SQLite.
+
+Every change is a commit: one row in ``commits`` saying who changed what
+and when, and one row in ``changes`` per rule section that changed,
+holding the section's full settings as JSON (NULL once it is removed).
+The current config is the latest change of every section, so editing one
+rule writes one row, and every earlier version can be rebuilt for review
+or rollback.
+
+Commits are single SQLite transactions, so a reader sees either all of a
+commit or none of it. Readers notice changes by polling ``version()``,
+the id of the newest commit, and ask ``changed_rules`` which sections to
+recompile.
+
+The YAML config file stays supported as an input: ``sync_file`` commits
+the sections that changed in the file since it was last synced.
+
+No discord imports here; the web panel uses this module too.
+"""
+from collections import namedtuple
+from contextlib import closing
+import json
+import os
+import sqlite3
+import time
+
+import yaml
+
+Commit = namedtuple("Commit", ["version", "author", "message", "created_at", "rules"])
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS commits ("
+    " version INTEGER PRIMARY KEY AUTOINCREMENT, author TEXT NOT NULL,"
+    " message TEXT NOT NULL DEFAULT '', created_at REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS changes ("
+    " version INTEGER NOT NULL REFERENCES commits (version), rule TEXT NOT NULL, settings TEXT,"
+    " PRIMARY KEY (rule, version))",
+    "CREATE INDEX IF NOT EXISTS changes_by_version ON changes (version)",
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)",
+)
+
+_LATEST = (
+    "SELECT rule, settings FROM changes c WHERE version ="
+    " (SELECT MAX(version) FROM changes WHERE rule = c.rule AND version <= ?)"
+)
+
+
+def _dump(settings):
+    return None if settings is None else json.dumps(settings, sort_keys=True)
+
+
+class ConfigStore:
+    def __init__(self, path):
+        self.path = path
+        self._initialized = False
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._initialized = True
+        return conn
+
+    def version(self):
+        """Id of the newest commit, 0 for an empty store."""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COALESCE(MAX(version), 0) FROM commits").fetchone()[0]
+
+    def _config_at(self, conn, version):
+        return {
+            rule: json.loads(settings)
+            for rule, settings in conn.execute(_LATEST, (version,))
+            if settings is not None
+        }
+
+    def current(self):
+        """Return ``(version, config)`` as of the newest commit."""
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN")
+            version = conn.execute("SELECT COALESCE(MAX(version), 0) FROM commits").fetchone()[0]
+            config = self._config_at(conn, version)
+            conn.execute("COMMIT")
+        return version, config
+
+    def config_at(self, version):
+        with closing(self._connect()) as conn:
+            return self._config_at(conn, version)
+
+    def changed_rules(self, since, until=None):
+        """Names of the sections changed after ``since`` (up to ``until``)."""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT DISTINCT rule FROM changes WHERE version > ? AND version <= ?",
+                (since, until if until is not None else 2 ** 63 - 1),
+            )
+            return {rule for rule, in rows}
+
+    def commit(self, changes, author, message="", validate=None):
+        """Record new settings for some sections in one transaction.
+
+        ``changes`` maps section names to their full new settings, or None
+        to remove the section. Sections equal to their current settings
+        are skipped; returns the new version, or None if nothing changed.
+        ``validate``, if given, is called with the resulting config before
+        anything is written and may raise to abort the commit.
+        """
+        with closing(self._connect()) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                current = conn.execute(
+                    "SELECT COALESCE(MAX(version), 0) FROM commits"
+                ).fetchone()[0]
+                config = self._config_at(conn, current)
+                rows = [
+                    (rule, _dump(settings)) for rule, settings in sorted(changes.items())
+                    if _dump(settings) != _dump(config.get(rule))
+                ]
+                if not rows:
+                    conn.execute("ROLLBACK")
+                    return None
+                if validate is not None:
+                    for rule, settings in rows:
+                        if settings is None:
+                            config.pop(rule, None)
+                        else:
+                            config[rule] = json.loads(settings)
+                    validate(config)
+                version = conn.execute(
+                    "INSERT INTO commits (author, message, created_at) VALUES (?, ?, ?)",
+                    (author, message, time.time()),
+                ).lastrowid
+                conn.executemany(
+                    "INSERT INTO changes (version, rule, settings) VALUES (?, ?, ?)",
+                    [(version, rule, settings) for rule, settings in rows],
+                )
+                conn.execute("COMMIT")
+            except BaseException:
+                if conn.in_transaction:
+                    conn.execute("ROLLBACK")
+                raise
+        return version
+
+    def replace(self, config, author, message="", validate=None):
+        """Commit whatever differs between the current config and ``config``."""
+        _, current = self.current()
+        changes = {rule: config.get(rule) for rule in set(current) | set(config)}
+        return self.commit(changes, author, message, validate)
+
+    def rollback(self, version, author, validate=None):
+        """Restore the config as of ``version`` with a new commit."""
+        return self.replace(self.config_at(version), author, f"Rolled back to version {version}", validate)
+
+    def history(self, limit=50):
+        """Newest commits first, with the sections each one changed."""
+        with closing(self._connect()) as conn:
+            commits = conn.execute(
+                "SELECT version, author, message, created_at FROM commits ORDER BY version DESC LIMIT ?",
+                (limit,),
+            ).fetchall()
+            if not commits:
+                return []
+            rules = {}
+            for version, rule in conn.execute(
+                "SELECT version, rule FROM changes WHERE version >= ? ORDER BY rule", (commits[-1][0],)
+            ):
+                rules.setdefault(version, []).append(rule)
+        return [Commit(*row, tuple(rules.get(row[0], ()))) for row in commits]
+
+    def sync_file(self, path, author="config file", validate=None):
+        """Commit the sections of a YAML config file that changed since the last sync.
+
+        An empty store takes the whole file. Afterwards only sections that
+        differ from the file's previous contents are committed, so edits
+        made through the store are not overwritten by a stale file.
+        Returns the new version, or None if nothing was committed.
+        """
+        try:
+            with open(path, "r") as f:
+                file_config = yaml.safe_load(f) or {}
+        except FileNotFoundError:
+            return None
+        if not isinstance(file_config, dict):
+            raise ValueError("automod config must be a mapping")
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'file_config'").fetchone()
+        previous = json.loads(row[0]) if row else None
+        if previous == json.loads(json.dumps(file_config)):
+            return None
+        name = os.path.basename(path)
+        if previous is None and self.version() == 0:
+            version = self.commit(file_config, author, f"Imported {name}", validate)
+        elif previous is None:
+            version = None
+        else:
+            changes = {
+                rule: file_config.get(rule) for rule in set(previous) | set(file_config)
+                if _dump(previous.get(rule)) != _dump(file_config.get(rule))
+            }
+            version = self.commit(changes, author, f"Edited {name}", validate)
+        with closing(self._connect()) as conn:
+            conn.execute(
+                "INSERT INTO meta (key, value) VALUES ('file_config', ?)"
+                " ON CONFLICT (key) DO UPDATE SET value = excluded.value",
+                (json.dumps(file_config),),
+            )
+        return version
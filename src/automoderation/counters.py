@@ -0,0 +1,232 @@
+"""Windowed counters that can be shared between bot processes or shards.
+
+``SharedCounter`` is what rules talk to. Counting a hit only touches a
+local dict; pending increments are pushed to a ``CounterBackend`` in one
+batch every ``flush_interval`` seconds from a worker thread, and the
+totals the backend returns (which include every other process's hits)
+are cached for the next lookups. Rate estimates use two fixed buckets per
+window weighted by how far into the current bucket we are, so each key
+costs two integers regardless of traffic.
+
+Backends:
+
+- ``MemoryCounterBackend``: in-process only, for single-process bots and tests.
+- ``SQLiteCounterBackend``: a WAL-mode SQLite file that every process on
+  the host opens, e.g. ``AUTOMOD_COUNTER_BACKEND=sqlite:///var/lib/bot/counters.db``.
+"""
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def wall_ms():
+    # Buckets must line up across processes, so they use wall-clock time.
+    return time.time_ns() // 1_000_000
+
+
+class CounterBackend:
+    """Stores counts per (name, bucket) pair."""
+
+    def exchange(self, increments, wanted, now_ms):
+        """Apply ``increments`` and return the current totals for ``wanted``.
+
+        Both are keyed by ``(name, bucket)``; ``increments`` maps to deltas.
+        Entries whose bucket ended before ``now_ms`` minus their window may be
+        discarded by the backend.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class MemoryCounterBackend(CounterBackend):
+    def __init__(self):
+        self._counts = {}
+        self._expires = {}
+
+    def exchange(self, increments, wanted, now_ms):
+        counts = self._counts
+        for key, delta in increments.items():
+            counts[key] = counts.get(key, 0) + delta
+            self._expires[key] = _expiry(key)
+        totals = {key: counts.get(key, 0) for key in wanted}
+        for key in [k for k, expires in self._expires.items() if expires < now_ms]:
+            del self._expires[key]
+            counts.pop(key, None)
+        return totals
+
+
+class SQLiteCounterBackend(CounterBackend):
+    PRUNE_EVERY = 100
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=5, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS counters ("
+            " name TEXT NOT NULL, bucket INTEGER NOT NULL, count INTEGER NOT NULL,"
+            " expires INTEGER NOT NULL, PRIMARY KEY (name, bucket)) WITHOUT ROWID"
+        )
+        self._exchanges = 0
+
+    def exchange(self, increments, wanted, now_ms):
+        with self._lock:
+            conn = self._conn
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.executemany(
+                    "INSERT INTO counters (name, bucket, count, expires) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (name, bucket) DO UPDATE SET count = count + excluded.count",
+                    [(name, bucket, delta, _expiry((name, bucket))) for (name, bucket), delta in increments.items()],
+                )
+                totals = {}
+                for name, bucket in wanted:
+                    row = conn.execute(
+                        "SELECT count FROM counters WHERE name = ? AND bucket = ?", (name, bucket)
+                    ).fetchone()
+                    totals[(name, bucket)] = row[0] if row else 0
+                self._exchanges += 1
+                if self._exchanges % self.PRUNE_EVERY == 0:
+                    conn.execute("DELETE FROM counters WHERE expires < ?", (now_ms,))
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+        return totals
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def _expiry(key):
+    # Names start with the window length, see SharedCounter.name_for. A bucket
+    # is still needed while it can be the "previous" bucket of a lookup.
+    name, bucket = key
+    window = int(name.split(":", 1)[0])
+    return (bucket + 2) * window
+
+
+def open_backend(url):
+    """Create a backend from a URL such as ``memory://`` or ``sqlite:///path``."""
+    if not url or url == "memory://":
+        return MemoryCounterBackend()
+    if url.startswith("sqlite:///"):
+        return SQLiteCounterBackend(url[len("sqlite:///"):])
+    raise ValueError(f"unsupported counter backend {url!r}")
+
+
+class SharedCounter:
+    def __init__(self, backend, flush_interval=0.25, clock=wall_ms):
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self._pending = {}
+        self._inflight = {}
+        self._totals = {}
+        self._task = None
+
+    @staticmethod
+    def name_for(key, window_ms):
+        return f"{window_ms}:" + ":".join("" if part is None else str(part) for part in key)
+
+    def hit(self, key, window_ms, threshold):
+        """Count one event for ``key`` and return True if the estimated rate
+        across all processes reaches ``threshold`` per ``window_ms``."""
+        return self.add(key, window_ms) >= threshold
+
+    def add(self, key, window_ms, amount=1):
+        """Count ``amount`` events and return the estimated total in the window."""
+        now = self.clock()
+        name = self.name_for(key, window_ms)
+        bucket, offset = divmod(now, window_ms)
+        current = (name, bucket)
+        self._pending[current] = self._pending.get(current, 0) + amount
+        previous = (name, bucket - 1)
+        weight = 1 - offset / window_ms
+        return self._count(current) + self._count(previous) * weight
+
+    def _count(self, key):
+        return self._totals.get(key, 0) + self._inflight.get(key, 0) + self._pending.get(key, 0)
+
+    def flush_sync(self):
+        """Push pending increments and refresh totals. Blocking."""
+        increments, wanted, now = self._begin_flush()
+        if not increments:
+            return
+        try:
+            totals = self.backend.exchange(increments, wanted, now)
+        except Exception:
+            self._restore(increments)
+            raise
+        finally:
+            self._inflight = {}
+        self._apply(totals, now)
+
+    async def flush(self):
+        """Like flush_sync, but talks to the backend from a worker thread.
+
+        Only the backend call leaves the event loop; the local dicts are
+        touched on the loop thread alone.
+        """
+        increments, wanted, now = self._begin_flush()
+        if not increments:
+            return
+        try:
+            totals = await asyncio.to_thread(self.backend.exchange, increments, wanted, now)
+        except Exception:
+            self._restore(increments)
+            raise
+        finally:
+            self._inflight = {}
+        self._apply(totals, now)
+
+    def _begin_flush(self):
+        increments, self._pending = self._pending, {}
+        self._inflight = increments
+        wanted = set(increments)
+        wanted.update((name, bucket - 1) for name, bucket in increments)
+        return increments, wanted, self.clock()
+
+    def _restore(self, increments):
+        # Put the increments back so they are retried on the next flush.
+        for key, delta in increments.items():
+            self._pending[key] = self._pending.get(key, 0) + delta
+
+    def _apply(self, totals, now):
+        self._totals.update(totals)
+        for key in [k for k in self._totals if _expiry(k) < now]:
+            del self._totals[key]
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Failed to flush shared counters: {e}")
+
+    async def close(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        try:
+            await self.flush()
+        finally:
+            self.backend.close()
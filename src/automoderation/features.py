@@ -0,0 +1,102 @@
+"""What the rules look at in a message, extracted once.
+
+Every rule used to derive its own view of the message: the lowered
+content, a count of uppercase characters, the links, the attachment
+names. ``MessageFeatures`` computes each of these at most once per
+message and shares it between all rules (and anything else that wants
+it, see ``Automoderator.features``), so adding a rule no longer adds
+another pass over the text.
+
+Counts that only some rules need (case, emoji, links, normalized text)
+are computed the first time they are asked for and then kept, so a
+config that doesn't use them doesn't pay for them.
+"""
+import hashlib
+import re
+
+from .links import extract_links
+
+# Custom Discord emoji (<:name:id>, <a:name:id>) and the common Unicode emoji blocks.
+_EMOJI = re.compile(r"<a?:\w{2,32}:\d{15,25}>|[\u2600-\u27bf\U0001f000-\U0001faff]")
+
+
+class MessageFeatures:
+    __slots__ = (
+        "content", "text", "mentions", "filenames",
+        "_uppercase", "_letters", "_emojis", "_links", "_normalized", "_digest",
+    )
+
+    def __init__(self, content, mentions=0, filenames=()):
+        self.content = content
+        # Lowered content; what the word, link and duplicate rules match against.
+        self.text = content.lower()
+        self.mentions = mentions
+        # Lowered attachment filenames.
+        self.filenames = filenames
+        self._uppercase = None
+        self._letters = None
+        self._emojis = None
+        self._links = None
+        self._normalized = None
+        self._digest = None
+
+    @classmethod
+    def of(cls, message):
+        attachments = message.attachments
+        filenames = tuple([a.filename.lower() for a in attachments]) if attachments else ()
+        return cls(message.content, len(message.mentions), filenames)
+
+    def __len__(self):
+        return len(self.content)
+
+    @property
+    def uppercase(self):
+        """Number of uppercase characters in the original content."""
+        if self._uppercase is None:
+            self._uppercase = sum(map(str.isupper, self.content))
+        return self._uppercase
+
+    @property
+    def letters(self):
+        if self._letters is None:
+            self._letters = sum(map(str.isalpha, self.content))
+        return self._letters
+
+    @property
+    def emojis(self):
+        if self._emojis is None:
+            self._emojis = len(_EMOJI.findall(self.content))
+        return self._emojis
+
+    @property
+    def links(self):
+        """Every Link in the lowered text."""
+        if self._links is None:
+            self._links = tuple(extract_links(self.text))
+        return self._links
+
+    @property
+    def digest(self):
+        """Hash of the exact content, used to recognize repeated messages."""
+        if self._digest is None:
+            self._digest = hashlib.blake2b(
+                self.content.encode("utf-8", "surrogatepass"), digest_size=16
+            ).digest()
+        return self._digest
+
+    @property
+    def extensions(self):
+        """Extension of each attachment, including the dot ("" if it has none)."""
+        return tuple(name[name.rfind("."):] if "." in name else "" for name in self.filenames)
+
+    def normalized(self, normalizer):
+        """The text as folded by ``normalizer``, computed once per normalizer."""
+        cache = self._normalized
+        if cache is None:
+            text = normalizer(self.text)
+            self._normalized = {normalizer: text}
+            return text
+        text = cache.get(normalizer)
+        if text is None:
+            text = cache[normalizer] = normalizer(self.text)
+        return text
@@ -0,0 +1,158 @@
+"""Content fingerprints for catching copy-paste floods.
+
+Each message is reduced to a normalized word list. Identical messages are
+grouped by a hash of that list; near-identical ones (a word changed, an
+emoji added) by a 64-bit SimHash, looked up through four 16-bit bands so
+that any two fingerprints within 3 bits of each other share a band. Both
+lookups are dict hits, so the cost per message does not depend on how
+many messages are indexed.
+
+The index is capped at ``max_entries`` clusters and forgets a cluster
+once it has been quiet for longer than the window.
+"""
+from collections import OrderedDict
+import time
+
+from .matcher import Normalizer
+
+BANDS = 4
+BAND_BITS = 64 // BANDS
+# SimHash counts each bit column in an 8-bit field, so at most 255 features.
+MAX_FEATURES = 255
+
+_normalize = Normalizer(confusables=True, leetspeak=True)
+
+# _SPREAD[b] places the 8 bits of byte b into the low bit of 8 separate
+# bytes, so adding spread values counts every bit column at once.
+_SPREAD = tuple(
+    sum(((b >> bit) & 1) << (8 * bit) for bit in range(8))
+    for b in range(256)
+)
+
+
+def words_of(text):
+    """Normalize text to a list of lowercase alphanumeric words."""
+    text = _normalize(text)
+    return "".join(ch if ch.isalnum() else " " for ch in text).split()
+
+
+def simhash(words):
+    """64-bit SimHash over word unigrams and bigrams."""
+    features = words + [a + " " + b for a, b in zip(words, words[1:])]
+    features = features[:MAX_FEATURES]
+    if not features:
+        return 0
+    spread = _SPREAD
+    # c<k> counts bits 8k..8k+7 of every feature hash, one byte per bit.
+    c0 = c1 = c2 = c3 = c4 = c5 = c6 = c7 = 0
+    for feature in features:
+        b0, b1, b2, b3, b4, b5, b6, b7 = hash(feature).to_bytes(8, "little", signed=True)
+        c0 += spread[b0]; c1 += spread[b1]; c2 += spread[b2]; c3 += spread[b3]
+        c4 += spread[b4]; c5 += spread[b5]; c6 += spread[b6]; c7 += spread[b7]
+    counts = b"".join(c.to_bytes(8, "little") for c in (c0, c1, c2, c3, c4, c5, c6, c7))
+    # The SimHash bit is set where a majority of features have it set.
+    total = len(features)
+    result = 0
+    for i, count in enumerate(counts):
+        if count * 2 > total:
+            result |= 1 << i
+    return result
+
+
+class _Cluster:
+    __slots__ = ("simhash", "bands", "window_start", "last_seen", "posters")
+
+    def __init__(self, fingerprint, bands, now):
+        self.simhash = fingerprint
+        self.bands = bands
+        self.window_start = now
+        self.last_seen = now
+        self.posters = set()
+
+
+class DuplicateIndex:
+    def __init__(self, max_entries=50_000, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._clusters = OrderedDict()
+        self._exact = {}
+        self._bands = {}
+
+    def __len__(self):
+        return len(self._clusters)
+
+    def observe(self, scope, poster, text, window, max_distance=3, cap=None):
+        """Record a message and return how many distinct posters sent it.
+
+        ``scope`` keeps unrelated guilds apart, ``poster`` identifies who
+        and where it was posted (e.g. ``(user_id, channel_id)``). Only
+        posters within the last ``window`` seconds count, and at most
+        ``cap`` are remembered per cluster.
+        """
+        now = self.clock()
+        words = words_of(text)
+        exact_key = (scope, hash(" ".join(words)))
+        clusters = self._clusters
+
+        cluster_key = self._exact.get(exact_key)
+        if cluster_key is not None and cluster_key not in clusters:
+            cluster_key = None
+        fingerprint = None
+        if cluster_key is None and max_distance > 0 and len(words) >= 3:
+            fingerprint = simhash(words)
+            cluster_key = self._near(scope, fingerprint, max_distance)
+        if cluster_key is None:
+            cluster_key = exact_key
+            bands = ()
+            if fingerprint is not None:
+                bands = tuple((scope, i, (fingerprint >> (BAND_BITS * i)) & 0xFFFF) for i in range(BANDS))
+                for band in bands:
+                    self._bands[band] = cluster_key
+            cluster = clusters[cluster_key] = _Cluster(fingerprint, bands, now)
+            if len(clusters) > self.max_entries:
+                self._drop(*clusters.popitem(last=False))
+        else:
+            cluster = clusters[cluster_key]
+            clusters.move_to_end(cluster_key)
+        self._exact[exact_key] = cluster_key
+
+        if now - cluster.window_start > window:
+            cluster.window_start = now
+            cluster.posters.clear()
+        cluster.last_seen = now
+        if cap is None or len(cluster.posters) < cap:
+            cluster.posters.add(poster)
+
+        self._sweep(now, window)
+        return len(cluster.posters)
+
+    def _near(self, scope, fingerprint, max_distance):
+        for i in range(BANDS):
+            key = self._bands.get((scope, i, (fingerprint >> (BAND_BITS * i)) & 0xFFFF))
+            if key is None:
+                continue
+            cluster = self._clusters.get(key)
+            if cluster is not None and cluster.simhash is not None and \
+                    (cluster.simhash ^ fingerprint).bit_count() <= max_distance:
+                return key
+        return None
+
+    def _drop(self, key, cluster):
+        for band in cluster.bands:
+            if self._bands.get(band) == key:
+                del self._bands[band]
+        if self._exact.get(key) == key:
+            del self._exact[key]
+
+    def _sweep(self, now, window):
+        # Clusters are in least-recently-seen order; stop at the first live one.
+        clusters = self._clusters
+        while clusters:
+            key, cluster = next(iter(clusters.items()))
+            if now - cluster.last_seen <= window:
+                break
+            del clusters[key]
+            self._drop(key, cluster)
+        # Exact-hash aliases of dropped clusters are cleaned lazily; cap them.
+        if len(self._exact) > self.max_entries * 2:
+            self._exact = {k: v for k, v in self._exact.items() if v in clusters}
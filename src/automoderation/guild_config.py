@@ -0,0 +1,241 @@
+"""Per-guild automod rule sets.
+
+Every guild uses the shared default config unless ``<guild_id>.yaml``
+exists in the guild config directory. A guild file overrides the default
+rule by rule: keys in a section replace the default's keys, a section set
+to ``null`` or ``false`` disables that rule, and ``inherit: false`` at the
+top level starts from an empty config instead of the default.
+
+Guild files are read and compiled the first time a guild is seen, kept in
+an LRU cache keyed by guild id and evicted once they have been idle for
+``idle_seconds`` or the cache grows past ``max_guilds``. On the event loop
+that happens in a worker thread: ``get_plan`` waits for it, while ``get``
+answers with the default plan until the guild's own is ready. A reload of
+the default recompiles the cached guilds in a worker thread too, and each
+keeps its previous plan until the recompiled one is swapped in, so a rule
+a guild turned off is never enforced there in the meantime.
+"""
+import asyncio
+from collections import OrderedDict
+import logging
+import os
+import time
+
+import yaml
+
+from .rules import RulePlan, compile_rules
+
+logger = logging.getLogger(__name__)
+
+
+def merge_config(base, override):
+    """Apply a guild override on top of the default config."""
+    if not override.get("inherit", True):
+        base = {}
+    merged = {name: dict(section) for name, section in base.items() if isinstance(section, dict)}
+    for name, section in override.items():
+        if name == "inherit":
+            continue
+        if section is None or section is False:
+            merged.pop(name, None)
+        elif isinstance(section, dict):
+            merged[name] = {**merged.get(name, {}), **section}
+        else:
+            merged[name] = section
+    return merged
+
+
+class _CachedPlan:
+    __slots__ = ("plan", "last_used")
+
+    def __init__(self, plan, last_used):
+        self.plan = plan
+        self.last_used = last_used
+
+
+class GuildConfigStore:
+    def __init__(self, directory, max_guilds=1000, idle_seconds=3600, clock=time.monotonic):
+        self.directory = directory
+        self.max_guilds = max_guilds
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self.default_config = {}
+        self.default_plan = RulePlan()
+        self._cache = OrderedDict()
+        # guild id -> task compiling that guild's plan in a worker thread.
+        self._loading = {}
+        # Bumped by set_default so plans compiled against an old default are dropped.
+        self._generation = 0
+        # Task recompiling the cached guilds after the default changed.
+        self._refreshing = None
+        self._last_sweep = clock()
+
+    def __len__(self):
+        return len(self._cache)
+
+    def set_default(self, config, plan):
+        """Replace the shared default and recompile the guilds that inherit it.
+
+        On the event loop the recompile runs in a worker thread and cached
+        guilds keep their previous plans until it is done.
+        """
+        self.default_config, self.default_plan = config, plan
+        self._generation += 1
+        if not self._cache:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            for guild_id, entry in self._cache.items():
+                entry.plan = self.load(guild_id)
+            return
+        if self._refreshing is not None:
+            self._refreshing.cancel()
+        self._refreshing = loop.create_task(self._refresh(list(self._cache)))
+
+    def path_for(self, guild_id):
+        return os.path.join(self.directory, f"{guild_id}.yaml")
+
+    def list_files(self):
+        """Map guild ids to their override file paths."""
+        try:
+            entries = list(os.scandir(self.directory))
+        except FileNotFoundError:
+            return {}
+        files = {}
+        for entry in entries:
+            stem, ext = os.path.splitext(entry.name)
+            if ext == ".yaml" and stem.isdigit():
+                files[int(stem)] = entry.path
+        return files
+
+    def get(self, guild_id):
+        """Return the compiled plan for ``guild_id``, loading it if needed.
+
+        On the event loop an uncached guild gets the default plan while its
+        own is compiled in a worker thread; elsewhere it is loaded in place.
+        """
+        if guild_id is None:
+            return self.default_plan
+        now = self.clock()
+        entry = self._cache.get(guild_id)
+        if entry is None:
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                entry = self._insert(guild_id, self.load(guild_id), now)
+            else:
+                self._schedule(guild_id, loop)
+                return self.default_plan
+        else:
+            entry.last_used = now
+            self._cache.move_to_end(guild_id)
+        if now - self._last_sweep > min(self.idle_seconds, 60):
+            self.sweep(now)
+        return entry.plan
+
+    def _insert(self, guild_id, plan, now):
+        entry = self._cache[guild_id] = _CachedPlan(plan, now)
+        if len(self._cache) > self.max_guilds:
+            self._cache.popitem(last=False)
+        return entry
+
+    async def get_plan(self, guild_id):
+        """Like get, but an uncached guild waits for its own plan instead of
+        getting the default while it compiles."""
+        if guild_id is None or guild_id in self._cache:
+            return self.get(guild_id)
+        # Shielded: the load is shared, so one caller being cancelled must
+        # not abandon it for the others.
+        return await asyncio.shield(self._schedule(guild_id, asyncio.get_running_loop()))
+
+    def _schedule(self, guild_id, loop):
+        task = self._loading.get(guild_id)
+        if task is None:
+            task = self._loading[guild_id] = loop.create_task(self._load_async(guild_id))
+        return task
+
+    async def _load_async(self, guild_id):
+        try:
+            while True:
+                generation = self._generation
+                plan = await asyncio.to_thread(self.load, guild_id)
+                # Compiled against a default that has since been replaced.
+                if generation == self._generation:
+                    break
+        finally:
+            del self._loading[guild_id]
+        self._insert(guild_id, plan, self.clock())
+        return plan
+
+    async def _refresh(self, guild_ids):
+        generation = self._generation
+        plans = await asyncio.to_thread(lambda: {guild_id: self.load(guild_id) for guild_id in guild_ids})
+        if generation != self._generation:
+            return
+        for guild_id, plan in plans.items():
+            self.replace(guild_id, plan)
+        self._refreshing = None
+
+    async def join(self):
+        """Wait until every plan being compiled is in the cache."""
+        while self._loading or self._refreshing is not None:
+            pending = list(self._loading.values())
+            if self._refreshing is not None:
+                pending.append(self._refreshing)
+            await asyncio.gather(*pending, return_exceptions=True)
+            if self._refreshing is not None and self._refreshing.done():
+                self._refreshing = None
+
+    def compile(self, guild_id):
+        """Read and compile a guild's override file. Raises if it is invalid."""
+        path = self.path_for(guild_id)
+        if not os.path.exists(path):
+            return self.default_plan
+        with open(path, "r") as f:
+            override = yaml.safe_load(f) or {}
+        if not isinstance(override, dict):
+            raise ValueError("guild config must be a mapping")
+        plan = compile_rules(merge_config(self.default_config, override))
+        logger.info(f"Automod rules loaded for guild {guild_id} ({len(plan.rules)} active).")
+        return plan
+
+    def load(self, guild_id):
+        """Like compile, but falls back to the default plan on errors."""
+        try:
+            return self.compile(guild_id)
+        except Exception as e:
+            logger.error(f"Failed to load automod config for guild {guild_id}, using default: {e}")
+            return self.default_plan
+
+    def is_cached(self, guild_id):
+        return guild_id in self._cache
+
+    def replace(self, guild_id, plan, generation=None):
+        """Swap in a recompiled plan for a guild that is already cached.
+
+        Pass the ``generation`` the plan was compiled in; it is dropped if
+        the default has been replaced since.
+        """
+        entry = self._cache.get(guild_id)
+        if entry is not None and generation in (None, self._generation):
+            entry.plan = plan
+
+    @property
+    def generation(self):
+        return self._generation
+
+    def invalidate(self, guild_id):
+        self._cache.pop(guild_id, None)
+
+    def sweep(self, now=None):
+        """Evict guilds whose plans have not been used for ``idle_seconds``."""
+        if now is None:
+            now = self.clock()
+        self._last_sweep = now
+        cache = self._cache
+        while cache:
+            guild_id, entry = next(iter(cache.items()))
+            if now - entry.last_used <= self.idle_seconds:
+                break
+            del cache[guild_id]
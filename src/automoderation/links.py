@@ -0,0 +1,240 @@
+"""Link extraction and blocked-domain matching.
+
+Links are pulled out of a message with one precompiled regex, and each
+host is normalized (case, trailing dots, full-width dots, homoglyphs,
+punycode) before it is looked up. Blocked domains live in a set and every
+suffix of a host is tried, so ``discord.gg`` also blocks
+``www.discord.gg`` but not ``notdiscord.gg``; the cost is a few set
+lookups per link however long the blocklist is.
+
+Large downloaded blocklists can be kept in a ``DomainFile``: a sorted,
+newline-separated list of normalized domains that is memory-mapped and
+binary searched, so it costs nothing at startup and no Python objects per
+entry. Build one with ``write_domain_file`` or::
+
+    python -m automoderation.links blocklist.txt data/blocklist.domains
+"""
+from collections import namedtuple
+import mmap
+import os
+import re
+import sys
+import unicodedata
+
+from .matcher import CONFUSABLES, ZERO_WIDTH, Match
+
+Link = namedtuple("Link", ["start", "end", "host", "path"])
+
+# Ideographic, full-width and half-width full stops are label separators in IDNA.
+_DOT_TABLE = {ord(c): "." for c in "。．｡"}
+_DOT_TABLE.update(dict.fromkeys(map(ord, ZERO_WIDTH)))
+_FOLD_TABLE = {ord(k): v for k, v in CONFUSABLES.items()}
+
+# "discord[.]gg", "discord(dot)gg" and friends.
+_OBFUSCATED_DOT = re.compile(r"\s*[\[({]\s*(?:\.|dot)\s*[\])}]\s*")
+
+_LABEL = r"[^\W_](?:[\w-]{0,61}[^\W_])?"
+_URL = re.compile(
+    # Only start at a token boundary: retrying inside a long run of dotted
+    # labels would make a single message cost quadratic time.
+    r"(?<![\w.-])"
+    r"(?:[a-z][a-z0-9+.-]*://)?"            # scheme
+    r"((?:" + _LABEL + r"\.)+(?:[^\W\d_]{2,63}|xn--[a-z0-9-]+))\.?"
+    r"(?::\d{1,5})?"                        # port
+    r"(/[^\s<>()]*)?"
+)
+# Sentence punctuation and markdown that may trail a link.
+_TRAILING = ".,;:!?'\"*_~"
+
+
+def normalize_host(host, confusables=True):
+    """Return the canonical ASCII form of a host name."""
+    host = host.translate(_DOT_TABLE).strip().strip(".").lower()
+    if "xn--" in host:
+        try:
+            host = host.encode("ascii").decode("idna")
+        except UnicodeError:
+            return host
+    if host.isascii():
+        return host
+    if confusables:
+        host = unicodedata.normalize("NFKC", host).translate(_FOLD_TABLE)
+    try:
+        return host.encode("idna").decode("ascii")
+    except UnicodeError:
+        return host
+
+
+def extract_links(text):
+    """Yield a Link for every URL or bare domain in ``text``.
+
+    Positions refer to ``text`` after zero-width characters are removed and
+    obfuscated dots are rewritten.
+    """
+    if "." not in text and "dot" not in text and text.isascii():
+        return
+    if not text.isascii():
+        text = text.translate(_DOT_TABLE)
+    if "[" in text or "(" in text or "{" in text:
+        text = _OBFUSCATED_DOT.sub(".", text)
+    for m in _URL.finditer(text):
+        path = (m.group(2) or "").rstrip(_TRAILING)
+        end = m.end() - (len(m.group(2) or "") - len(path))
+        yield Link(m.start(), end, m.group(1), path)
+
+
+def _suffixes(host):
+    yield host
+    start = host.find(".")
+    while start != -1:
+        yield host[start + 1:]
+        start = host.find(".", start + 1)
+
+
+def _parse_entry(entry, confusables):
+    entry = entry.strip().lower()
+    if entry.startswith("*."):
+        entry = entry[2:]
+    m = _URL.fullmatch(entry.strip("."))
+    if m is None:
+        # A bare label such as "xyz" blocks a whole top-level domain.
+        return normalize_host(entry, confusables), ""
+    return normalize_host(m.group(1), confusables), (m.group(2) or "").rstrip("/")
+
+
+class DomainSet:
+    """Blocked domains, optionally restricted to path prefixes."""
+    __slots__ = ("confusables", "_domains")
+
+    def __init__(self, entries=(), confusables=True):
+        self.confusables = confusables
+        # host -> None to block the whole domain, or a tuple of path prefixes.
+        self._domains = {}
+        for entry in entries:
+            self.add(entry)
+
+    def __len__(self):
+        return len(self._domains)
+
+    def add(self, entry):
+        host, path = _parse_entry(entry, self.confusables)
+        if not host:
+            return
+        if not path:
+            self._domains[host] = None
+        elif host not in self._domains or self._domains[host] is not None:
+            self._domains[host] = self._domains.get(host, ()) + (path,)
+
+    def match(self, host, path=""):
+        """Return the blocked domain covering ``host``/``path``, or None."""
+        domains = self._domains
+        for suffix in _suffixes(host):
+            if suffix not in domains:
+                continue
+            paths = domains[suffix]
+            if paths is None or path.startswith(paths):
+                return suffix
+        return None
+
+
+class DomainFile:
+    """A sorted on-disk domain list, searched in place through mmap."""
+    __slots__ = ("path", "_map")
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    def __reduce__(self):
+        # Worker processes map the file themselves.
+        return (DomainFile, (self.path,))
+
+    def __contains__(self, domain):
+        key = domain.encode("ascii", "ignore")
+        buf = self._map
+        lo, hi = 0, len(buf)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = buf.rfind(b"\n", lo, mid) + 1 or lo
+            end = buf.find(b"\n", start, hi)
+            if end == -1:
+                end = hi
+            line = buf[start:end]
+            if line == key:
+                return True
+            if line < key:
+                lo = end + 1
+            else:
+                hi = start
+        return False
+
+    def match(self, host, path=""):
+        for suffix in _suffixes(host):
+            if suffix in self:
+                return suffix
+        return None
+
+
+def write_domain_file(entries, path, confusables=True):
+    """Normalize, sort and write domains for DomainFile. Returns the count.
+
+    Accepts plain domain lists and hosts-file lines ("0.0.0.0 example.com");
+    blank lines and ``#`` comments are skipped.
+    """
+    domains = set()
+    for line in entries:
+        line = line.split("#", 1)[0].split()
+        if not line:
+            continue
+        host, _ = _parse_entry(line[-1], confusables)
+        if host and host.isascii() and "\n" not in host:
+            domains.add(host)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(b"\n".join(sorted(d.encode("ascii") for d in domains)))
+    os.replace(tmp_path, path)
+    return len(domains)
+
+
+class LinkMatcher:
+    """Finds links in a message whose host is on a blocklist."""
+
+    def __init__(self, domains, files=(), rule=None):
+        self.domains = domains
+        self.files = tuple(files)
+        self.rule = rule
+
+    def __len__(self):
+        return len(self.domains) + len(self.files)
+
+    def finditer(self, text):
+        return self.match_links(extract_links(text))
+
+    def match_links(self, links):
+        """Yield a Match for every blocked link among already extracted ``links``."""
+        confusables = self.domains.confusables
+        for link in links:
+            host = normalize_host(link.host, confusables)
+            blocked = self.domains.match(host, link.path)
+            for blocklist in self.files:
+                if blocked is not None:
+                    break
+                blocked = blocklist.match(host)
+            if blocked is not None:
+                yield Match(link.start, link.end, blocked, self.rule)
+
+    def search(self, text):
+        return next(self.finditer(text), None)
+
+    def search_many(self, texts):
+        return [self.search(text) is not None for text in texts]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        sys.exit("usage: python -m automoderation.links SOURCE_LIST OUTPUT_FILE")
+    with open(sys.argv[1], encoding="utf-8", errors="replace") as source:
+        count = write_domain_file(source, sys.argv[2])
+    print(f"Wrote {count} domains to {sys.argv[2]}")
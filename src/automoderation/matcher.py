@@ -0,0 +1,176 @@
+"""Single-pass multi-pattern matching for automod word and link lists.
+
+``PatternMatcher`` compiles a list of terms into an Aho-Corasick automaton
+once, at config load time, and then finds every occurrence of every term
+in one scan of the message, no matter how many terms are configured.
+"""
+from bisect import bisect_right
+from collections import deque, namedtuple
+import unicodedata
+
+Match = namedtuple("Match", ["start", "end", "term", "rule"])
+
+ZERO_WIDTH = "\u00ad\u180e\u200b\u200c\u200d\u200e\u200f\u2060\u2061\u2062\u2063\u2064\ufeff"
+
+# Common Cyrillic/Greek homoglyphs for Latin letters. Fullwidth and other
+# compatibility forms are already folded by NFKC.
+CONFUSABLES = {
+    "а": "a", "в": "b", "е": "e", "ё": "e", "к": "k", "м": "m", "н": "h",
+    "о": "o", "р": "p", "с": "c", "т": "t", "у": "y", "х": "x", "і": "i",
+    "ї": "i", "ј": "j", "ѕ": "s", "ԁ": "d", "ԛ": "q", "ԝ": "w", "ɡ": "g",
+    "α": "a", "β": "b", "ε": "e", "η": "n", "ι": "i", "κ": "k", "ν": "v",
+    "ο": "o", "ρ": "p", "τ": "t", "υ": "u", "χ": "x", "ℓ": "l", "ı": "i",
+}
+
+LEETSPEAK = {
+    "0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "8": "b",
+    "@": "a", "$": "s", "!": "i", "|": "l", "+": "t",
+}
+
+_BASE_TABLE = dict.fromkeys(map(ord, ZERO_WIDTH))
+
+
+def _build_table(confusables, leetspeak):
+    table = dict(_BASE_TABLE)
+    if confusables:
+        table.update((ord(k), v) for k, v in CONFUSABLES.items())
+    if leetspeak:
+        table.update((ord(k), v) for k, v in LEETSPEAK.items())
+    return table
+
+
+class Normalizer:
+    """Folds text into the form patterns are matched against.
+
+    Text is lowercased and stripped of zero-width characters. Optionally
+    compatibility forms are folded (NFKC) and homoglyphs and leetspeak
+    substitutions are mapped back to plain ASCII letters.
+    """
+    __slots__ = ("confusables", "leetspeak", "_table")
+
+    def __init__(self, confusables=True, leetspeak=False):
+        self.confusables = confusables
+        self.leetspeak = leetspeak
+        self._table = _build_table(confusables, leetspeak)
+
+    def __call__(self, text):
+        if self.confusables and not text.isascii():
+            text = unicodedata.normalize("NFKC", text)
+        return text.lower().translate(self._table)
+
+
+class PatternMatcher:
+    """Aho-Corasick automaton over a fixed set of terms.
+
+    Positions reported by ``finditer`` refer to the normalized text, which
+    can be shorter than the original when zero-width characters are removed.
+    """
+    __slots__ = ("rule", "word_boundary", "normalize", "terms", "_goto", "_fail", "_out")
+
+    def __init__(self, terms, rule=None, word_boundary=False, normalizer=None):
+        self.rule = rule
+        self.word_boundary = word_boundary
+        self.normalize = normalizer or Normalizer()
+        self.terms = ()
+        self._build(terms)
+
+    def _build(self, terms):
+        goto = [{}]
+        out = [()]
+        unique = []
+        for term in terms:
+            key = self.normalize(term)
+            if not key:
+                continue
+            state = 0
+            for ch in key:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(())
+                state = nxt
+            if not out[state]:
+                out[state] = ((len(key), term),)
+                unique.append(term)
+
+        fail = [0] * len(goto)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for ch, nxt in goto[state].items():
+                queue.append(nxt)
+                f = fail[state]
+                while f and ch not in goto[f]:
+                    f = fail[f]
+                fail[nxt] = goto[f].get(ch, 0)
+                # Merge the outputs of the suffix state so a scan never has to
+                # follow failure links just to collect matches.
+                out[nxt] = out[nxt] + out[fail[nxt]]
+
+        self.terms = tuple(unique)
+        self._goto, self._fail, self._out = goto, fail, out
+
+    def __len__(self):
+        return len(self.terms)
+
+    def _scan(self, text):
+        goto, fail, out = self._goto, self._fail, self._out
+        state = 0
+        for i, ch in enumerate(text):
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                for length, term in out[state]:
+                    start = i + 1 - length
+                    if self.word_boundary and not _at_boundary(text, start, i + 1):
+                        continue
+                    yield Match(start, i + 1, term, self.rule)
+
+    def finditer(self, text, normalized=False):
+        """Yield every match in ``text`` in order of end position."""
+        if not self.terms:
+            return iter(())
+        return self._scan(text if normalized else self.normalize(text))
+
+    def search(self, text, normalized=False):
+        """Return the first match in ``text``, or None."""
+        return next(self.finditer(text, normalized), None)
+
+    def search_many(self, texts, normalized=False):
+        """Return, for each text, whether it contains any term.
+
+        The texts are normalized (unless ``normalized``) and scanned as one
+        newline-joined string, so a batch costs one pass of the automaton.
+        Terms never contain a newline, so no match can span two texts.
+        """
+        if not self.terms:
+            return [False] * len(texts)
+        starts = []
+        offset = 0
+        prepared = []
+        for text in texts:
+            if not normalized:
+                text = self.normalize(text)
+            text = text.replace("\n", " ")
+            starts.append(offset)
+            prepared.append(text)
+            offset += len(text) + 1
+        hits = [False] * len(texts)
+        for match in self._scan("\n".join(prepared)):
+            hits[bisect_right(starts, match.start) - 1] = True
+        return hits
+
+
+def _is_word_char(ch):
+    return ch.isalnum() or ch == "_"
+
+
+def _at_boundary(text, start, end):
+    if start > 0 and _is_word_char(text[start - 1]):
+        return False
+    if end < len(text) and _is_word_char(text[end]):
+        return False
+    return True
@@ -0,0 +1,150 @@
+"""Lightweight counters and latency histograms for the automoderator.
+
+Instrumentation is off by default. When ``AutomodMetrics.enabled`` is false
+the automoderator takes its uninstrumented code path, so the only cost is
+a single attribute check per message.
+"""
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency bucket upper bounds in seconds.
+DEFAULT_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+
+class RuleStats:
+    __slots__ = ("evaluations", "matches", "actions", "time_ns")
+
+    def __init__(self):
+        self.evaluations = 0
+        self.matches = 0
+        self.actions = 0
+        self.time_ns = 0
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "count", "total")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def quantile(self, q):
+        """Estimate a quantile as the upper bound of the bucket holding it."""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for bound, n in zip(self.buckets, self.counts):
+            seen += n
+            if seen >= target:
+                return bound
+        return float("inf")
+
+
+class AutomodMetrics:
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.rules = {}
+        self.messages = 0
+        self.handler_latency = Histogram()
+        self.action_latency = Histogram()
+        self.event_to_action_latency = Histogram()
+        self.gauges = {}
+
+    def rule(self, name):
+        stats = self.rules.get(name)
+        if stats is None:
+            stats = self.rules[name] = RuleStats()
+        return stats
+
+    def add_gauge(self, name, func):
+        """Register a callable sampled whenever metrics are exported."""
+        self.gauges[name] = func
+
+    def observe_action(self, enqueued_at, created_at=None):
+        """Record that an enforcement action finished."""
+        if not self.enabled:
+            return
+        self.action_latency.observe(time.monotonic() - enqueued_at)
+        if created_at is not None:
+            self.event_to_action_latency.observe(max(0.0, time.time() - created_at.timestamp()))
+
+    def snapshot(self):
+        return {
+            "messages": self.messages,
+            "rules": {
+                name: {
+                    "evaluations": s.evaluations,
+                    "matches": s.matches,
+                    "actions": s.actions,
+                    "time_ms": round(s.time_ns / 1e6, 3),
+                }
+                for name, s in self.rules.items()
+            },
+            "handler_p99_ms": self.handler_latency.quantile(0.99) * 1000,
+            "action_p99_ms": self.action_latency.quantile(0.99) * 1000,
+            "event_to_action_p99_ms": self.event_to_action_latency.quantile(0.99) * 1000,
+            **{name: func() for name, func in self.gauges.items()},
+        }
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        lines = [
+            "# TYPE automod_messages_total counter",
+            f"automod_messages_total {self.messages}",
+        ]
+        for metric, attr, kind in (
+            ("automod_rule_evaluations_total", "evaluations", "counter"),
+            ("automod_rule_matches_total", "matches", "counter"),
+            ("automod_rule_actions_total", "actions", "counter"),
+            ("automod_rule_seconds_total", "time_ns", "counter"),
+        ):
+            lines.append(f"# TYPE {metric} {kind}")
+            for name, stats in self.rules.items():
+                value = getattr(stats, attr)
+                if attr == "time_ns":
+                    value = value / 1e9
+                lines.append(f'{metric}{{rule="{name}"}} {value}')
+        for metric, histogram in (
+            ("automod_handler_seconds", self.handler_latency),
+            ("automod_action_seconds", self.action_latency),
+            ("automod_event_to_action_seconds", self.event_to_action_latency),
+        ):
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, n in zip(histogram.buckets, histogram.counts):
+                cumulative += n
+                lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {histogram.count}')
+            lines.append(f"{metric}_sum {histogram.total}")
+            lines.append(f"{metric}_count {histogram.count}")
+        for name, func in self.gauges.items():
+            lines.append(f"# TYPE automod_{name} gauge")
+            lines.append(f"automod_{name} {func()}")
+        return "\n".join(lines) + "\n"
+
+
+async def start_metrics_server(metrics, host, port):
+    """Serve ``/metrics`` over HTTP. Returns the aiohttp runner to clean up."""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.render_prometheus(), content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info(f"Serving automod metrics on http://{host}:{port}/metrics")
+    return runner
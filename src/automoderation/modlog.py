@@ -0,0 +1,156 @@
+"""Structured log of moderation actions.
+
+``ModLog.record`` appends an event to an in-memory ring buffer and
+returns; nothing on the message path touches the disk. A background task
+drains the buffer every ``flush_interval`` seconds and writes the events
+to SQLite in one transaction from a worker thread. If writes fall so far
+behind that the buffer fills up, the oldest unwritten events are dropped
+and counted rather than slowing moderation down.
+
+The table is indexed by guild, user and rule (each with time), so the
+queries the web panel runs stay fast as the log grows. No discord imports
+here; the web panel reads the log with the same class.
+"""
+import asyncio
+from collections import deque, namedtuple
+from contextlib import closing
+import logging
+import os
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+ModEvent = namedtuple(
+    "ModEvent",
+    ["timestamp", "guild_id", "channel_id", "user_id", "message_id", "rule", "term", "action", "latency_ms"],
+)
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS mod_events ("
+    " id INTEGER PRIMARY KEY, timestamp REAL NOT NULL, guild_id INTEGER, channel_id INTEGER,"
+    " user_id INTEGER, message_id INTEGER, rule TEXT, term TEXT, action TEXT NOT NULL, latency_ms REAL)",
+    "CREATE INDEX IF NOT EXISTS mod_events_time ON mod_events (timestamp)",
+    "CREATE INDEX IF NOT EXISTS mod_events_guild ON mod_events (guild_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS mod_events_user ON mod_events (user_id, timestamp)",
+    "CREATE INDEX IF NOT EXISTS mod_events_rule ON mod_events (rule, timestamp)",
+)
+
+_COLUMNS = ", ".join(ModEvent._fields)
+
+
+# Seconds between deletions of events older than the retention period.
+PRUNE_INTERVAL = 3600
+
+
+class ModLog:
+    def __init__(self, path, capacity=10_000, flush_interval=1.0, retention_days=None):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.retention_days = retention_days
+        self._buffer = deque(maxlen=capacity)
+        self._initialized = False
+        self._task = None
+        self.written = 0
+        self.dropped = 0
+
+    def __len__(self):
+        """Events waiting to be written."""
+        return len(self._buffer)
+
+    def _connect(self):
+        if not self._initialized:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            conn.execute("PRAGMA journal_mode=WAL")
+            for statement in _SCHEMA:
+                conn.execute(statement)
+            self._initialized = True
+        return conn
+
+    def record(self, guild_id, channel_id, user_id, message_id, rule, action, term=None, latency_ms=None,
+               timestamp=None):
+        """Queue an event for writing. Never blocks."""
+        buffer = self._buffer
+        if len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        buffer.append(ModEvent(
+            timestamp if timestamp is not None else time.time(),
+            guild_id, channel_id, user_id, message_id, rule, term, action, latency_ms,
+        ))
+
+    def _write(self, events):
+        with closing(self._connect()) as conn, conn:
+            conn.executemany(
+                f"INSERT INTO mod_events ({_COLUMNS}) VALUES ({', '.join('?' * len(ModEvent._fields))})",
+                events,
+            )
+
+    async def flush(self):
+        """Write everything buffered so far in a worker thread."""
+        if not self._buffer:
+            return
+        events = list(self._buffer)
+        self._buffer.clear()
+        try:
+            await asyncio.to_thread(self._write, events)
+        except Exception as e:
+            logger.error(f"Failed to write {len(events)} moderation log event(s): {e}")
+            return
+        self.written += len(events)
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self):
+        last_prune = 0.0
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+            if self.retention_days and time.monotonic() - last_prune > PRUNE_INTERVAL:
+                last_prune = time.monotonic()
+                try:
+                    await asyncio.to_thread(self.prune, time.time() - self.retention_days * 86400)
+                except Exception as e:
+                    logger.error(f"Failed to prune the moderation log: {e}")
+
+    async def close(self):
+        """Stop the background writer and write what is left."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def query(self, guild_id=None, user_id=None, rule=None, since=None, until=None, limit=100):
+        """Return matching events, newest first. Blocking."""
+        if not os.path.exists(self.path):
+            return []
+        clauses, params = [], []
+        for column, value in (("guild_id", guild_id), ("user_id", user_id), ("rule", rule)):
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if since is not None:
+            clauses.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            clauses.append("timestamp < ?")
+            params.append(until)
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                f"SELECT {_COLUMNS} FROM mod_events{where} ORDER BY timestamp DESC LIMIT ?",
+                (*params, limit),
+            ).fetchall()
+        return [ModEvent(*row) for row in rows]
+
+    def prune(self, before):
+        """Delete events older than the ``before`` timestamp. Blocking."""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute("DELETE FROM mod_events WHERE timestamp < ?", (before,)).rowcount
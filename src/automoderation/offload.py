@@ -0,0 +1,199 @@
+"""Run expensive content rules in worker processes.
+
+Rules marked ``offload = True`` only look at the message text (word lists,
+link blocklists), so they can run anywhere. ``ProcessOffload`` evaluates
+them in a process pool and hands back, for each message, the name of the
+first one that matched; everything that needs the message object or
+shared state (mentions, attachments, spam counts) still runs on the
+event loop.
+
+Each worker keeps the compiled rules it has been sent, keyed by a token
+for the plan they came from. Tasks only carry the token; a worker that
+doesn't know it answers None and the batch is resent with the pickled
+rules. Reloading the config produces new plans and so new tokens, which
+re-ships the rules the first time each worker needs them.
+
+When the pool fails or doesn't answer in time, ``first_match`` returns
+``FAILED``; the caller skips the offloaded rules for that message rather
+than run the slow check on the event loop, and caches no verdict. A
+timeout also replaces the pool and kills its workers, since one of them
+may be stuck on that message.
+
+Messages arriving within ``batch_delay`` of each other are sent to the
+pool together. Short messages never leave the process: for them the
+round trip costs more than the checks.
+"""
+import asyncio
+from collections import OrderedDict
+import concurrent.futures
+import itertools
+import logging
+import multiprocessing
+import pickle
+
+from .features import MessageFeatures
+
+logger = logging.getLogger(__name__)
+
+# Compiled rule sets a worker keeps; older ones are dropped and resent if needed.
+WORKER_CACHE_SIZE = 64
+
+_worker_rules = OrderedDict()
+
+# Returned by first_match when the pool gave no answer.
+FAILED = object()
+
+
+def _evaluate(token, payload, contents):
+    """Worker side: return the first matching rule name per content."""
+    rules = _worker_rules.get(token)
+    if rules is None:
+        if payload is None:
+            return None
+        rules = _worker_rules[token] = pickle.loads(payload)
+        while len(_worker_rules) > WORKER_CACHE_SIZE:
+            _worker_rules.popitem(last=False)
+    else:
+        _worker_rules.move_to_end(token)
+    features = [MessageFeatures(content) for content in contents]
+    verdicts = [None] * len(contents)
+    pending = list(range(len(contents)))
+    for rule in rules:
+        if not pending:
+            break
+        hits = rule.check_batch(None, None, [features[i] for i in pending])
+        remaining = []
+        for i, hit in zip(pending, hits):
+            if hit:
+                verdicts[i] = rule.name
+            else:
+                remaining.append(i)
+        pending = remaining
+    return verdicts
+
+
+def _terminate(pool):
+    # shutdown() alone waits for running tasks, so a hung worker would be
+    # left behind; its processes are killed instead.
+    processes = list((pool._processes or {}).values())
+    pool.shutdown(wait=False, cancel_futures=True)
+    for process in processes:
+        process.terminate()
+
+
+def offloadable(plan):
+    return tuple(rule for rule in plan.rules if getattr(rule, "offload", False))
+
+
+class _Batch:
+    __slots__ = ("contents", "futures", "handle", "generation")
+
+    def __init__(self, generation):
+        self.contents = []
+        self.futures = []
+        self.handle = None
+        self.generation = generation
+
+
+class ProcessOffload:
+    def __init__(self, workers=2, min_length=200, batch_size=64, batch_delay=0.002, timeout=2.0,
+                 max_plans=1024):
+        self.workers = workers
+        self.min_length = min_length
+        self.batch_size = batch_size
+        self.batch_delay = batch_delay
+        self.timeout = timeout
+        self.max_plans = max_plans
+        self._pool = None
+        # id(plan) -> (plan, token, pickled rules); holding the plan keeps its id unique.
+        self._plans = OrderedDict()
+        self._tokens = itertools.count(1)
+        self._batches = {}
+        self._tasks = set()
+        # Bumped whenever the pool is replaced.
+        self._generation = 0
+        self.timeouts = 0
+
+    def start(self):
+        if self._pool is None:
+            # Spawned workers don't inherit the event loop or helper threads.
+            self._pool = concurrent.futures.ProcessPoolExecutor(
+                self.workers, mp_context=multiprocessing.get_context("spawn")
+            )
+
+    def close(self):
+        if self._pool is not None:
+            _terminate(self._pool)
+            self._pool = None
+
+    def wants(self, plan, content):
+        """Whether a message is worth sending to the pool."""
+        return self._pool is not None and len(content) >= self.min_length and bool(offloadable(plan))
+
+    def _entry(self, plan):
+        entry = self._plans.get(id(plan))
+        if entry is None:
+            payload = pickle.dumps(offloadable(plan), protocol=pickle.HIGHEST_PROTOCOL)
+            entry = self._plans[id(plan)] = (plan, next(self._tokens), payload)
+            while len(self._plans) > self.max_plans:
+                self._plans.popitem(last=False)
+        else:
+            self._plans.move_to_end(id(plan))
+        return entry
+
+    async def first_match(self, plan, content):
+        """Return the name of the first offloaded rule ``content`` breaks.
+
+        Returns None if none match, or ``FAILED`` if the pool failed or
+        didn't answer within ``timeout`` seconds.
+        """
+        loop = asyncio.get_running_loop()
+        _, token, _ = self._entry(plan)
+        batch = self._batches.get(token)
+        if batch is None:
+            batch = self._batches[token] = _Batch(self._generation)
+            batch.handle = loop.call_later(self.batch_delay, self._dispatch, plan, token)
+        future = loop.create_future()
+        batch.contents.append(content)
+        batch.futures.append(future)
+        if len(batch.contents) >= self.batch_size:
+            batch.handle.cancel()
+            self._dispatch(plan, token)
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            logger.warning(f"Offloaded rule check timed out after {self.timeout}s; skipping those rules.")
+            if batch.generation == self._generation:
+                self._restart()
+            return FAILED
+
+    def _dispatch(self, plan, token):
+        batch = self._batches.pop(token, None)
+        if batch is not None:
+            task = asyncio.get_running_loop().create_task(self._run(plan, token, batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _run(self, plan, token, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            verdicts = await loop.run_in_executor(self._pool, _evaluate, token, None, batch.contents)
+            if verdicts is None:
+                _, token, payload = self._entry(plan)
+                verdicts = await loop.run_in_executor(self._pool, _evaluate, token, payload, batch.contents)
+        except Exception as e:
+            logger.error(f"Offloaded rule check failed: {e}")
+            verdicts = [FAILED] * len(batch.futures)
+        for future, verdict in zip(batch.futures, verdicts):
+            if not future.done():
+                future.set_result(verdict)
+
+    def _restart(self):
+        # A worker may be stuck on a pathological message and would never
+        # exit by itself. Kill the old pool and queue new work on a fresh one.
+        if self._pool is not None:
+            _terminate(self._pool)
+            self._pool = None
+            self._generation += 1
+            self.start()
@@ -0,0 +1,194 @@
+"""Join raid detection.
+
+Recent joins are kept per guild in a ring buffer bounded both by count
+(``capacity``) and by age (``join_window``). Alongside the ring, running
+tallies are kept of new accounts, accounts without an avatar, accounts
+created in the same hour, and similar usernames; they are adjusted as
+joins enter and leave the ring, so observing a join costs the same at ten
+joins a minute as at ten thousand.
+
+Once enough joins land inside the window the burst is scored, and the
+first time the score crosses ``alert_score`` a single ``RaidReport`` is
+returned. Further joins in the same raid are absorbed silently until the
+guild has been quiet for ``cooldown`` seconds.
+"""
+from collections import deque
+from dataclasses import dataclass
+import time
+
+from .matcher import Normalizer
+
+# Account creation times are clustered into buckets of this many seconds.
+CREATION_BUCKET = 3600
+
+_skeleton = Normalizer(confusables=True, leetspeak=True)
+
+
+def name_skeleton(name):
+    """Reduce a username to the part bots tend to share, e.g. 'Sp4mBot_123' -> 'spambot'."""
+    # Drop the numeric suffix first so leetspeak folding doesn't turn it into letters.
+    text = _skeleton((name or "").rstrip("0123456789_-."))
+    return "".join(ch for ch in text if ch.isalpha())
+
+
+@dataclass(frozen=True, slots=True)
+class RaidSettings:
+    join_window: float = 10
+    min_joins: int = 5
+    capacity: int = 200
+    alert_score: float = 2.0
+    min_account_age_days: int = 7
+    cooldown: float = 300
+    # Joins within join_window that pause auto-roles whatever the score.
+    hold_joins: int = 10
+    mod_channel_id: int | None = None
+
+
+@dataclass(frozen=True, slots=True)
+class RaidReport:
+    guild_id: int
+    joins: int
+    window: float
+    score: float
+    new_accounts: int
+    no_avatar: int
+    creation_cluster: int
+    name_cluster: int
+
+    def describe(self):
+        return (
+            f"Raid alert: {self.joins} members joined within {self.window:g} seconds "
+            f"(score {self.score:.2f}). New accounts: {self.new_accounts}, "
+            f"default avatars: {self.no_avatar}, created in the same hour: {self.creation_cluster}, "
+            f"similar names: {self.name_cluster}."
+        )
+
+
+class _GuildJoins:
+    __slots__ = ("ring", "new_accounts", "no_avatar", "creation", "names", "alerted", "last_join")
+
+    def __init__(self):
+        self.ring = deque()
+        self.new_accounts = 0
+        self.no_avatar = 0
+        self.creation = {}
+        self.names = {}
+        self.alerted = False
+        self.last_join = 0.0
+
+
+def _inc(counts, key):
+    counts[key] = counts.get(key, 0) + 1
+
+
+def _dec(counts, key):
+    n = counts[key] - 1
+    if n:
+        counts[key] = n
+    else:
+        del counts[key]
+
+
+class RaidDetector:
+    def __init__(self, clock=time.monotonic, sweep_every=1024):
+        self.clock = clock
+        self.sweep_every = sweep_every
+        self._guilds = {}
+        self._since_sweep = 0
+
+    def __len__(self):
+        return len(self._guilds)
+
+    def observe(self, member, settings, burst_count=None):
+        """Record a join. Returns a RaidReport the first time a raid is detected.
+
+        ``burst_count`` lets the caller supply a join count for the window
+        from a shared counter, so joins handled by other shards are included.
+        """
+        guild_id = member.guild.id
+        state = self._guilds.get(guild_id)
+        if state is None:
+            state = self._guilds[guild_id] = _GuildJoins()
+        now = self.clock()
+
+        if state.alerted and now - state.last_join > settings.cooldown:
+            state.alerted = False
+        state.last_join = now
+
+        created_at = getattr(member, "created_at", None)
+        created_ts = created_at.timestamp() if created_at is not None else None
+        is_new = created_ts is not None and (
+            time.time() - created_ts < settings.min_account_age_days * 86400
+        )
+        no_avatar = getattr(member, "avatar", None) is None
+        bucket = int(created_ts // CREATION_BUCKET) if created_ts is not None else None
+        skeleton = name_skeleton(getattr(member, "name", ""))
+
+        ring = state.ring
+        ring.append((now, bucket, skeleton, is_new, no_avatar))
+        state.new_accounts += is_new
+        state.no_avatar += no_avatar
+        if bucket is not None:
+            _inc(state.creation, bucket)
+        if skeleton:
+            _inc(state.names, skeleton)
+        while ring and (len(ring) > settings.capacity or now - ring[0][0] > settings.join_window):
+            self._evict(state, ring.popleft())
+        cluster = state.creation.get(bucket, 0) if bucket is not None else 0
+        names = state.names.get(skeleton, 0) if skeleton else 0
+
+        self._since_sweep += 1
+        if self._since_sweep >= self.sweep_every:
+            self.sweep(settings.cooldown)
+
+        joins = max(len(ring), int(burst_count or 0))
+        if state.alerted or joins < settings.min_joins:
+            return None
+        score = self.score(state, joins, cluster, names, settings)
+        if score < settings.alert_score:
+            return None
+        state.alerted = True
+        return RaidReport(
+            guild_id=guild_id,
+            joins=joins,
+            window=settings.join_window,
+            score=score,
+            new_accounts=state.new_accounts,
+            no_avatar=state.no_avatar,
+            creation_cluster=cluster,
+            name_cluster=names,
+        )
+
+    @staticmethod
+    def score(state, joins, cluster, names, settings):
+        """Score a burst; each signal contributes up to 1.
+
+        The burst itself counts by how far past ``min_joins`` it is; the
+        other signals are the share of joins in the window that are new,
+        avatarless, created alongside this one, or named like this one.
+        """
+        size = len(state.ring) or 1
+        return (
+            min(1.0, joins / (settings.min_joins * 2))
+            + state.new_accounts / size
+            + state.no_avatar / size
+            + cluster / size
+            + names / size
+        )
+
+    def _evict(self, state, entry):
+        _, bucket, skeleton, is_new, no_avatar = entry
+        state.new_accounts -= is_new
+        state.no_avatar -= no_avatar
+        if bucket is not None:
+            _dec(state.creation, bucket)
+        if skeleton:
+            _dec(state.names, skeleton)
+
+    def sweep(self, idle_seconds):
+        """Forget guilds that have had no joins for ``idle_seconds``."""
+        self._since_sweep = 0
+        now = self.clock()
+        for guild_id in [g for g, s in self._guilds.items() if now - s.last_join > idle_seconds]:
+            del self._guilds[guild_id]
+
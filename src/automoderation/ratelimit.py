@@ -0,0 +1,86 @@
+"""Bounded message-rate tracking for the spam rule.
+
+Each tracked (guild, channel, user) key keeps only the timestamps of its
+last ``threshold`` messages in a small ring, so an update is O(1) and the
+memory used per key is fixed. Keys live in an LRU map capped at
+``max_entries``; idle keys are swept out as the map is used, so users who
+stopped posting do not stay in memory forever.
+"""
+from collections import OrderedDict
+import time
+
+
+def monotonic_ms():
+    return time.monotonic_ns() // 1_000_000
+
+
+class _Window:
+    __slots__ = ("stamps", "pos", "last")
+
+    def __init__(self, size):
+        self.stamps = [None] * size
+        self.pos = 0
+        self.last = 0
+
+
+class SpamTracker:
+    """Counts messages per key in a sliding time window."""
+
+    def __init__(self, max_entries=100_000, sweep_every=1024, clock=monotonic_ms):
+        self.max_entries = max_entries
+        self.sweep_every = sweep_every
+        self.clock = clock
+        self._entries = OrderedDict()
+        self._horizon = 0
+        self._since_sweep = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def hit(self, key, interval_ms, threshold):
+        """Record a message for ``key``.
+
+        Returns True when this message makes ``threshold`` or more messages
+        within the last ``interval_ms`` milliseconds.
+        """
+        now = self.clock()
+        entries = self._entries
+        window = entries.get(key)
+        if window is None or len(window.stamps) != threshold:
+            window = entries[key] = _Window(threshold)
+            if len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        else:
+            entries.move_to_end(key)
+
+        stamps = window.stamps
+        stamps[window.pos] = now
+        window.pos = (window.pos + 1) % threshold
+        window.last = now
+
+        if interval_ms > self._horizon:
+            self._horizon = interval_ms
+        self._since_sweep += 1
+        if self._since_sweep >= self.sweep_every:
+            self.sweep(now)
+
+        # After advancing, pos points at the oldest of the last `threshold` stamps.
+        oldest = stamps[window.pos]
+        return oldest is not None and now - oldest <= interval_ms
+
+    def sweep(self, now=None):
+        """Drop keys that have been idle for longer than any window in use."""
+        if now is None:
+            now = self.clock()
+        self._since_sweep = 0
+        entries = self._entries
+        # Entries are kept in least-recently-used order, so stale ones are
+        # all at the front and the sweep stops at the first live key.
+        while entries:
+            key, window = next(iter(entries.items()))
+            if now - window.last <= self._horizon:
+                break
+            del entries[key]
+
+    def clear(self):
+        self._entries.clear()
@@ -0,0 +1,326 @@
+from dataclasses import dataclass
+
+from .attachments import EXTENSIONS
+from .links import DomainFile, DomainSet, LinkMatcher
+from .matcher import Normalizer, PatternMatcher
+from .raid import RaidSettings
+
+
+# Order in which rules are evaluated; the first rule that matches wins.
+RULE_ORDER = (
+    "badword_rule",
+    "link_blocking_rule",
+    "mass_mention_rule",
+    "caps_rule",
+    "attachment_rule",
+    "spam_rule",
+    "duplicate_rule",
+)
+
+
+@dataclass(frozen=True, slots=True)
+class BadWordRule:
+    matcher: PatternMatcher
+
+    name = "badword_rule"
+    # Only needs the text, so it may run in a worker process.
+    offload = True
+    reason = "Bad Word"
+    warning = "watch your language!"
+
+    def check(self, automod, message, features):
+        return self.matcher.search(features.normalized(self.matcher.normalize), normalized=True) is not None
+
+    def check_batch(self, automod, messages, features):
+        normalize = self.matcher.normalize
+        return self.matcher.search_many([f.normalized(normalize) for f in features], normalized=True)
+
+    def matches(self, features):
+        return list(self.matcher.finditer(features.normalized(self.matcher.normalize), normalized=True))
+
+
+@dataclass(frozen=True, slots=True)
+class LinkBlockingRule:
+    matcher: LinkMatcher
+
+    name = "link_blocking_rule"
+    offload = True
+    reason = "Blocked Link"
+    warning = "that kind of link is not allowed!"
+
+    def check(self, automod, message, features):
+        return next(self.matcher.match_links(features.links), None) is not None
+
+    def check_batch(self, automod, messages, features):
+        match_links = self.matcher.match_links
+        return [next(match_links(f.links), None) is not None for f in features]
+
+    def matches(self, features):
+        return list(self.matcher.match_links(features.links))
+
+
+@dataclass(frozen=True, slots=True)
+class MassMentionRule:
+    max_mentions: int
+
+    name = "mass_mention_rule"
+    reason = "Mass Mention"
+    warning = "too many mentions!"
+
+    def check(self, automod, message, features):
+        return features.mentions > self.max_mentions
+
+    def check_batch(self, automod, messages, features):
+        limit = self.max_mentions
+        return [f.mentions > limit for f in features]
+
+
+@dataclass(frozen=True, slots=True)
+class CapsRule:
+    max_caps_ratio: float
+    min_length: int
+
+    name = "caps_rule"
+    reason = "Excessive Caps"
+    warning = "please avoid excessive caps!"
+
+    def check(self, automod, message, features):
+        length = len(features)
+        if length < self.min_length or not length:
+            return False
+        return features.uppercase / length > self.max_caps_ratio
+
+    def check_batch(self, automod, messages, features):
+        return [self.check(automod, None, f) for f in features]
+
+
+@dataclass(frozen=True, slots=True)
+class AttachmentRule:
+    # A tuple so str.endswith can test every suffix in a single call.
+    blocked_filetypes: tuple
+    # Also look at the first bytes of each attachment (see attachments.py).
+    inspect: bool = False
+
+    name = "attachment_rule"
+    reason = "Blocked Filetype"
+    warning = "that file type is not allowed!"
+
+    def check(self, automod, message, features):
+        return any(name.endswith(self.blocked_filetypes) for name in features.filenames)
+
+    def blocks_type(self, kind):
+        """Whether a type detected from the file's content is blocked."""
+        return any(ext.endswith(self.blocked_filetypes) for ext in EXTENSIONS.get(kind, ()))
+
+
+@dataclass(frozen=True, slots=True)
+class SpamRule:
+    interval_ms: int
+    spam_threshold: int
+    # "guild" counts a user's messages across the whole guild, "channel"
+    # counts each channel separately.
+    scope: str = "guild"
+    max_tracked: int = 100_000
+
+    name = "spam_rule"
+    # Depends on what was seen before, so batch scans skip it.
+    stateful = True
+    reason = "Spam"
+    warning = "you're sending messages too quickly!"
+
+    def key(self, message):
+        guild = getattr(message, "guild", None)
+        guild_id = guild.id if guild is not None else None
+        channel_id = None
+        if self.scope == "channel":
+            channel = getattr(message, "channel", None)
+            channel_id = channel.id if channel is not None else None
+        return (guild_id, channel_id, message.author.id)
+
+    def check(self, automod, message, features):
+        key = self.key(message)
+        hit = automod.spam_tracker.hit(key, self.interval_ms, self.spam_threshold)
+        # The local tracker is exact for this process; the shared counter
+        # also sees messages handled by other shards.
+        shared = automod.shared_counter
+        if shared is not None and shared.hit(key, self.interval_ms, self.spam_threshold):
+            return True
+        return hit
+
+
+@dataclass(frozen=True, slots=True)
+class DuplicateRule:
+    # Distinct (user, channel) pairs that must post the same content
+    # within ``window`` seconds before it counts as a flood.
+    threshold: int
+    window: float
+    min_length: int = 20
+    # SimHash bits two messages may differ by and still count as copies;
+    # 0 only matches identical (normalized) text.
+    max_distance: int = 3
+    max_tracked: int = 50_000
+
+    name = "duplicate_rule"
+    stateful = True
+    reason = "Duplicate Content"
+    warning = "the same message is being posted all over the server!"
+
+    def check(self, automod, message, features):
+        if len(features.text) < self.min_length:
+            return False
+        guild = getattr(message, "guild", None)
+        channel = getattr(message, "channel", None)
+        poster = (message.author.id, channel.id if channel is not None else None)
+        count = automod.duplicate_index.observe(
+            guild.id if guild is not None else None,
+            poster,
+            features.text,
+            self.window,
+            self.max_distance,
+            cap=self.threshold,
+        )
+        return count >= self.threshold
+
+
+@dataclass(frozen=True, slots=True)
+class RulePlan:
+    """An immutable, precompiled view of the automod config."""
+    rules: tuple = ()
+    # RaidSettings when raid detection is enabled, checked on member joins.
+    raid: RaidSettings | None = None
+
+    def get(self, name):
+        return next((rule for rule in self.rules if rule.name == name), None)
+
+
+def _lowered(values):
+    return [str(v).strip().lower() for v in values or () if str(v).strip()]
+
+
+def _compile_matcher(name, terms, settings):
+    normalizer = Normalizer(
+        confusables=bool(settings.get("confusables", True)),
+        leetspeak=bool(settings.get("leetspeak", False)),
+    )
+    matcher = PatternMatcher(
+        sorted(set(terms)),
+        rule=name,
+        word_boundary=bool(settings.get("word_boundary", False)),
+        normalizer=normalizer,
+    )
+    return matcher if len(matcher) else None
+
+
+def _compile_rule(name, settings):
+    if name == "badword_rule":
+        matcher = _compile_matcher(name, _lowered(settings.get("bad_words")), settings)
+        return BadWordRule(matcher) if matcher else None
+    if name == "link_blocking_rule":
+        domains = DomainSet(_lowered(settings.get("blocked_links")), bool(settings.get("confusables", True)))
+        files = settings.get("blocklist_files") or ()
+        if isinstance(files, str):
+            files = [files]
+        try:
+            files = [DomainFile(path) for path in files]
+        except OSError as e:
+            raise ValueError(f"cannot open blocklist: {e}") from e
+        matcher = LinkMatcher(domains, files, rule=name)
+        return LinkBlockingRule(matcher) if len(matcher) else None
+    if name == "mass_mention_rule":
+        return MassMentionRule(int(settings.get("max_mentions", 5)))
+    if name == "caps_rule":
+        return CapsRule(float(settings.get("max_caps_ratio", 0.7)), int(settings.get("min_length", 10)))
+    if name == "attachment_rule":
+        filetypes = tuple(sorted(set(_lowered(settings.get("blocked_filetypes")))))
+        return AttachmentRule(filetypes, bool(settings.get("inspect", False))) if filetypes else None
+    if name == "spam_rule":
+        interval_ms = int(float(settings.get("spam_interval", 10)) * 1000)
+        threshold = int(settings.get("spam_threshold", 5))
+        scope = settings.get("scope", "guild")
+        if threshold < 1 or interval_ms < 0:
+            raise ValueError("spam_threshold must be at least 1 and spam_interval non-negative")
+        if scope not in ("guild", "channel"):
+            raise ValueError(f"unknown scope {scope!r}")
+        return SpamRule(interval_ms, threshold, scope, int(settings.get("max_tracked", 100_000)))
+    if name == "duplicate_rule":
+        rule = DuplicateRule(
+            threshold=int(settings.get("threshold", 5)),
+            window=float(settings.get("window", 60)),
+            min_length=int(settings.get("min_length", 20)),
+            max_distance=int(settings.get("max_distance", 3)),
+            max_tracked=int(settings.get("max_tracked", 50_000)),
+        )
+        if rule.threshold < 2 or rule.window <= 0:
+            raise ValueError("threshold must be at least 2 and window positive")
+        if not 0 <= rule.max_distance <= 3:
+            raise ValueError("max_distance must be between 0 and 3")
+        return rule
+    return None
+
+
+def compile_rules(config):
+    """Compile a raw config mapping into a RulePlan.
+
+    Raises ValueError if a rule section is malformed, so callers can keep
+    serving the previous plan instead of running with a half-built one.
+    """
+    return recompile(RulePlan(), config, None)
+
+
+def recompile(plan, config, changed):
+    """Compile the sections named in ``changed``, reusing the rest of ``plan``.
+
+    Compiled rules are immutable, so a rule whose section didn't change can
+    be shared by the old and new plan. ``changed=None`` compiles everything.
+    """
+    if not isinstance(config, dict):
+        raise ValueError("automod config must be a mapping")
+    rules = []
+    for name in RULE_ORDER:
+        if changed is not None and name not in changed:
+            rule = plan.get(name)
+            if rule is not None:
+                rules.append(rule)
+            continue
+        settings = config.get(name)
+        if not settings:
+            continue
+        if not isinstance(settings, dict):
+            raise ValueError(f"{name} must be a mapping")
+        try:
+            rule = _compile_rule(name, settings)
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"invalid {name}: {e}") from e
+        if rule is not None:
+            rules.append(rule)
+    if changed is None or "raid_rule" in changed:
+        raid = _compile_raid(config.get("raid_rule"))
+    else:
+        raid = plan.raid
+    return RulePlan(tuple(rules), raid)
+
+
+def _compile_raid(settings):
+    if not settings:
+        return None
+    if not isinstance(settings, dict):
+        raise ValueError("raid_rule must be a mapping")
+    try:
+        mod_channel_id = settings.get("mod_channel_id")
+        raid = RaidSettings(
+            join_window=float(settings.get("join_window", 10)),
+            min_joins=int(settings.get("min_joins", 5)),
+            capacity=int(settings.get("capacity", 200)),
+            alert_score=float(settings.get("alert_score", 2.0)),
+            min_account_age_days=int(settings.get("min_account_age_days", 7)),
+            cooldown=float(settings.get("cooldown", 300)),
+            hold_joins=int(settings.get("hold_joins", 10)),
+            mod_channel_id=int(mod_channel_id) if mod_channel_id else None,
+        )
+    except (TypeError, ValueError) as e:
+        raise ValueError(f"invalid raid_rule: {e}") from e
+    if raid.min_joins < 1 or raid.capacity < raid.min_joins:
+        raise ValueError("invalid raid_rule: capacity must be at least min_joins, which must be at least 1")
+    if raid.hold_joins < 1:
+        raise ValueError("invalid raid_rule: hold_joins must be at least 1")
+    return raid
@@ -0,0 +1,62 @@
+"""Remember what the content rules decided about recently seen messages.
+
+Spam waves and copypasta send the same text over and over, and every copy
+used to go through the word list and link checks again. ``VerdictCache``
+maps a message's content to the first content rule it broke (or to None)
+so a repeat only costs a hash and a dict lookup.
+
+A verdict only holds for the rules that produced it, so entries are keyed
+by the plan as well as by everything the content rules look at: a digest
+of the exact text (the caps rule cares about case), the attachment names
+and the mention count. Entries keep a reference to their plan and only
+count as hits for that same plan object, so a reloaded config, or a guild
+with its own rules, never sees another plan's verdicts. Rules that keep
+state between messages (spam, duplicates) are never cached.
+"""
+from collections import OrderedDict
+
+# Returned by ``get`` when there is no verdict for a message.
+MISS = object()
+
+
+class VerdictCache:
+    """LRU map from (plan, message content) to the first content rule that matched."""
+
+    def __init__(self, max_entries=10_000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    @staticmethod
+    def _key(plan, features):
+        return (id(plan), features.digest, features.filenames, features.mentions)
+
+    def get(self, plan, features):
+        """Return the cached rule name (None if nothing matched), or MISS."""
+        key = self._key(plan, features)
+        entry = self._entries.get(key)
+        # The id of a plan that was garbage collected can be reused.
+        if entry is None or entry[0] is not plan:
+            self.misses += 1
+            return MISS
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, plan, features, rule_name):
+        entries = self._entries
+        entries[self._key(plan, features)] = (plan, rule_name)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+
+    def clear(self):
+        self._entries.clear()
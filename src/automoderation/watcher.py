@@ -0,0 +1,95 @@
+"""Reload automod config when its files change on disk.
+
+``ConfigWatcher`` polls the modification time and size of the default
+config and every guild override file. Polling and reloading both run in
+worker threads, so a slow disk never stalls the event loop (and with it
+gateway heartbeats). A change is only applied once the files have stopped
+changing for ``debounce`` seconds, so an editor or the web panel writing
+in several steps triggers one reload instead of several.
+
+With a config store the watcher also polls the store's version, so
+commits from the web panel are picked up the same way.
+"""
+import asyncio
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+# Snapshot key for the config store's version.
+STORE = "store"
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+
+class ConfigWatcher:
+    def __init__(self, automod, interval=2.0, debounce=1.0):
+        self.automod = automod
+        self.interval = interval
+        self.debounce = debounce
+        self._task = None
+
+    def snapshot(self):
+        """Stat every watched file. Blocking; runs in a worker thread."""
+        files = {None: _stat(self.automod.config_path)}
+        if self.automod.config_store is not None:
+            files[STORE] = self.automod.config_store.version()
+        for guild_id, path in self.automod.guild_configs.list_files().items():
+            files[guild_id] = _stat(path)
+        return files
+
+    def start(self):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        last = await asyncio.to_thread(self.snapshot)
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                current = await asyncio.to_thread(self.snapshot)
+                if current == last:
+                    continue
+                current = await self._settle(current)
+                await self.apply(last, current)
+                last = current
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.exception(f"Config watcher failed: {e}")
+
+    async def _settle(self, current):
+        """Wait until two snapshots ``debounce`` seconds apart agree."""
+        while True:
+            await asyncio.sleep(self.debounce)
+            settled = await asyncio.to_thread(self.snapshot)
+            if settled == current:
+                return settled
+            current = settled
+
+    async def apply(self, before, after):
+        """Reload whatever differs between two snapshots."""
+        if before.get(None) != after.get(None) or before.get(STORE) != after.get(STORE):
+            logger.info("Automod config changed, reloading.")
+            # Reloading the default also recompiles every cached guild.
+            await self.automod.reload_config()
+            return
+        for guild_id in set(before) | set(after):
+            if guild_id not in (None, STORE) and before.get(guild_id) != after.get(guild_id):
+                logger.info(f"Automod config for guild {guild_id} changed on disk, reloading.")
+                await self.automod.reload_guild(guild_id)
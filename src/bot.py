@@ -1,11 +1,15 @@
+import asyncio
 import os
+import time
 import discord
 from discord.ext import commands
 from dotenv import load_dotenv
 import logging
 from commands import *
-from automoderation import AutoModCog
-from join_roles import JoinRoleManager
+from utils.command_tree import sync_if_changed
+from utils.event_recorder import EventRecorder
+
+STARTED_AT = time.perf_counter()
 
 # Load environment variables
 load_dotenv()
@@ -17,28 +21,126 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Setup bot intents
-intents = discord.Intents.all()
+# Cog packages, imported and set up concurrently in setup_hook.
+EXTENSIONS = ("automoderation", "join_roles")
+# Fingerprint of the last synced slash command tree; delete it to force a sync.
+COMMAND_TREE_CACHE = os.getenv("COMMAND_TREE_CACHE") or os.path.join(os.path.dirname(__file__), "..", "data", "command_tree.sha256")
 
-bot = commands.Bot(command_prefix='/', intents=intents)
+def build_intents(production):
+    """Return the gateway intents to subscribe to.
 
-@bot.event
-async def on_ready():
-    logger.info(f'Logged in as {bot.user.name} - {bot.user.id}')
-    
-    # Setup cogs AFTER the bot is ready
-    await setup_bot()
-    
+    Production only asks for what the cogs handle: guild messages and their
+    content (automod) and member joins (join roles, raid detection). Presence
+    and typing updates are never delivered, which cuts gateway traffic and
+    decoding work considerably in large guilds.
+    """
+    if not production:
+        return discord.Intents.all()
+    intents = discord.Intents.none()
+    intents.guilds = True
+    intents.guild_messages = True
+    intents.message_content = True
+    intents.members = True
+    return intents
+
+def build_member_cache_flags():
+    """Return which members production keeps in memory.
+
+    Moderation acts on members from event payloads, so there is no need to
+    keep every guild member or to request them at startup. Members who join
+    while the bot runs are cached, though: discord.py only dispatches
+    on_member_update for cached members, and JoinRoleManager relies on it to
+    give verified-only roles once a new member passes membership screening.
+    """
+    flags = discord.MemberCacheFlags.none()
+    flags.joined = True
+    return flags
+
+def create_bot():
+    """Build the bot for the run mode selected by BOT_MODE.
+
+    BOT_MODE=production runs an AutoShardedBot with trimmed intents. The
+    shard layout comes from SHARD_COUNT (unset lets Discord recommend one)
+    and, when several processes split the shards, SHARD_IDS (e.g. "0,1").
+    """
+    production = os.getenv('BOT_MODE', 'development') == 'production'
+    intents = build_intents(production)
+    if not production:
+        return commands.Bot(command_prefix='/', intents=intents)
+
+    shard_count = os.getenv('SHARD_COUNT')
+    shard_ids = os.getenv('SHARD_IDS')
+    max_messages = os.getenv('MESSAGE_CACHE_SIZE')
+    return commands.AutoShardedBot(
+        command_prefix='/',
+        intents=intents,
+        shard_count=int(shard_count) if shard_count else None,
+        shard_ids=[int(i) for i in shard_ids.split(',')] if shard_ids else None,
+        member_cache_flags=build_member_cache_flags(),
+        chunk_guilds_at_startup=False,
+        max_messages=int(max_messages) if max_messages else 1000,
+    )
+
+bot = create_bot()
+
+async def setup_hook():
+    """Load the cogs and sync slash commands, once per process.
+
+    discord.py runs this after login and before connecting to the gateway,
+    unlike on_ready, which fires again after every reconnect.
+    """
+    started = time.perf_counter()
+    results = await asyncio.gather(
+        *(bot.load_extension(name) for name in EXTENSIONS), return_exceptions=True
+    )
+    for name, result in zip(EXTENSIONS, results):
+        if isinstance(result, BaseException):
+            logger.error(f"Failed to load extension {name}: {result}")
+    logger.info(f"Cogs loaded in {time.perf_counter() - started:.2f}s")
+    # Gateway traffic for benchmarks/replay.py.
+    record_path = os.getenv("RECORD_EVENTS")
+    if record_path:
+        await bot.add_cog(EventRecorder(bot, record_path))
+
+    started = time.perf_counter()
     try:
-        synced = await bot.tree.sync()
-        logger.info(f"Synced {len(synced)} command(s)")
+        synced = await sync_if_changed(bot.tree, COMMAND_TREE_CACHE)
+        if synced is not None:
+            logger.info(f"Synced {len(synced)} command(s) in {time.perf_counter() - started:.2f}s")
     except Exception as e:
         logger.error(f"Failed to sync commands: {e}")
 
-async def setup_bot():
-    await bot.add_cog(AutoModCog(bot))
-    await bot.add_cog(JoinRoleManager(bot))
-    logger.info("Cogs loaded successfully")
+bot.setup_hook = setup_hook
+
+# perf_counter() of the first disconnect since the bot was last ready, to time reconnects.
+_disconnected_at = None
+_started = False
+
+@bot.event
+async def on_ready():
+    # Also fires after a reconnect that could not resume the session; there
+    # is nothing to set up again, so only report how long it took.
+    global _started
+    if not _started:
+        _started = True
+        logger.info(f'Logged in as {bot.user.name} - {bot.user.id}; ready {time.perf_counter() - STARTED_AT:.2f}s after start')
+    _log_reconnect("Reconnected")
+
+@bot.event
+async def on_resumed():
+    _log_reconnect("Resumed")
+
+@bot.event
+async def on_disconnect():
+    global _disconnected_at
+    if _disconnected_at is None:
+        _disconnected_at = time.perf_counter()
+
+def _log_reconnect(what):
+    global _disconnected_at
+    if _disconnected_at is not None:
+        logger.info(f"{what} {time.perf_counter() - _disconnected_at:.2f}s after disconnecting")
+        _disconnected_at = None
 
 @bot.event
 async def on_member_join(member):
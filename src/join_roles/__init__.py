@@ -2,39 +2,165 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import logging
+import os
+from typing import Literal
+
+from .pipeline import JoinPipeline
+from .store import JoinRole, JoinRoleStore
 
 logger = logging.getLogger(__name__)
 
+# Where the guild -> join roles mapping is persisted.
+DB_FILE = os.getenv("JOIN_ROLES_DB") or os.path.join(os.path.dirname(__file__), "..", "..", "data", "join_roles.db")
+
 class JoinRoleManager(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
-        self.default_role = None  # This will be set by configuration
+        self.store = JoinRoleStore(DB_FILE)
+        # Guilds without configured roles fall back to a role named "Member";
+        # its id is remembered per guild so the role list is scanned only once.
+        self._fallback_roles = {}
+        self.pipeline = JoinPipeline(self.resolve_roles, raid_settings=self._raid_settings)
+
+    async def cog_load(self):
+        self.pipeline.start()
+
+    async def cog_unload(self):
+        await self.pipeline.stop()
+
+    def _raid_settings(self, guild_id):
+        """Raid mode follows the guild's automod raid_rule when automod is loaded."""
+        cog = self.bot.get_cog("AutoModCog")
+        return cog.automod.guild_configs.get(guild_id).raid if cog is not None else None
+
+    async def resolve_roles(self, member):
+        """Return the roles a new member should receive"""
+        guild = member.guild
+        join_roles = await self.store.get(guild.id)
+        if not join_roles:
+            return self._fallback_role(guild)
+        # Members still in membership screening only get roles that don't
+        # require verification; the rest follow in on_member_update.
+        if getattr(member, "pending", False):
+            join_roles = [r for r in join_roles if not r.verified_only]
+        return self._guild_roles(guild, join_roles)
+
+    async def verified_roles(self, member):
+        """Return the join roles held back until a member passes screening"""
+        join_roles = await self.store.get(member.guild.id)
+        return self._guild_roles(member.guild, [r for r in join_roles if r.verified_only])
+
+    @staticmethod
+    def _guild_roles(guild, join_roles):
+        roles = []
+        for join_role in join_roles:
+            role = guild.get_role(join_role.role_id)
+            if role is not None:
+                roles.append(role)
+        return roles
+
+    def _fallback_role(self, guild):
+        role_id = self._fallback_roles.get(guild.id)
+        role = guild.get_role(role_id) if role_id is not None else None
+        if role is None:
+            # Not created yet, or deleted since: look it up by name again.
+            role = discord.utils.get(guild.roles, name="Member")
+            if role is None:
+                self._fallback_roles.pop(guild.id, None)
+                return []
+            self._fallback_roles[guild.id] = role.id
+        return [role]
 
     @commands.Cog.listener()
     async def on_member_join(self, member):
         """Event handler for when a member joins the server"""
-        try:
-            # For now, let's get the first role named 'Member' as default
-            if not self.default_role:
-                self.default_role = discord.utils.get(member.guild.roles, name="Member")
-            
-            if self.default_role:
-                await member.add_roles(self.default_role)
-                logger.info(f"Added role {self.default_role.name} to {member.name}")
-            else:
-                logger.warning(f"No default role found for {member.guild.name}")
-        except Exception as e:
-            logger.error(f"Error assigning role to {member.name}: {e}")
+        # Role assignment happens in the pipeline's workers so a flood of
+        # joins never backs up the event handler.
+        self.pipeline.submit(member)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, before, after):
+        """Give verification-gated roles once a member passes screening"""
+        if before.pending and not after.pending:
+            # The other join roles were given when the member joined.
+            roles = await self.verified_roles(after)
+            if roles:
+                self.pipeline.submit(after, count_join=False, roles=roles)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        self.store.forget(guild.id)
+        self._fallback_roles.pop(guild.id, None)
+
+    @commands.Cog.listener()
+    async def on_raid_detected(self, guild, report):
+        """Hold new members while the automod raid detector reports a raid"""
+        self.pipeline.enter_raid_mode(guild.id, reason="raid detector")
 
     @app_commands.command(name="set_join_role", description="Set the default role for new members")
     @app_commands.default_permissions(administrator=True)
-    async def set_join_role(self, interaction: discord.Interaction, role: discord.Role):
-        """Set the default role that will be assigned to new members"""
-        self.default_role = role
+    async def set_join_role(self, interaction: discord.Interaction, role: discord.Role, verified_only: bool = False):
+        """Replace this server's join roles with a single role"""
+        await self.store.set(interaction.guild_id, [JoinRole(role.id, verified_only)])
         await interaction.response.send_message(
             f"Default role set to {role.name}",
             ephemeral=True
         )
 
-def setup(bot):
-    bot.add_cog(JoinRoleManager(bot))
\ No newline at end of file
+    @app_commands.command(name="add_join_role", description="Add a role given to new members")
+    @app_commands.default_permissions(administrator=True)
+    async def add_join_role(self, interaction: discord.Interaction, role: discord.Role, verified_only: bool = False):
+        roles = await self.store.add(interaction.guild_id, JoinRole(role.id, verified_only))
+        await interaction.response.send_message(
+            f"Added {role.name}; new members now get {len(roles)} role(s).",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="remove_join_role", description="Stop giving a role to new members")
+    @app_commands.default_permissions(administrator=True)
+    async def remove_join_role(self, interaction: discord.Interaction, role: discord.Role):
+        roles = await self.store.remove(interaction.guild_id, role.id)
+        await interaction.response.send_message(
+            f"Removed {role.name}; new members now get {len(roles)} role(s).",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="join_roles", description="List the roles given to new members")
+    @app_commands.default_permissions(administrator=True)
+    async def join_roles(self, interaction: discord.Interaction):
+        roles = await self.store.get(interaction.guild_id)
+        if not roles:
+            message = 'No join roles set; members get the "Member" role if it exists.'
+        else:
+            message = "\n".join(
+                f"<@&{r.role_id}>" + (" (after verification)" if r.verified_only else "") for r in roles
+            )
+        await interaction.response.send_message(message, ephemeral=True)
+
+    @app_commands.command(name="raid_status", description="Show raid mode and held members for this server")
+    @app_commands.default_permissions(ban_members=True)
+    async def raid_status(self, interaction: discord.Interaction):
+        status = self.pipeline.status(interaction.guild_id)
+        await interaction.response.send_message(
+            f"**Raid mode:** {'on' if status['raid_mode'] else 'off'}\n"
+            f"**Held members:** {status['held']}\n"
+            f"**Flagged members:** {status['flagged']}\n"
+            f"**Queued role assignments:** {status['queued']}",
+            ephemeral=True
+        )
+
+    @app_commands.command(name="raid_release", description="End raid mode and give held members their roles")
+    @app_commands.default_permissions(ban_members=True)
+    async def raid_release(self, interaction: discord.Interaction):
+        released = self.pipeline.release(interaction.guild_id)
+        await interaction.response.send_message(f"Released {released} member(s).", ephemeral=True)
+
+    @app_commands.command(name="raid_purge", description="Kick or ban every member flagged during a raid")
+    @app_commands.default_permissions(ban_members=True)
+    async def raid_purge(self, interaction: discord.Interaction, action: Literal["kick", "ban"]):
+        await interaction.response.defer(ephemeral=True, thinking=True)
+        removed = await self.pipeline.purge(interaction.guild, action=action)
+        await interaction.followup.send(f"Removed {removed} flagged member(s) ({action}).", ephemeral=True)
+
+async def setup(bot):
+    await bot.add_cog(JoinRoleManager(bot))
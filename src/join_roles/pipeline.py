@@ -0,0 +1,311 @@
+"""Queued role assignment for new members, with a raid mode.
+
+``JoinPipeline.submit`` is all the ``on_member_join`` listener does: it
+counts the join and queues the member, so the listener returns at once no
+matter how many members arrive. A fixed pool of workers assigns roles;
+assignments within one guild share a rate limit bucket on Discord's side,
+so they are serialized per guild and spaced ``min_interval`` seconds apart,
+backing off for ``Retry-After`` when Discord answers with a 429. A member
+still rate limited after ``MAX_RETRIES`` retries is held and queued again
+by the monitor, so a bucket that stays limited never ties up a worker.
+
+When more than ``raid_threshold`` members join a guild within
+``raid_window`` seconds the guild enters raid mode: auto-roles are paused
+and new members are held instead. Members that look like throwaway
+accounts are flagged so moderators can kick or ban them in bulk. Every
+join during raid mode extends it, so like the raid detector it ends once
+the guild has had no joins for ``raid_cooldown`` seconds; unflagged
+members are then released, flagged ones stay held until a moderator
+decides.
+
+``raid_settings``, if given, maps a guild id to that guild's automod raid
+settings (``hold_joins``, ``join_window`` and ``cooldown``), which then
+replace the three constructor defaults.
+"""
+import asyncio
+import inspect
+from collections import deque
+from datetime import datetime, timezone
+import logging
+import time
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+# Discord accepts at most this many users per bulk ban request.
+BULK_BAN_LIMIT = 200
+# 429s retried in place before the member is held for the monitor to requeue.
+MAX_RETRIES = 3
+# Used when a 429 carries no usable Retry-After header.
+DEFAULT_RETRY_AFTER = 1.0
+
+
+def _merge_roles(a, b):
+    """Combine two role lists, where None means "resolve them all"."""
+    if a is None or b is None:
+        return None
+    return list(dict.fromkeys([*a, *b]))
+
+
+def _retry_after(error):
+    """Return how many seconds a 429 asked us to wait."""
+    if isinstance(error, discord.RateLimited):
+        return error.retry_after
+    headers = getattr(error.response, "headers", None) or {}
+    try:
+        return float(headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
+
+
+class _GuildState:
+    __slots__ = ("joins", "raid_until", "held", "flagged", "next_slot", "lock")
+
+    def __init__(self, threshold):
+        self.joins = deque(maxlen=threshold)
+        self.raid_until = 0.0
+        # member id -> (member, roles), as for the queue.
+        self.held = {}
+        self.flagged = {}
+        self.next_slot = 0.0
+        self.lock = asyncio.Lock()
+
+
+class JoinPipeline:
+    def __init__(self, resolve_roles, workers=4, min_interval=0.25, raid_threshold=10, raid_window=10,
+                 raid_cooldown=300, min_account_age_days=7, max_queue=10_000, max_held=5_000,
+                 raid_settings=None, clock=time.monotonic):
+        self.resolve_roles = resolve_roles
+        self.workers = workers
+        self.min_interval = min_interval
+        self.raid_threshold = raid_threshold
+        self.raid_window = raid_window
+        self.raid_cooldown = raid_cooldown
+        self.raid_settings = raid_settings
+        self.min_account_age_days = min_account_age_days
+        self.max_held = max_held
+        self.clock = clock
+        self._queue = asyncio.Queue(maxsize=max_queue)
+        self._guilds = {}
+        self._tasks = []
+
+    def _state(self, guild_id):
+        state = self._guilds.get(guild_id)
+        if state is None:
+            state = self._guilds[guild_id] = _GuildState(self.raid_threshold)
+        return state
+
+    def _limits(self, guild_id):
+        """Return the raid threshold, window and cooldown for a guild."""
+        settings = self.raid_settings(guild_id) if self.raid_settings is not None else None
+        if settings is None:
+            return self.raid_threshold, self.raid_window, self.raid_cooldown
+        return settings.hold_joins, settings.join_window, settings.cooldown
+
+    @property
+    def depth(self):
+        return self._queue.qsize()
+
+    def in_raid_mode(self, guild_id):
+        state = self._guilds.get(guild_id)
+        return state is not None and state.raid_until > self.clock()
+
+    def enter_raid_mode(self, guild_id, reason="join rate"):
+        state = self._state(guild_id)
+        if state.raid_until <= self.clock():
+            logger.warning(f"Raid mode enabled for guild {guild_id} ({reason}); pausing auto-roles.")
+        state.raid_until = self.clock() + self._limits(guild_id)[2]
+
+    def is_suspicious(self, member):
+        """Flag accounts that are very new or still have the default avatar."""
+        created_at = getattr(member, "created_at", None)
+        if created_at is not None:
+            age = datetime.now(timezone.utc) - created_at
+            if age.days < self.min_account_age_days:
+                return True
+        return getattr(member, "avatar", None) is None
+
+    def submit(self, member, count_join=True, roles=None):
+        """Record a join and queue the member. Never blocks.
+
+        Pass ``count_join=False`` to queue a member for roles again without
+        counting it towards the raid threshold (e.g. after verification),
+        and ``roles`` to give only those roles instead of resolving them.
+        """
+        guild_id = member.guild.id
+        state = self._state(guild_id)
+        now = self.clock()
+        if count_join:
+            threshold, window, cooldown = self._limits(guild_id)
+            if state.joins.maxlen != threshold:
+                state.joins = deque(state.joins, maxlen=threshold)
+            state.joins.append(now)
+            if state.raid_until > now:
+                # The raid goes on while members keep arriving.
+                state.raid_until = now + cooldown
+            elif len(state.joins) == threshold and now - state.joins[0] <= window:
+                self.enter_raid_mode(guild_id)
+
+        if state.raid_until > now:
+            self._hold(state, member, roles)
+            return
+        try:
+            self._queue.put_nowait((member, roles))
+        except asyncio.QueueFull:
+            logger.warning(f"Join queue full; holding {member} in guild {guild_id}")
+            self._hold(state, member, roles)
+
+    def _hold(self, state, member, roles=None, flag=True):
+        for held in (state.held, state.flagged):
+            previous = held.get(member.id)
+            if previous is not None:
+                # Already held, e.g. since joining; it gets both sets of roles.
+                held[member.id] = (member, _merge_roles(previous[1], roles))
+                return
+        if len(state.held) + len(state.flagged) >= self.max_held:
+            logger.warning(f"Too many held members in guild {member.guild.id}; not holding {member}")
+            return
+        if flag and self.is_suspicious(member):
+            state.flagged[member.id] = (member, roles)
+        else:
+            state.held[member.id] = (member, roles)
+
+    def start(self):
+        if self._tasks:
+            return
+        loop = asyncio.get_running_loop()
+        self._tasks = [loop.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(loop.create_task(self._monitor()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def join(self):
+        """Wait until every queued member has been processed."""
+        await self._queue.join()
+
+    async def _worker(self):
+        while True:
+            member, roles = await self._queue.get()
+            try:
+                await self._assign(member, roles)
+            except Exception as e:
+                logger.error(f"Error assigning role to {member}: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _assign(self, member, roles=None):
+        state = self._state(member.guild.id)
+        if state.raid_until > self.clock():
+            # Raid mode started after this member was queued.
+            self._hold(state, member, roles)
+            return
+        if roles is None:
+            roles = self.resolve_roles(member)
+            if inspect.isawaitable(roles):
+                roles = await roles
+        if not roles:
+            logger.warning(f"No join role configured for {member.guild.name}")
+            return
+        async with state.lock:
+            for attempt in range(MAX_RETRIES + 1):
+                delay = state.next_slot - self.clock()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                try:
+                    await member.add_roles(*roles, reason="Join role")
+                    break
+                except (discord.HTTPException, discord.RateLimited) as e:
+                    if isinstance(e, discord.HTTPException) and e.status != 429:
+                        raise
+                    # Retried in place: during a raid the queue may be full.
+                    state.next_slot = self.clock() + _retry_after(e)
+            else:
+                logger.warning(f"Still rate limited after {MAX_RETRIES} retries; holding {member} in guild "
+                               f"{member.guild.id}")
+                # Not a raid: flagging would keep the member from their roles.
+                self._hold(state, member, roles, flag=False)
+                return
+            state.next_slot = self.clock() + self.min_interval
+        logger.info(f"Added role(s) {', '.join(r.name for r in roles)} to {member.name}")
+
+    async def _monitor(self):
+        while True:
+            await asyncio.sleep(1)
+            now = self.clock()
+            for guild_id, state in list(self._guilds.items()):
+                if state.held and state.raid_until <= now:
+                    logger.info(f"Raid mode over for guild {guild_id}; releasing {len(state.held)} held member(s).")
+                    self.release(guild_id, include_flagged=False)
+                elif self._idle(state, now, self._limits(guild_id)[1]):
+                    del self._guilds[guild_id]
+
+    @staticmethod
+    def _idle(state, now, window):
+        """Whether a guild's state can be dropped without losing anything."""
+        return (not state.held and not state.flagged and state.raid_until <= now and not state.lock.locked()
+                and state.next_slot <= now and (not state.joins or now - state.joins[-1] > window))
+
+    def release(self, guild_id, include_flagged=True):
+        """End raid mode and queue held members for their roles."""
+        state = self._state(guild_id)
+        state.raid_until = 0.0
+        entries = list(state.held.values())
+        state.held.clear()
+        if include_flagged:
+            entries.extend(state.flagged.values())
+            state.flagged.clear()
+        for member, roles in entries:
+            try:
+                self._queue.put_nowait((member, roles))
+            except asyncio.QueueFull:
+                state.held[member.id] = (member, roles)
+        return len(entries)
+
+    async def purge(self, guild, action="kick", reason="Raid cleanup"):
+        """Kick or ban every flagged member of ``guild``. Returns how many were removed."""
+        state = self._state(guild.id)
+        members = [member for member, _ in state.flagged.values()]
+        state.flagged.clear()
+        if not members:
+            return 0
+        if action == "ban" and hasattr(guild, "bulk_ban"):
+            banned = 0
+            for start in range(0, len(members), BULK_BAN_LIMIT):
+                result = await guild.bulk_ban(members[start:start + BULK_BAN_LIMIT], reason=reason)
+                banned += len(result.banned)
+            return banned
+
+        semaphore = asyncio.Semaphore(self.workers)
+
+        async def remove(member):
+            async with semaphore:
+                try:
+                    if action == "ban":
+                        await guild.ban(member, reason=reason)
+                    else:
+                        await member.kick(reason=reason)
+                except discord.NotFound:
+                    return False
+                except discord.HTTPException as e:
+                    logger.warning(f"Failed to {action} {member.name} in {guild.name}: {e}")
+                    return False
+                return True
+
+        results = await asyncio.gather(*(remove(member) for member in members))
+        return sum(results)
+
+    def status(self, guild_id):
+        state = self._guilds.get(guild_id)
+        if state is None:
+            return {"raid_mode": False, "held": 0, "flagged": 0, "queued": self.depth}
+        return {
+            "raid_mode": state.raid_until > self.clock(),
+            "held": len(state.held),
+            "flagged": len(state.flagged),
+            "queued": self.depth,
+        }
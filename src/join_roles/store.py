@@ -0,0 +1,123 @@
+"""Persistent guild -> join roles mapping.
+
+Mappings live in a small SQLite database and are cached in memory per
+guild the first time a guild needs them. All database work runs in a
+worker thread, so neither lookups on a cold cache nor writes from slash
+commands block the event loop.
+"""
+import asyncio
+from collections import namedtuple
+from contextlib import asynccontextmanager, closing
+import logging
+import os
+import sqlite3
+
+logger = logging.getLogger(__name__)
+
+# A role given to new members; verified_only roles wait until the member
+# has passed the server's membership screening.
+JoinRole = namedtuple("JoinRole", ["role_id", "verified_only"])
+
+
+class _GuildLock:
+    __slots__ = ("lock", "users")
+
+    def __init__(self):
+        self.lock = asyncio.Lock()
+        # Operations holding or waiting for the lock; it is dropped at zero.
+        self.users = 0
+
+
+class JoinRoleStore:
+    def __init__(self, path):
+        self.path = path
+        self._cache = {}
+        # Serializes database work per guild, so a slow load can never
+        # overwrite the cache with rows older than a write's.
+        self._locks = {}
+        self._initialized = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialized:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS join_roles ("
+                " guild_id INTEGER NOT NULL, role_id INTEGER NOT NULL,"
+                " verified_only INTEGER NOT NULL DEFAULT 0,"
+                " PRIMARY KEY (guild_id, role_id))"
+            )
+            self._initialized = True
+        return conn
+
+    def _load(self, guild_id):
+        if not os.path.exists(self.path):
+            return ()
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT role_id, verified_only FROM join_roles WHERE guild_id = ? ORDER BY role_id",
+                (guild_id,),
+            ).fetchall()
+        return tuple(JoinRole(role_id, bool(verified_only)) for role_id, verified_only in rows)
+
+    def _write(self, guild_id, roles, replace):
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            if replace:
+                conn.execute("DELETE FROM join_roles WHERE guild_id = ?", (guild_id,))
+            conn.executemany(
+                "INSERT INTO join_roles (guild_id, role_id, verified_only) VALUES (?, ?, ?)"
+                " ON CONFLICT (guild_id, role_id) DO UPDATE SET verified_only = excluded.verified_only",
+                [(guild_id, role.role_id, int(role.verified_only)) for role in roles],
+            )
+        return self._load(guild_id)
+
+    def _delete(self, guild_id, role_id):
+        if not os.path.exists(self.path):
+            return ()
+        with closing(self._connect()) as conn, conn:
+            conn.execute("DELETE FROM join_roles WHERE guild_id = ? AND role_id = ?", (guild_id, role_id))
+        return self._load(guild_id)
+
+    @asynccontextmanager
+    async def _locked(self, guild_id):
+        entry = self._locks.get(guild_id)
+        if entry is None:
+            entry = self._locks[guild_id] = _GuildLock()
+        entry.users += 1
+        try:
+            async with entry.lock:
+                yield
+        finally:
+            entry.users -= 1
+            if not entry.users:
+                del self._locks[guild_id]
+
+    async def get(self, guild_id):
+        """Return the JoinRoles for a guild, loading them on first use."""
+        roles = self._cache.get(guild_id)
+        if roles is None:
+            async with self._locked(guild_id):
+                roles = self._cache.get(guild_id)
+                if roles is None:
+                    roles = self._cache[guild_id] = await asyncio.to_thread(self._load, guild_id)
+        return roles
+
+    async def set(self, guild_id, roles):
+        """Replace a guild's join roles."""
+        async with self._locked(guild_id):
+            self._cache[guild_id] = await asyncio.to_thread(self._write, guild_id, roles, True)
+            return self._cache[guild_id]
+
+    async def add(self, guild_id, role):
+        async with self._locked(guild_id):
+            self._cache[guild_id] = await asyncio.to_thread(self._write, guild_id, [role], False)
+            return self._cache[guild_id]
+
+    async def remove(self, guild_id, role_id):
+        async with self._locked(guild_id):
+            self._cache[guild_id] = await asyncio.to_thread(self._delete, guild_id, role_id)
+            return self._cache[guild_id]
+
+    def forget(self, guild_id):
+        """Drop a guild from the in-memory cache, e.g. when the bot leaves it."""
+        self._cache.pop(guild_id, None)
@@ -0,0 +1,56 @@
+"""Skip slash command syncs that would not change anything.
+
+``CommandTree.sync`` uploads every global command definition and is
+heavily rate limited, so it should only run when the definitions changed.
+``sync_if_changed`` hashes the payload ``sync`` would send, together with
+the application id, and compares it with the hash saved by the last
+successful sync. The hash is written only after Discord accepted the
+sync, so a failed sync is retried on the next start; deleting the file
+forces one.
+"""
+import hashlib
+import json
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+
+def tree_fingerprint(tree):
+    """Hash of the global command definitions ``tree.sync()`` would upload."""
+    payload = sorted(
+        (command.to_dict(tree) for command in tree.get_commands()),
+        key=lambda command: (command.get("type", 1), command["name"]),
+    )
+    data = json.dumps([tree.client.application_id, payload], sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def _read(path):
+    try:
+        with open(path, "r") as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        return None
+
+
+def _write(path, fingerprint):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        f.write(fingerprint)
+    os.replace(tmp, path)
+
+
+async def sync_if_changed(tree, path):
+    """Sync ``tree`` unless its definitions match the last successful sync.
+
+    Returns the synced commands, or None if the sync was skipped.
+    """
+    fingerprint = tree_fingerprint(tree)
+    if _read(path) == fingerprint:
+        logger.info("Command tree unchanged; skipping sync")
+        return None
+    synced = await tree.sync()
+    _write(path, fingerprint)
+    return synced
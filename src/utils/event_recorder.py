@@ -0,0 +1,146 @@
+"""Record gateway events for replaying offline.
+
+With ``RECORD_EVENTS`` set, the bot writes every message, message edit
+and member join it sees to a gzipped JSON Lines file, one small object per
+event with only the fields the cogs look at.
+``benchmarks/replay.py`` plays such a file back into the cogs at any
+speed to measure how a deployment copes with that traffic.
+
+Recordings contain message content; treat them like the logs they came
+from.
+
+Events are buffered in memory and appended to the file once a second
+from a worker thread, so recording never blocks the event loop. Each
+flush appends a new gzip member, and readers handle those transparently.
+"""
+import asyncio
+import gzip
+import json
+import logging
+import time
+
+import discord
+from discord.ext import commands
+
+logger = logging.getLogger(__name__)
+
+FORMAT = "automod-events"
+VERSION = 1
+
+
+def message_event(message, t, kind="message"):
+    guild = message.guild
+    return {
+        "type": kind,
+        "t": t,
+        "id": message.id,
+        "guild": guild.id if guild is not None else None,
+        "channel": message.channel.id,
+        "author": message.author.id,
+        "bot": message.author.bot,
+        "content": message.content,
+        "mentions": [m.id for m in message.mentions],
+        "attachments": [[a.filename, a.size] for a in message.attachments],
+    }
+
+
+def join_event(member, t):
+    return {
+        "type": "join",
+        "t": t,
+        "guild": member.guild.id,
+        "id": member.id,
+        "name": member.name,
+        "created": member.created_at.timestamp(),
+        "avatar": member.avatar is not None,
+        "bot": member.bot,
+        "pending": member.pending,
+    }
+
+
+def _header():
+    return json.dumps({"format": FORMAT, "version": VERSION, "started": time.time()}) + "\n"
+
+
+def write_events(path, events):
+    """Write a complete recording (header plus ``events``) to ``path``."""
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        f.write(_header())
+        for event in events:
+            f.write(json.dumps(event, separators=(",", ":")) + "\n")
+
+
+def read_events(path):
+    """Yield the events of a recording in order. The header is checked and skipped."""
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        header = json.loads(f.readline() or "{}")
+        if header.get("format") != FORMAT or header.get("version") != VERSION:
+            raise ValueError(f"{path} is not an event recording")
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+class EventRecorder(commands.Cog):
+    def __init__(self, bot, path, flush_interval=1.0):
+        self.bot = bot
+        self.path = path
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._started = time.monotonic()
+        self._task = None
+        self.recorded = 0
+
+    def _write(self, lines, mode="at"):
+        with gzip.open(self.path, mode, encoding="utf-8") as f:
+            f.writelines(lines)
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        lines, self._buffer = self._buffer, []
+        try:
+            await asyncio.to_thread(self._write, lines)
+        except OSError as e:
+            logger.error(f"Failed to write {len(lines)} recorded event(s): {e}")
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await asyncio.shield(self.flush())
+
+    async def cog_load(self):
+        # A new recording each run; the header goes first.
+        await asyncio.to_thread(self._write, [_header()], "wt")
+        self._task = asyncio.get_running_loop().create_task(self._run())
+        logger.info(f"Recording gateway events to {self.path}")
+
+    async def cog_unload(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"Recorded {self.recorded} gateway event(s) to {self.path}")
+
+    def _record(self, event):
+        self._buffer.append(json.dumps(event, separators=(",", ":")) + "\n")
+        self.recorded += 1
+
+    def _now(self):
+        return round(time.monotonic() - self._started, 4)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        self._record(message_event(message, self._now()))
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self._record(message_event(payload.message, self._now(), kind="edit"))
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self._record(join_event(member, self._now()))
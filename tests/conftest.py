@@ -0,0 +1,15 @@
+import pytest
+
+
+class FakeClock:
+    def __init__(self, now=0.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    """A monotonic clock stand-in; advance it by setting ``clock.now``."""
+    return FakeClock()
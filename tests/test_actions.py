@@ -0,0 +1,125 @@
+import asyncio
+from collections import namedtuple
+
+from src.automoderation.actions import ModerationQueue
+
+DummyAuthor = namedtuple("DummyAuthor", ["id", "mention"])
+DummyRule = namedtuple("DummyRule", ["warning"])
+
+
+class DummyChannel:
+    def __init__(self, id):
+        self.id = id
+        self.bulk_deleted = []
+        self.sent = []
+
+    async def delete_messages(self, messages):
+        self.bulk_deleted.append([m.id for m in messages])
+
+    async def send(self, content, delete_after=None):
+        self.sent.append(content)
+
+
+class DummyMessage:
+    def __init__(self, id, author, channel):
+        self.id = id
+        self.author = author
+        self.channel = channel
+        self.deleted = False
+
+    async def delete(self):
+        self.deleted = True
+
+
+def test_burst_is_coalesced_per_channel():
+    async def scenario():
+        queue = ModerationQueue(flush_delay=0.01)
+        channel_a, channel_b = DummyChannel(1), DummyChannel(2)
+        spammer = DummyAuthor(id=10, mention="<@10>")
+        messages = [DummyMessage(i, spammer, channel_a) for i in range(5)]
+        for message in messages:
+            queue.enqueue(message, DummyRule("slow down!"))
+        single = DummyMessage(99, spammer, channel_b)
+        queue.enqueue(single, DummyRule("no links!"))
+        assert queue.depth == 6
+        await asyncio.sleep(0.05)
+        await queue.close()
+        return channel_a, channel_b, single, queue
+
+    channel_a, channel_b, single, queue = asyncio.run(scenario())
+    assert channel_a.bulk_deleted == [[0, 1, 2, 3, 4]]
+    assert channel_a.sent == ["<@10>, slow down!"]
+    assert single.deleted and channel_b.bulk_deleted == []
+    assert queue.depth == 0
+
+
+def test_warnings_are_rate_limited_per_user():
+    async def scenario():
+        queue = ModerationQueue(flush_delay=0, warn_window=60)
+        channel = DummyChannel(1)
+        author = DummyAuthor(id=10, mention="<@10>")
+        queue.enqueue(DummyMessage(1, author, channel), DummyRule("a"))
+        queue.enqueue(DummyMessage(2, author, channel), DummyRule("b"))
+        await queue.flush()
+        queue.enqueue(DummyMessage(3, author, channel), DummyRule("a"))
+        await queue.close()
+        return channel
+
+    channel = asyncio.run(scenario())
+    assert channel.sent == ["<@10>, a b"]
+
+
+def test_close_waits_for_a_flush_in_progress():
+    class SlowChannel(DummyChannel):
+        async def delete_messages(self, messages):
+            await asyncio.sleep(0.05)
+            await super().delete_messages(messages)
+
+    async def scenario():
+        queue = ModerationQueue(flush_delay=0)
+        channel = SlowChannel(1)
+        author = DummyAuthor(id=10, mention="<@10>")
+        for i in range(3):
+            queue.enqueue(DummyMessage(i, author, channel), DummyRule("a"))
+        await asyncio.sleep(0.01)
+        await queue.close()
+        return channel, queue
+
+    channel, queue = asyncio.run(scenario())
+    assert channel.bulk_deleted == [[0, 1, 2]] and channel.sent == ["<@10>, a"]
+    assert queue._channel_locks == {}
+
+
+def test_warnings_are_combined_and_do_not_hold_up_deletes():
+    class SlowSendChannel(DummyChannel):
+        async def send(self, content, delete_after=None):
+            await asyncio.sleep(0.2)
+            await super().send(content, delete_after)
+
+    async def scenario():
+        queue = ModerationQueue(flush_delay=0, max_concurrency=1)
+        channel = SlowSendChannel(1)
+        for user_id, message_id in ((10, 0), (11, 1)):
+            author = DummyAuthor(id=user_id, mention=f"<@{user_id}>")
+            queue.enqueue(DummyMessage(message_id, author, channel), DummyRule("slow down!"))
+        await queue.flush()
+        author = DummyAuthor(id=12, mention="<@12>")
+        for message_id in (2, 3):
+            queue.enqueue(DummyMessage(message_id, author, channel), DummyRule("no links!"))
+        # The first warning is still being sent; the delete goes ahead anyway.
+        await asyncio.wait_for(queue.flush(), 0.1)
+        deleted = list(channel.bulk_deleted)
+        await queue.close()
+        return deleted, channel
+
+    deleted, channel = asyncio.run(scenario())
+    assert deleted == [[0, 1], [2, 3]]
+    assert channel.sent == ["<@10> <@11>, slow down!", "<@12>, no links!"]
+
+
+def test_long_warning_lists_are_split():
+    from src.automoderation.actions import MESSAGE_LIMIT, _warning_messages
+    users = [(f"<@{1000000000000000000 + i}>", ["slow down!"]) for i in range(200)]
+    messages = list(_warning_messages(users))
+    assert len(messages) > 1 and all(len(m) <= MESSAGE_LIMIT for m in messages)
+    assert sum(m.count("<@") for m in messages) == 200
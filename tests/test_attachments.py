@@ -0,0 +1,163 @@
+import asyncio
+from collections import namedtuple
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from src.automoderation.attachments import AttachmentInspector, sniff
+from src.automoderation.rules import compile_rules
+
+Attachment = namedtuple("Attachment", ["filename", "url", "size"])
+
+EXE = b"MZ\x90\x00" + bytes(20_000)
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(20_000)
+
+
+class CDN:
+    """Stand-in for Discord's CDN that honours range requests and records them."""
+
+    def __init__(self, files, delay=0.0):
+        self.files = files
+        self.delay = delay
+        self.requests = []
+        self.active = 0
+        self.max_active = 0
+
+    async def handle(self, request):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await asyncio.sleep(self.delay)
+            self.requests.append((request.path, request.headers.get("Range")))
+            data = self.files[request.path.rsplit("/", 1)[-1]]
+            start, end = request.headers["Range"].removeprefix("bytes=").split("-")
+            return web.Response(body=data[int(start):int(end) + 1], status=206)
+        finally:
+            self.active -= 1
+
+
+async def serve(cdn):
+    app = web.Application()
+    app.router.add_get("/attachments/{channel}/{id}/{name}", cdn.handle)
+    server = TestServer(app)
+    await server.start_server()
+    return server
+
+
+def attachment(server, name, data, id=1):
+    return Attachment(name, str(server.make_url(f"/attachments/1/{id}/{name}?ex=abc&hm=def")), len(data))
+
+
+def test_sniff_known_signatures():
+    assert sniff(EXE) == "exe"
+    assert sniff(PNG) == "png"
+    assert sniff(b"RIFF\x00\x00\x00\x00WEBPVP8 ") == "webp"
+    assert sniff(b"hello world") is None
+
+
+def test_renamed_executable_is_detected_with_one_range_read():
+    cdn = CDN({"cat.png": EXE, "real.png": PNG, "copy.png": EXE})
+
+    async def scenario():
+        server = await serve(cdn)
+        inspector = AttachmentInspector(max_bytes=512)
+        try:
+            fake = attachment(server, "cat.png", EXE)
+            kinds = await inspector.inspect_many([fake, attachment(server, "real.png", PNG, id=2)])
+            # Same attachment with a freshly signed URL: answered from the cache.
+            again = await inspector.inspect(fake._replace(url=fake.url.replace("ex=abc", "ex=xyz")))
+            repost = await inspector.inspect(attachment(server, "copy.png", EXE, id=3))
+        finally:
+            await inspector.close()
+            await server.close()
+        return kinds, again, repost, inspector
+
+    kinds, again, repost, inspector = asyncio.run(scenario())
+    assert kinds == ["exe", "png"] and again == "exe" and repost == "exe"
+    assert len(cdn.requests) == 3 and inspector.fetches == 3
+    assert all(range_ == "bytes=0-511" for _, range_ in cdn.requests)
+
+    rule = compile_rules({"attachment_rule": {"blocked_filetypes": [".exe"], "inspect": True}}).get("attachment_rule")
+    assert rule.inspect and rule.blocks_type("exe") and not rule.blocks_type("png")
+
+
+def test_fetches_are_bounded_and_deduplicated():
+    files = {f"{i}.bin": PNG for i in range(20)}
+    cdn = CDN(files, delay=0.02)
+
+    async def scenario():
+        server = await serve(cdn)
+        inspector = AttachmentInspector(concurrency=3)
+        try:
+            attachments = [attachment(server, name, data, id=i) for i, (name, data) in enumerate(files.items())]
+            kinds = await inspector.inspect_many(attachments + attachments[:5])
+        finally:
+            await inspector.close()
+            await server.close()
+        return kinds
+
+    kinds = asyncio.run(scenario())
+    assert kinds == ["png"] * 25
+    assert len(cdn.requests) == 20
+    assert cdn.max_active <= 3
+
+
+def test_waiting_for_a_turn_does_not_count_towards_the_timeout():
+    files = {f"{i}.bin": EXE for i in range(5)}
+    cdn = CDN(files, delay=0.05)
+
+    async def scenario():
+        server = await serve(cdn)
+        inspector = AttachmentInspector(concurrency=1, timeout=0.2)
+        try:
+            attachments = [attachment(server, name, data, id=i) for i, (name, data) in enumerate(files.items())]
+            kinds = await inspector.inspect_many(attachments)
+        finally:
+            await inspector.close()
+            await server.close()
+        return kinds, inspector
+
+    kinds, inspector = asyncio.run(scenario())
+    assert kinds == ["exe"] * 5 and inspector.failures == 0
+
+
+def test_failed_fetch_is_not_cached():
+    cdn = CDN({})
+
+    async def scenario():
+        server = await serve(cdn)
+        inspector = AttachmentInspector()
+        try:
+            missing = attachment(server, "gone.png", PNG)
+            first = await inspector.inspect(missing)
+            second = await inspector.inspect(missing)
+        finally:
+            await inspector.close()
+            await server.close()
+        return first, second, inspector
+
+    first, second, inspector = asyncio.run(scenario())
+    assert first is None and second is None
+    assert inspector.failures == 2 and len(inspector) == 0
+
+
+def test_automod_blocks_by_detected_type(tmp_path):
+    from src.automoderation.automod import Automoderator
+
+    class FakeInspector:
+        async def inspect_many(self, attachments):
+            return ["exe" if a.filename == "cat.png" else "png" for a in attachments]
+
+    config = tmp_path / "automod.yaml"
+    config.write_text("attachment_rule: {blocked_filetypes: [.exe], inspect: true}\n")
+    automod = Automoderator(str(config))
+    automod.inspector = FakeInspector()
+    Message = namedtuple("Message", ["attachments"])
+
+    async def scenario():
+        blocked = await automod.inspect_attachments(Message([Attachment("cat.png", "", 0)]))
+        allowed = await automod.inspect_attachments(Message([Attachment("dog.png", "", 0)]))
+        return blocked, allowed
+
+    blocked, allowed = asyncio.run(scenario())
+    assert blocked.name == "attachment_rule" and allowed is None
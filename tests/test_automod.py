@@ -1,3 +1,4 @@
+import asyncio
 import os
 import tempfile
 import yaml
@@ -8,6 +9,8 @@ from collections import namedtuple
 # Dummy message and author for testing purpose
 DummyAuthor = namedtuple("DummyAuthor", ["id", "name"])
 DummyAttachment = namedtuple("DummyAttachment", ["filename"])
+DummyGuild = namedtuple("DummyGuild", ["id"])
+
 
 class DummyMessage:
     def __init__(self, content, author, attachments=None, mentions=None):
@@ -19,6 +22,7 @@ class DummyMessage:
 # Import our Automoderator from the source directory
 from src.automoderation.automod import Automoderator
 
+
 @pytest.fixture
 def config_file():
     # Create a temporary YAML config file
@@ -36,6 +40,7 @@ def config_file():
     yield temp.name
     os.remove(temp.name)
 
+
 def test_badword_rule(config_file):
     automod = Automoderator(config_file)
     author = DummyAuthor(id=1, name="TestUser")
@@ -43,13 +48,15 @@ def test_badword_rule(config_file):
     message = DummyMessage("This contains badword1", author)
     # We expect handle_warning to be called (here print to console)—for tests, you could mock handle_warning.
     automod.check_message(message)
-    
+
+
 def test_link_rule(config_file):
     automod = Automoderator(config_file)
     author = DummyAuthor(id=2, name="TestUser2")
     message = DummyMessage("Join discord.gg/someinvite", author)
     automod.check_message(message)
 
+
 def test_mass_mention_rule(config_file):
     automod = Automoderator(config_file)
     author = DummyAuthor(id=3, name="TestUser3")
@@ -58,6 +65,7 @@ def test_mass_mention_rule(config_file):
     message = DummyMessage("Hello", author, mentions=mentions)
     automod.check_message(message)
 
+
 def test_caps_rule(config_file):
     automod = Automoderator(config_file)
     author = DummyAuthor(id=4, name="TestUser4")
@@ -65,6 +73,7 @@ def test_caps_rule(config_file):
     message = DummyMessage("THIS IS WAY TOO LOUD", author)
     automod.check_message(message)
 
+
 def test_attachment_rule(config_file):
     automod = Automoderator(config_file)
     author = DummyAuthor(id=5, name="TestUser5")
@@ -73,6 +82,7 @@ def test_attachment_rule(config_file):
     message = DummyMessage("File attached", author, attachments=[attachment])
     automod.check_message(message)
 
+
 def test_spam_rule(config_file):
     automod = Automoderator(config_file)
     author = DummyAuthor(id=6, name="TestUser6")
@@ -80,4 +90,148 @@ def test_spam_rule(config_file):
 
     # Call check_message multiple times to simulate spam—use a short delay if needed.
     for _ in range(4):
-        automod.check_message(message)
\ No newline at end of file
+        automod.check_message(message)
+
+
+def test_evaluate_returns_matching_rule(config_file):
+    automod = Automoderator(config_file)
+    author = DummyAuthor(id=7, name="TestUser7")
+    assert automod.evaluate(DummyMessage("This contains BADWORD2", author)).name == "badword_rule"
+    assert automod.evaluate(DummyMessage("see bit.ly/x", author)).name == "link_blocking_rule"
+    attachment = DummyAttachment(filename="SETUP.EXE")
+    assert automod.evaluate(DummyMessage("file", author, attachments=[attachment])).name == "attachment_rule"
+    assert automod.evaluate(DummyMessage("hello there", author)) is None
+
+
+def test_batch_scan_matches_evaluate_without_side_effects(config_file):
+    automod = Automoderator(config_file)
+    author = DummyAuthor(id=10, name="TestUser10")
+    mentions = [DummyAuthor(id=i, name=f"User{i}") for i in range(3)]
+    messages = [
+        DummyMessage("This contains BADWORD2", author),
+        DummyMessage("hello there", author),
+        DummyMessage("see bit.ly/x", author),
+        DummyMessage("THIS IS WAY TOO LOUD", author),
+        DummyMessage("hi all", author, mentions=mentions),
+        DummyMessage("file", author, attachments=[DummyAttachment(filename="a.exe")]),
+    ] + [DummyMessage("same again", author) for _ in range(5)]
+    verdicts = list(automod.scan(messages, chunk_size=4))
+    assert [v.message for v in verdicts] == messages
+    names = [v.rule.name if v.rule else None for v in verdicts]
+    assert names == ["badword_rule", None, "link_blocking_rule", "caps_rule", "mass_mention_rule",
+                     "attachment_rule"] + [None] * 5
+    # The spam tracker saw nothing, so live messages are judged afresh.
+    assert len(automod.spam_tracker) == 0
+
+    async def history():
+        for message in messages:
+            yield message
+
+    async def collect():
+        return [v.rule async for v in automod.scan_async(history(), chunk_size=4)]
+
+    assert asyncio.run(collect()) == [v.rule for v in verdicts]
+
+
+def test_invalid_config_keeps_previous_plan(config_file):
+    automod = Automoderator(config_file)
+    plan = automod.plan
+    with open(config_file, "w") as f:
+        yaml.dump({"mass_mention_rule": {"max_mentions": "lots"}}, f)
+    assert automod.load_config() is False
+    assert automod.plan is plan
+
+
+def test_spam_is_tracked_per_guild(config_file):
+    automod = Automoderator(config_file)
+    author = DummyAuthor(id=8, name="TestUser8")
+    guild_a, guild_b = DummyGuild(id=100), DummyGuild(id=200)
+    verdicts = []
+    for guild in (guild_a, guild_b, guild_a, guild_b):
+        message = DummyMessage("hi", author)
+        message.guild = guild
+        verdicts.append(automod.evaluate(message))
+    assert verdicts == [None, None, None, None]
+    message = DummyMessage("hi", author)
+    message.guild = guild_a
+    assert automod.evaluate(message).name == "spam_rule"
+
+
+def test_guild_override_inherits_default(config_file, tmp_path):
+    (tmp_path / "100.yaml").write_text(yaml.dump({
+        "badword_rule": {"bad_words": ["heck"]},
+        "link_blocking_rule": None,
+    }))
+    automod = Automoderator(config_file, guild_config_dir=str(tmp_path))
+    author = DummyAuthor(id=9, name="TestUser9")
+
+    def verdict(content, guild_id):
+        message = DummyMessage(content, author)
+        message.guild = DummyGuild(id=guild_id)
+        rule = automod.evaluate(message)
+        return rule.name if rule else None
+
+    assert verdict("oh heck", 100) == "badword_rule"
+    assert verdict("badword1", 100) is None
+    assert verdict("discord.gg/x", 100) is None
+    assert verdict("THIS IS WAY TOO LOUD", 100) == "caps_rule"
+    assert verdict("oh heck", 200) is None
+    assert verdict("badword1", 200) == "badword_rule"
+    assert len(automod.guild_configs) == 2
+
+
+def test_guild_plans_compile_off_the_event_loop(config_file, tmp_path):
+    (tmp_path / "100.yaml").write_text(yaml.dump({"badword_rule": {"bad_words": ["heck"]}}))
+    automod = Automoderator(config_file, guild_config_dir=str(tmp_path))
+    store = automod.guild_configs
+
+    async def scenario():
+        first = store.get(100)
+        await store.join()
+        loaded = store.get(100)
+        # A reload of the default recompiles guild plans; the old one is
+        # served until the new one is ready.
+        automod.apply_config(automod.config, automod.plan)
+        again = store.get(100)
+        await store.join()
+        return first, loaded, again, store.get(100)
+
+    first, loaded, again, reloaded = asyncio.run(scenario())
+    assert first is automod.plan and again is loaded
+    assert loaded.get("badword_rule").matcher.terms == reloaded.get("badword_rule").matcher.terms == ("heck",)
+    assert reloaded is not loaded
+
+
+def test_disabled_guild_rule_never_fires_across_reloads(config_file, tmp_path):
+    (tmp_path / "100.yaml").write_text(yaml.dump({"link_blocking_rule": None}))
+    automod = Automoderator(config_file, guild_config_dir=str(tmp_path))
+    author = DummyAuthor(id=12, name="TestUser12")
+
+    async def verdict(content):
+        message = DummyMessage(content, author)
+        message.guild = DummyGuild(id=100)
+        rule = await automod.evaluate_async(message, stateful=False)
+        return rule.name if rule else None
+
+    async def scenario():
+        verdicts = [await verdict("discord.gg/x")]
+        await automod.reload_config()
+        verdicts.append(await verdict("discord.gg/y"))
+        await automod.guild_configs.join()
+        verdicts.append(await verdict("discord.gg/z"))
+        verdicts.append(await verdict("badword1"))
+        return verdicts
+
+    assert asyncio.run(scenario()) == [None, None, None, "badword_rule"]
+
+
+def test_idle_guild_plans_are_evicted(tmp_path):
+    from src.automoderation.guild_config import GuildConfigStore
+    now = [0]
+    store = GuildConfigStore(str(tmp_path), max_guilds=3, idle_seconds=10, clock=lambda: now[0])
+    for guild_id in range(5):
+        store.get(guild_id)
+    assert len(store) == 3
+    now[0] = 100
+    store.get(42)
+    assert len(store) == 1
@@ -0,0 +1,58 @@
+import asyncio
+
+import discord
+import pytest
+from discord import app_commands
+
+from src.utils.command_tree import sync_if_changed, tree_fingerprint
+
+
+def make_tree(description="Say hello"):
+    client = discord.Client(intents=discord.Intents.none())
+    client._connection.application_id = 42
+    tree = app_commands.CommandTree(client)
+    synced = []
+
+    @tree.command(name="hello", description=description)
+    async def hello(interaction: discord.Interaction):
+        pass
+
+    async def sync():
+        synced.append(tree_fingerprint(tree))
+        return tree.get_commands()
+
+    tree.sync = sync
+    return tree, synced
+
+
+def test_sync_only_runs_when_commands_change(tmp_path):
+    cache = str(tmp_path / "tree.sha256")
+
+    async def scenario():
+        tree, synced = make_tree()
+        assert await sync_if_changed(tree, cache) is not None
+        # A restart with the same definitions skips the sync.
+        tree, again = make_tree()
+        assert await sync_if_changed(tree, cache) is None
+        tree, changed = make_tree("Say hi")
+        assert await sync_if_changed(tree, cache) is not None
+        return synced, again, changed
+
+    synced, again, changed = asyncio.run(scenario())
+    assert len(synced) == 1 and again == [] and len(changed) == 1
+    assert synced != changed
+
+
+def test_failed_sync_is_retried(tmp_path):
+    cache = str(tmp_path / "tree.sha256")
+    tree, _ = make_tree()
+
+    async def failing_sync():
+        raise RuntimeError("rate limited")
+
+    tree.sync = failing_sync
+    with pytest.raises(RuntimeError):
+        asyncio.run(sync_if_changed(tree, cache))
+    tree, synced = make_tree()
+    assert asyncio.run(sync_if_changed(tree, cache)) is not None
+    assert len(synced) == 1
@@ -0,0 +1,91 @@
+import pytest
+import yaml
+
+from src.automoderation.automod import Automoderator
+from src.automoderation.config_store import ConfigStore
+from src.automoderation.rules import compile_rules
+
+
+def test_partial_commits_history_and_rollback(tmp_path):
+    store = ConfigStore(str(tmp_path / "config.db"))
+    assert store.version() == 0
+    v1 = store.commit({"caps_rule": {"max_caps_ratio": 0.7, "min_length": 5}, "spam_rule": {"spam_threshold": 5}}, "alice")
+    # Unchanged sections are skipped; a commit with nothing new writes nothing.
+    v2 = store.commit({"caps_rule": {"max_caps_ratio": 0.7, "min_length": 5}, "spam_rule": {"spam_threshold": 3}}, "bob")
+    assert store.commit({"spam_rule": {"spam_threshold": 3}}, "bob") is None
+    v3 = store.commit({"caps_rule": None}, "carol", "no caps rule")
+
+    assert store.current() == (v3, {"spam_rule": {"spam_threshold": 3}})
+    assert store.changed_rules(v1) == {"spam_rule", "caps_rule"}
+    assert store.changed_rules(v1, v2) == {"spam_rule"}
+    assert [(c.version, c.author, c.rules) for c in store.history()] == [
+        (v3, "carol", ("caps_rule",)), (v2, "bob", ("spam_rule",)), (v1, "alice", ("caps_rule", "spam_rule")),
+    ]
+
+    v4 = store.rollback(v1, "dave")
+    assert store.current()[1] == store.config_at(v1)
+    assert store.history(1)[0].message == f"Rolled back to version {v1}"
+    assert store.changed_rules(v3, v4) == {"caps_rule", "spam_rule"}
+
+
+def test_invalid_commit_is_not_written(tmp_path):
+    store = ConfigStore(str(tmp_path / "config.db"))
+    with pytest.raises(ValueError):
+        store.commit({"mass_mention_rule": {"max_mentions": "lots"}}, "alice", validate=compile_rules)
+    assert store.version() == 0
+
+
+def test_file_edits_only_commit_what_changed_in_the_file(tmp_path):
+    path = tmp_path / "automod.yaml"
+    path.write_text(yaml.dump({"caps_rule": {"min_length": 5}, "spam_rule": {"spam_threshold": 5}}))
+    store = ConfigStore(str(tmp_path / "config.db"))
+    assert store.sync_file(str(path)) == 1
+    assert store.sync_file(str(path)) is None
+    store.commit({"spam_rule": {"spam_threshold": 2}}, "web")
+    path.write_text(yaml.dump({"caps_rule": {"min_length": 9}, "spam_rule": {"spam_threshold": 5}}))
+    store.sync_file(str(path))
+    assert store.current()[1] == {"caps_rule": {"min_length": 9}, "spam_rule": {"spam_threshold": 2}}
+
+
+def test_automoderator_recompiles_only_changed_rules(tmp_path):
+    path = tmp_path / "automod.yaml"
+    path.write_text(yaml.dump({
+        "badword_rule": {"bad_words": ["heck"]},
+        "mass_mention_rule": {"max_mentions": 5},
+    }))
+    store = ConfigStore(str(tmp_path / "config.db"))
+    automod = Automoderator(str(path), guild_config_dir=str(tmp_path / "guilds"), config_store=store)
+    assert automod.config_version == 1
+    badword = automod.plan.get("badword_rule")
+
+    store.commit({"mass_mention_rule": {"max_mentions": 1}}, "web")
+    assert automod.load_config()
+    assert automod.config_version == 2
+    assert automod.plan.get("mass_mention_rule").max_mentions == 1
+    assert automod.plan.get("badword_rule") is badword
+
+
+def test_broken_config_file_does_not_block_store_commits(tmp_path):
+    path = tmp_path / "automod.yaml"
+    path.write_text(yaml.dump({"mass_mention_rule": {"max_mentions": 5}}))
+    store = ConfigStore(str(tmp_path / "config.db"))
+    automod = Automoderator(str(path), guild_config_dir=str(tmp_path / "guilds"), config_store=store)
+
+    path.write_text("mass_mention_rule: [unclosed")
+    store.commit({"mass_mention_rule": {"max_mentions": 1}}, "web")
+    assert automod.load_config()
+    assert automod.config_version == 2
+    assert automod.plan.get("mass_mention_rule").max_mentions == 1
+
+
+def test_older_version_is_not_applied_over_a_newer_one(tmp_path):
+    path = tmp_path / "automod.yaml"
+    path.write_text(yaml.dump({"mass_mention_rule": {"max_mentions": 5}}))
+    store = ConfigStore(str(tmp_path / "config.db"))
+    automod = Automoderator(str(path), guild_config_dir=str(tmp_path / "guilds"), config_store=store)
+    stale = automod.read_config()
+    store.commit({"mass_mention_rule": {"max_mentions": 1}}, "web")
+    assert automod.load_config()
+    automod.apply_config(*stale)
+    assert automod.config_version == 2
+    assert automod.plan.get("mass_mention_rule").max_mentions == 1
@@ -0,0 +1,45 @@
+import asyncio
+
+from src.automoderation.counters import MemoryCounterBackend, SQLiteCounterBackend, SharedCounter
+
+
+def test_processes_sharing_a_backend_see_each_others_hits(clock, tmp_path):
+    path = str(tmp_path / "counters.db")
+    clock.now = 1_000_000
+    shard_a = SharedCounter(SQLiteCounterBackend(path), clock=clock)
+    shard_b = SharedCounter(SQLiteCounterBackend(path), clock=clock)
+    key = (1, None, 42)
+    assert not shard_a.hit(key, 10_000, 3)
+    assert not shard_b.hit(key, 10_000, 3)
+    shard_a.flush_sync()
+    shard_b.flush_sync()
+    # Shard B flushed last, so it has already seen shard A's message.
+    assert not shard_a.hit(key, 10_000, 3)
+    assert shard_b.hit(key, 10_000, 3)
+
+
+def test_previous_bucket_decays(clock):
+    counter = SharedCounter(MemoryCounterBackend(), clock=clock)
+    for _ in range(4):
+        counter.add("k", 1000)
+    counter.flush_sync()
+    clock.now = 1500
+    assert counter.add("k", 1000) == 1 + 4 * 0.5
+    clock.now = 5000
+    assert counter.add("k", 1000) == 1
+
+
+def test_async_flush_batches_increments(clock):
+    calls = []
+
+    class RecordingBackend(MemoryCounterBackend):
+        def exchange(self, increments, wanted, now_ms):
+            calls.append(dict(increments))
+            return super().exchange(increments, wanted, now_ms)
+
+    counter = SharedCounter(RecordingBackend(), clock=clock)
+    for _ in range(100):
+        counter.add("k", 1000)
+    asyncio.run(counter.flush())
+    assert calls == [{("1000:k", 0): 100}]
+    assert counter.add("k", 1000) == 101
@@ -0,0 +1,56 @@
+import asyncio
+from datetime import datetime, timezone
+import gzip
+from types import SimpleNamespace
+
+import pytest
+
+from src.utils.event_recorder import EventRecorder, read_events, write_events
+
+
+def make_message(id, content):
+    return SimpleNamespace(
+        id=id, content=content, guild=SimpleNamespace(id=1), channel=SimpleNamespace(id=2),
+        author=SimpleNamespace(id=3, bot=False), mentions=[SimpleNamespace(id=4)],
+        attachments=[SimpleNamespace(filename="cat.png", size=100)],
+    )
+
+
+def test_recording_round_trips_across_flushes(tmp_path):
+    path = str(tmp_path / "events.jsonl.gz")
+    member = SimpleNamespace(
+        id=5, name="newbie", guild=SimpleNamespace(id=1), bot=False, pending=True, avatar=None,
+        created_at=datetime(2024, 1, 1, tzinfo=timezone.utc),
+    )
+
+    async def scenario():
+        recorder = EventRecorder(None, path, flush_interval=3600)
+        await recorder.cog_load()
+        await recorder.on_message(make_message(10, "hello"))
+        await recorder.flush()
+        await recorder.on_raw_message_edit(SimpleNamespace(message=make_message(10, "hello there")))
+        await recorder.on_member_join(member)
+        await recorder.cog_unload()
+        return recorder
+
+    recorder = asyncio.run(scenario())
+    events = list(read_events(path))
+    assert recorder.recorded == 3
+    assert [event["type"] for event in events] == ["message", "edit", "join"]
+    assert events[0]["mentions"] == [4] and events[0]["attachments"] == [["cat.png", 100]]
+    assert events[1]["content"] == "hello there"
+    assert events[2]["avatar"] is False and events[2]["pending"] is True
+    assert events[0]["t"] <= events[1]["t"] <= events[2]["t"]
+
+
+def test_read_rejects_other_files(tmp_path):
+    events = [{"type": "message", "t": 0.5, "content": "hi"}]
+    path = tmp_path / "events.jsonl.gz"
+    write_events(path, events)
+    assert list(read_events(path)) == events
+
+    other = tmp_path / "other.jsonl.gz"
+    with gzip.open(other, "wt") as f:
+        f.write('{"type": "message"}\n')
+    with pytest.raises(ValueError):
+        list(read_events(other))
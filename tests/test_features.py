@@ -0,0 +1,65 @@
+from collections import namedtuple
+
+from src.automoderation.features import MessageFeatures
+from src.automoderation.matcher import Normalizer
+
+Attachment = namedtuple("Attachment", ["filename"])
+
+
+class Message:
+    def __init__(self, id, content, attachments=(), mentions=()):
+        self.id = id
+        self.content = content
+        self.attachments = list(attachments)
+        self.mentions = list(mentions)
+
+
+def test_features_are_extracted_from_the_message():
+    message = Message(
+        1,
+        "HEY look at discord[.]gg/abc <:pepe:123456789012345678> 😀",
+        attachments=[Attachment("Setup.EXE"), Attachment("README")],
+        mentions=[1, 2, 3],
+    )
+    features = MessageFeatures.of(message)
+    assert features.text == message.content.lower()
+    assert len(features) == len(message.content)
+    assert features.uppercase == 3 and features.letters == 25
+    assert features.mentions == 3 and features.emojis == 2
+    assert features.filenames == ("setup.exe", "readme")
+    assert features.extensions == (".exe", "")
+    assert [link.host for link in features.links] == ["discord.gg"]
+
+
+def test_normalized_text_is_computed_once_per_normalizer():
+    calls = []
+
+    class CountingNormalizer(Normalizer):
+        __slots__ = ()
+
+        def __call__(self, text):
+            calls.append(text)
+            return super().__call__(text)
+
+    normalizer = CountingNormalizer(leetspeak=True)
+    features = MessageFeatures("H3LL0")
+    assert features.normalized(normalizer) == "hello"
+    assert features.normalized(normalizer) == "hello"
+    assert len(calls) == 1
+    assert features.normalized(Normalizer()) == "h3ll0"
+
+
+def test_automod_reuses_features_until_the_message_is_edited(tmp_path):
+    from src.automoderation.automod import Automoderator
+
+    config = tmp_path / "automod.yaml"
+    config.write_text("caps_rule: {max_caps_ratio: 0.7, min_length: 5}\n")
+    automod = Automoderator(str(config))
+    message = Message(1, "quiet message")
+    features = automod.features(message)
+    assert automod.features(message) is features
+    assert automod.evaluate(message) is None
+
+    message.content = "LOUD MESSAGE"
+    assert automod.features(message) is not features
+    assert automod.evaluate(message).name == "caps_rule"
@@ -0,0 +1,64 @@
+from collections import namedtuple
+
+from src.automoderation.features import MessageFeatures
+from src.automoderation.fingerprint import DuplicateIndex, simhash, words_of
+from src.automoderation.rules import compile_rules
+
+
+Author = namedtuple("Author", ["id", "name"])
+Guild = namedtuple("Guild", ["id"])
+Message = namedtuple("Message", ["content", "author", "guild"])
+
+
+COPYPASTA = "Free nitro for everyone, claim it now at the link in my bio before it runs out"
+
+
+def test_simhash_is_close_for_small_edits():
+    a = simhash(words_of(COPYPASTA))
+    b = simhash(words_of(COPYPASTA + " :)"))
+    c = simhash(words_of("Does anyone know when the next community game night is scheduled"))
+    assert a == b
+    assert (a ^ c).bit_count() > 3
+
+
+def test_counts_distinct_posters_across_channels(clock):
+    index = DuplicateIndex(clock=clock)
+    counts = [index.observe(1, (user, user % 3), COPYPASTA, 60) for user in range(4)]
+    assert counts == [1, 2, 3, 4]
+    # The same poster again doesn't add to the count.
+    assert index.observe(1, (0, 0), COPYPASTA, 60) == 4
+    # Other guilds are tracked separately.
+    assert index.observe(2, (0, 0), COPYPASTA, 60) == 1
+
+
+def test_near_duplicates_join_the_same_cluster(clock):
+    index = DuplicateIndex(clock=clock)
+    index.observe(1, (1, 1), COPYPASTA, 60)
+    assert index.observe(1, (2, 1), COPYPASTA.upper() + " :)", 60) == 2
+    assert index.observe(1, (3, 1), COPYPASTA.replace("o", "0"), 60) == 3
+    assert index.observe(1, (4, 1), COPYPASTA, 60, max_distance=0) == 4
+
+
+def test_window_and_memory_cap(clock):
+    index = DuplicateIndex(max_entries=10, clock=clock)
+    for n in range(50):
+        index.observe(1, (n, 1), f"unique message number {n} with some padding words", 60)
+    assert len(index) == 10
+    index.observe(1, (1, 1), COPYPASTA, 60)
+    clock.now += 61
+    assert index.observe(1, (2, 1), COPYPASTA, 60) == 1
+    assert len(index) == 1
+
+
+def test_duplicate_rule_flags_at_threshold(clock):
+    class FakeAutomod:
+        duplicate_index = DuplicateIndex(clock=clock)
+
+    rule = compile_rules({"duplicate_rule": {"threshold": 3, "window": 30}}).get("duplicate_rule")
+    results = []
+    for user in range(4):
+        message = Message(COPYPASTA, Author(user, f"user{user}"), Guild(1))
+        results.append(rule.check(FakeAutomod, message, MessageFeatures(message.content)))
+    assert results == [False, False, True, True]
+    short = Message("hi", Author(9, "user9"), Guild(1))
+    assert rule.check(FakeAutomod, short, MessageFeatures("hi")) is False
@@ -0,0 +1,275 @@
+import asyncio
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from src.join_roles.pipeline import JoinPipeline
+
+DummyRole = namedtuple("DummyRole", ["name"])
+
+
+class DummyGuild:
+    def __init__(self, id):
+        self.id = id
+        self.name = f"guild{id}"
+
+
+class DummyMember:
+    def __init__(self, id, guild, age_days=365, avatar="abc"):
+        self.id = id
+        self.name = f"member{id}"
+        self.guild = guild
+        self.created_at = datetime.now(timezone.utc) - timedelta(days=age_days)
+        self.avatar = avatar
+        self.roles = []
+        self.kicked = False
+
+    async def add_roles(self, *roles, reason=None):
+        self.roles.extend(roles)
+
+    async def kick(self, reason=None):
+        self.kicked = True
+
+
+def make_pipeline(clock, **kwargs):
+    role = DummyRole("Member")
+    return JoinPipeline(lambda member: [role], min_interval=0, clock=clock, **kwargs)
+
+
+def test_roles_are_assigned_by_workers(clock):
+    async def scenario():
+        pipeline = make_pipeline(clock, raid_threshold=50)
+        pipeline.start()
+        guild = DummyGuild(1)
+        members = [DummyMember(i, guild) for i in range(20)]
+        for member in members:
+            pipeline.submit(member)
+        await pipeline.join()
+        await pipeline.stop()
+        return members
+
+    members = asyncio.run(scenario())
+    assert all(m.roles == [DummyRole("Member")] for m in members)
+
+
+def test_join_burst_triggers_raid_mode_and_holds_members(clock):
+    async def scenario():
+        pipeline = make_pipeline(clock, raid_threshold=5, raid_window=10)
+        guild = DummyGuild(1)
+        members = [DummyMember(i, guild, age_days=0 if i % 2 else 365) for i in range(10)]
+        for member in members:
+            pipeline.submit(member)
+            clock.now += 0.1
+        status = pipeline.status(guild.id)
+        removed = await pipeline.purge(guild)
+        return members, status, removed
+
+    members, status, removed = asyncio.run(scenario())
+    assert status["raid_mode"]
+    # The fifth join tripped raid mode, so members 4-9 were held and the
+    # brand new accounts among them flagged.
+    assert status["held"] == 3 and status["flagged"] == 3
+    assert removed == 3
+    assert [m.id for m in members if m.kicked] == [5, 7, 9]
+    assert status["queued"] == 4
+
+
+def test_raid_mode_follows_raid_settings_and_lasts_while_joins_continue(clock):
+    from src.automoderation.raid import RaidSettings
+
+    settings = RaidSettings(hold_joins=3, join_window=5, cooldown=60)
+    pipeline = make_pipeline(clock, raid_settings=lambda guild_id: settings)
+    guild = DummyGuild(1)
+    for i in range(3):
+        pipeline.submit(DummyMember(i, guild))
+    assert pipeline.in_raid_mode(guild.id)
+    # A trickle of joins keeps raid mode on well past one cooldown.
+    for i in range(3, 6):
+        clock.now += 50
+        pipeline.submit(DummyMember(i, guild))
+        assert pipeline.in_raid_mode(guild.id)
+    clock.now += 61
+    assert not pipeline.in_raid_mode(guild.id)
+    assert pipeline.status(guild.id)["held"] == 4
+
+
+def test_join_roles_are_persisted_per_guild(tmp_path):
+    from src.join_roles.store import JoinRole, JoinRoleStore
+
+    path = str(tmp_path / "data" / "join_roles.db")
+
+    async def write():
+        store = JoinRoleStore(path)
+        assert await store.get(1) == ()
+        await store.set(1, [JoinRole(10, False), JoinRole(11, True)])
+        await store.add(2, JoinRole(20, False))
+        await store.remove(1, 10)
+
+    async def read():
+        store = JoinRoleStore(path)
+        return await store.get(1), await store.get(2), await store.get(3)
+
+    asyncio.run(write())
+    assert asyncio.run(read()) == ((JoinRole(11, True),), (JoinRole(20, False),), ())
+
+
+def test_cold_load_does_not_overwrite_a_concurrent_write(tmp_path):
+    import time
+
+    from src.join_roles.store import JoinRole, JoinRoleStore
+
+    path = str(tmp_path / "join_roles.db")
+    asyncio.run(JoinRoleStore(path).set(1, [JoinRole(10, False)]))
+    store = JoinRoleStore(path)
+    load = store._load
+    calls = []
+
+    def slow_load(guild_id):
+        rows = load(guild_id)
+        if not calls:
+            calls.append(guild_id)
+            time.sleep(0.1)
+        return rows
+
+    store._load = slow_load
+
+    async def scenario():
+        await asyncio.gather(store.get(1), store.add(1, JoinRole(20, False)))
+        return await store.get(1)
+
+    assert asyncio.run(scenario()) == (JoinRole(10, False), JoinRole(20, False))
+    assert store._locks == {}
+
+
+def test_passing_screening_gives_only_verified_roles(tmp_path):
+    from types import SimpleNamespace
+
+    from src.join_roles import JoinRoleManager
+    from src.join_roles.store import JoinRole, JoinRoleStore
+
+    manager = JoinRoleManager(bot=None)
+    manager.store = JoinRoleStore(str(tmp_path / "join_roles.db"))
+    submitted = []
+    manager.pipeline.submit = lambda member, count_join=True, roles=None: submitted.append((count_join, roles))
+    roles = {10: DummyRole("Member"), 11: DummyRole("Verified")}
+    guild = SimpleNamespace(id=1, get_role=roles.get)
+    before = SimpleNamespace(guild=guild, pending=True)
+    after = SimpleNamespace(guild=guild, pending=False)
+
+    async def scenario():
+        await manager.store.set(1, [JoinRole(10, False), JoinRole(11, True)])
+        on_join = await manager.resolve_roles(before)
+        await manager.on_member_update(before, after)
+        return on_join
+
+    assert asyncio.run(scenario()) == [DummyRole("Member")]
+    assert submitted == [(False, [DummyRole("Verified")])]
+
+
+def test_fallback_role_is_found_once_created():
+    from types import SimpleNamespace
+
+    from src.join_roles import JoinRoleManager
+
+    manager = JoinRoleManager(bot=None)
+    guild = SimpleNamespace(id=1, roles=[])
+    guild.get_role = lambda role_id: next((r for r in guild.roles if r.id == role_id), None)
+    assert manager._fallback_role(guild) == []
+    member = SimpleNamespace(id=5, name="Member")
+    guild.roles.append(member)
+    assert manager._fallback_role(guild) == [member]
+    guild.roles.remove(member)
+    assert manager._fallback_role(guild) == []
+
+
+def test_rate_limited_assignment_is_retried_with_a_full_queue(clock):
+    from types import SimpleNamespace
+
+    import discord
+
+    class RateLimitedMember(DummyMember):
+        limited = True
+
+        async def add_roles(self, *roles, reason=None):
+            if RateLimitedMember.limited:
+                RateLimitedMember.limited = False
+                # Meanwhile the next member fills the queue.
+                await asyncio.sleep(0.01)
+                response = SimpleNamespace(status=429, reason="Too Many Requests", headers={"Retry-After": "0.01"})
+                raise discord.HTTPException(response, "")
+            await super().add_roles(*roles, reason=reason)
+
+    async def scenario():
+        pipeline = make_pipeline(clock, workers=1, max_queue=1, raid_threshold=50)
+        guild = DummyGuild(1)
+        members = [RateLimitedMember(1, guild), DummyMember(2, guild)]
+        pipeline.submit(members[0])
+        pipeline.start()
+        await asyncio.sleep(0)
+        pipeline.submit(members[1])
+        await pipeline.join()
+        await pipeline.stop()
+        return members
+
+    members = asyncio.run(scenario())
+    assert all(m.roles == [DummyRole("Member")] for m in members)
+
+
+def test_member_is_held_when_the_bucket_stays_limited(clock):
+    import discord
+
+    class AlwaysLimitedMember(DummyMember):
+        attempts = 0
+
+        async def add_roles(self, *roles, reason=None):
+            AlwaysLimitedMember.attempts += 1
+            raise discord.RateLimited(0.01)
+
+    async def scenario():
+        pipeline = make_pipeline(clock, workers=1, raid_threshold=50)
+        guild = DummyGuild(1)
+        pipeline.submit(AlwaysLimitedMember(1, guild))
+        pipeline.start()
+        await asyncio.wait_for(pipeline.join(), 1)
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert AlwaysLimitedMember.attempts == 4
+    assert pipeline.status(1)["held"] == 1
+
+
+def test_idle_guild_state_is_pruned(clock):
+    async def scenario():
+        pipeline = make_pipeline(clock, raid_threshold=50, raid_window=10)
+        pipeline.submit(DummyMember(1, DummyGuild(1)))
+        pipeline.start()
+        await pipeline.join()
+        clock.now = 11
+        await asyncio.sleep(1.1)
+        await pipeline.stop()
+        return pipeline
+
+    pipeline = asyncio.run(scenario())
+    assert pipeline._guilds == {}
+
+
+def test_purge_counts_only_members_removed(clock):
+    from types import SimpleNamespace
+
+    import discord
+
+    class ProtectedMember(DummyMember):
+        async def kick(self, reason=None):
+            raise discord.Forbidden(SimpleNamespace(status=403, reason="Forbidden"), "Missing Permissions")
+
+    async def scenario():
+        pipeline = make_pipeline(clock, raid_threshold=1, raid_window=10)
+        guild = DummyGuild(1)
+        pipeline.submit(DummyMember(0, guild))
+        members = [ProtectedMember(1, guild, age_days=0), DummyMember(2, guild, age_days=0)]
+        for member in members:
+            pipeline.submit(member)
+        return members, await pipeline.purge(guild)
+
+    members, removed = asyncio.run(scenario())
+    assert removed == 1 and [m.id for m in members if m.kicked] == [2]
@@ -0,0 +1,60 @@
+import time
+
+from src.automoderation.links import DomainFile, DomainSet, LinkMatcher, extract_links, normalize_host, write_domain_file
+
+
+def blocked(matcher, text):
+    return [m.term for m in matcher.finditer(text.lower())]
+
+
+def test_extracts_urls_and_bare_domains():
+    links = list(extract_links("see https://user@www.Example.com:8080/a?b=1 and bit.ly/x, not e.g. this"))
+    assert [(l.host, l.path) for l in links] == [("www.Example.com", "/a?b=1"), ("bit.ly", "/x")]
+
+
+def test_long_dotted_runs_are_scanned_in_linear_time():
+    for text in ("a." * 2000, "1." * 2000, "a-." * 1333):
+        started = time.perf_counter()
+        assert list(extract_links(text)) == []
+        assert time.perf_counter() - started < 0.05
+    assert [link.host for link in extract_links("a." * 2000 + "gg")] == ["a." * 2000 + "gg"]
+
+
+def test_normalizes_hosts():
+    assert normalize_host("Discord.GG.") == "discord.gg"
+    assert normalize_host("discord。gg") == "discord.gg"
+    assert normalize_host("dіscord.gg") == "discord.gg"  # Cyrillic i
+    assert normalize_host("bücher.de") == "xn--bcher-kva.de"
+    assert normalize_host("xn--bcher-kva.de") == "xn--bcher-kva.de"
+
+
+def test_suffix_matching_covers_subdomains_only():
+    matcher = LinkMatcher(DomainSet(["discord.gg", "https://bit.ly/", "discord.com/invite", "xyz"]))
+    assert blocked(matcher, "join https://www.discord.gg/abc") == ["discord.gg"]
+    assert blocked(matcher, "notdiscord.gg is fine") == []
+    assert blocked(matcher, "discord[.]gg/abc") == ["discord.gg"]
+    assert blocked(matcher, "discord.com/invite/abc") == ["discord.com"]
+    assert blocked(matcher, "discord.com/channels/1") == []
+    assert blocked(matcher, "free stuff at claim.xyz") == ["xyz"]
+    assert blocked(matcher, "BIT.LY./abc") == ["bit.ly"]
+
+
+def test_domain_file_binary_search(tmp_path):
+    path = tmp_path / "blocklist.domains"
+    source = ["# comment", "0.0.0.0 ads.example.com", "Tracker.NET", "", "bücher.de"]
+    source += [f"spam{n}.test" for n in range(1000)]
+    assert write_domain_file(source, path) == 1003
+    blocklist = DomainFile(path)
+    for domain in ("ads.example.com", "tracker.net", "xn--bcher-kva.de", "spam0.test", "spam999.test"):
+        assert domain in blocklist
+    for domain in ("example.com", "aaa", "zzz", "spam1000.test"):
+        assert domain not in blocklist
+    matcher = LinkMatcher(DomainSet(), [blocklist])
+    assert blocked(matcher, "go to cdn.ads.example.com now") == ["ads.example.com"]
+    assert blocked(matcher, "go to example.com now") == []
+
+
+def test_empty_domain_file(tmp_path):
+    path = tmp_path / "empty.domains"
+    path.write_bytes(b"")
+    assert "example.com" not in DomainFile(path)
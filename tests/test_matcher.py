@@ -0,0 +1,41 @@
+from src.automoderation.matcher import Normalizer, PatternMatcher
+
+
+def test_reports_all_matches_with_positions():
+    matcher = PatternMatcher(["he", "she", "his", "hers"], rule="badword_rule")
+    matches = list(matcher.finditer("ushers"))
+    assert [(m.start, m.end, m.term) for m in matches] == [(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")]
+    assert all(m.rule == "badword_rule" for m in matches)
+
+
+def test_word_boundary():
+    matcher = PatternMatcher(["ass"], word_boundary=True)
+    assert matcher.search("a classic move") is None
+    assert matcher.search("what an ass!") is not None
+
+
+def test_normalization_defeats_evasion():
+    matcher = PatternMatcher(["badword"], normalizer=Normalizer(leetspeak=True))
+    assert matcher.search("b4dw0rd") is not None
+    assert matcher.search("bad\u200bword") is not None  # zero-width space
+    assert matcher.search("b\u0430dword") is not None  # Cyrillic a
+    assert matcher.search("\uff42\uff41\uff44word") is not None  # fullwidth
+    assert matcher.search("good words") is None
+
+
+def test_empty_matcher():
+    matcher = PatternMatcher([])
+    assert len(matcher) == 0
+    assert matcher.search("anything") is None
+
+
+def test_search_many_keeps_texts_apart():
+    matcher = PatternMatcher(["ass"], word_boundary=True)
+    texts = ["a classic move", "you ass", "", "ass", "cl\nass", "b"]
+    assert matcher.search_many(texts) == [matcher.search(t) is not None for t in texts]
+    assert matcher.search_many(["xa", "ss"]) == [False, False]
+
+    # Every text is normalized, not just the first.
+    matcher = PatternMatcher(["badword"], normalizer=Normalizer(leetspeak=True))
+    texts = ["hi", "B4DW0RD", "bad\u200bword", "fine"]
+    assert matcher.search_many(texts) == [False, True, True, False]
@@ -0,0 +1,63 @@
+import os
+import tempfile
+from collections import namedtuple
+
+import yaml
+
+from src.automoderation.automod import Automoderator
+from src.automoderation.metrics import AutomodMetrics, Histogram
+
+DummyAuthor = namedtuple("DummyAuthor", ["id", "name"])
+
+
+class DummyMessage:
+    def __init__(self, content, author):
+        self.content = content
+        self.author = author
+        self.attachments = []
+        self.mentions = []
+
+
+def make_automod(config):
+    with tempfile.NamedTemporaryFile("w", suffix=".yaml", delete=False) as f:
+        yaml.dump(config, f)
+    try:
+        return Automoderator(f.name)
+    finally:
+        os.remove(f.name)
+
+
+def test_rule_stats_are_collected_only_when_enabled():
+    automod = make_automod({"badword_rule": {"bad_words": ["badword1"]}, "caps_rule": {"min_length": 3}})
+    # Repeats would be answered by the verdict cache without running the rules.
+    automod.verdict_cache = None
+    author = DummyAuthor(id=1, name="TestUser")
+    automod.evaluate(DummyMessage("badword1", author))
+    assert automod.metrics.rules == {}
+
+    automod.metrics.enabled = True
+    automod.evaluate(DummyMessage("badword1", author))
+    automod.evaluate(DummyMessage("hello there", author))
+    badword, caps = automod.metrics.rules["badword_rule"], automod.metrics.rules["caps_rule"]
+    assert (badword.evaluations, badword.matches) == (2, 1)
+    assert (caps.evaluations, caps.matches) == (1, 0)
+    assert automod.metrics.messages == 2
+
+
+def test_prometheus_rendering():
+    metrics = AutomodMetrics(enabled=True)
+    metrics.rule("spam_rule").matches = 3
+    metrics.handler_latency.observe(0.002)
+    metrics.add_gauge("queue_depth", lambda: 7)
+    text = metrics.render_prometheus()
+    assert 'automod_rule_matches_total{rule="spam_rule"} 3' in text
+    assert 'automod_handler_seconds_bucket{le="+Inf"} 1' in text
+    assert "automod_queue_depth 7" in text
+
+
+def test_histogram_quantile():
+    histogram = Histogram(buckets=(1, 2, 3))
+    for value in (0.5, 1.5, 1.5, 2.5):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 2
+    assert histogram.quantile(0.99) == 3
@@ -0,0 +1,86 @@
+import asyncio
+from collections import namedtuple
+
+from src.automoderation.actions import ModerationQueue
+from src.automoderation.modlog import ModLog
+
+Author = namedtuple("Author", ["id", "mention"])
+Guild = namedtuple("Guild", ["id"])
+Rule = namedtuple("Rule", ["name", "warning"])
+
+
+class Channel:
+    def __init__(self, id, fail=False):
+        self.id = id
+        self.fail = fail
+
+    async def delete_messages(self, messages):
+        if self.fail:
+            raise RuntimeError("missing permissions")
+
+    async def send(self, content, delete_after=None):
+        pass
+
+
+class Message:
+    def __init__(self, id, author, channel, guild):
+        self.id = id
+        self.author = author
+        self.channel = channel
+        self.guild = guild
+
+    async def delete(self):
+        if self.channel.fail:
+            raise RuntimeError("missing permissions")
+
+
+def test_events_are_written_on_flush_and_filtered(tmp_path):
+    log = ModLog(str(tmp_path / "modlog.db"))
+    log.record(1, 10, 100, 1000, "badword_rule", "delete", term="heck", timestamp=100.0)
+    log.record(1, 10, 200, 1001, "link_rule", "delete", term="bad.example", timestamp=200.0)
+    log.record(2, 20, 100, 1002, "badword_rule", "delete", timestamp=300.0)
+    assert log.query() == []
+    assert len(log) == 3
+
+    asyncio.run(log.flush())
+    assert len(log) == 0 and log.written == 3
+
+    assert [e.message_id for e in log.query()] == [1002, 1001, 1000]
+    assert [e.message_id for e in log.query(guild_id=1)] == [1001, 1000]
+    assert [e.message_id for e in log.query(user_id=100, rule="badword_rule")] == [1002, 1000]
+    assert [e.message_id for e in log.query(since=150, until=300)] == [1001]
+    assert log.query(limit=1)[0].term is None
+    assert log.query(rule="link_rule")[0].term == "bad.example"
+
+    assert log.prune(before=250.0) == 2
+    assert [e.message_id for e in log.query()] == [1002]
+
+
+def test_full_buffer_drops_oldest_events(tmp_path):
+    log = ModLog(str(tmp_path / "modlog.db"), capacity=2)
+    for i in range(5):
+        log.record(1, 10, 100, i, "spam_rule", "delete", timestamp=float(i))
+    assert log.dropped == 3
+    asyncio.run(log.flush())
+    assert [e.message_id for e in log.query()] == [4, 3]
+
+
+def test_queue_records_action_outcomes(tmp_path):
+    async def scenario():
+        log = ModLog(str(tmp_path / "modlog.db"), flush_interval=0.01)
+        log.start()
+        queue = ModerationQueue(flush_delay=0, modlog=log)
+        author, guild = Author(id=7, mention="<@7>"), Guild(id=1)
+        ok, broken = Channel(10), Channel(11, fail=True)
+        queue.enqueue(Message(1, author, ok, guild), Rule("badword_rule", "no!"), term="heck")
+        queue.enqueue(Message(2, author, broken, guild), Rule("link_rule", "no links!"))
+        await asyncio.sleep(0.05)
+        await queue.close()
+        await log.close()
+        return log
+
+    log = asyncio.run(scenario())
+    events = {e.message_id: e for e in log.query(guild_id=1)}
+    assert events[1].action == "delete" and events[1].term == "heck" and events[1].rule == "badword_rule"
+    assert events[1].latency_ms is not None and events[1].latency_ms >= 0
+    assert events[2].action == "delete_failed" and events[2].channel_id == 11
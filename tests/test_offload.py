@@ -0,0 +1,106 @@
+import asyncio
+from collections import namedtuple
+import pickle
+import time
+
+from src.automoderation import offload
+from src.automoderation.automod import Automoderator
+from src.automoderation.offload import ProcessOffload
+from src.automoderation.rules import compile_rules
+
+Author = namedtuple("Author", ["id", "name"])
+Message = namedtuple("Message", ["content", "author", "mentions", "attachments"])
+
+PLAN = compile_rules({
+    "badword_rule": {"bad_words": ["badword"]},
+    "link_blocking_rule": {"blocked_links": ["discord.gg"]},
+})
+
+
+def test_worker_asks_for_unknown_plans():
+    rules = offload.offloadable(PLAN)
+    payload = pickle.dumps(rules)
+    assert offload._evaluate(-1, None, ["x"]) is None
+    assert offload._evaluate(-1, payload, ["a badword", "discord.gg/x", "fine"]) == \
+        ["badword_rule", "link_blocking_rule", None]
+    assert offload._evaluate(-1, None, ["badword"]) == ["badword_rule"]
+
+
+def test_offloaded_rules_keep_rule_order(tmp_path):
+    config = tmp_path / "automod.yaml"
+    config.write_text(
+        "badword_rule: {bad_words: [badword]}\n"
+        "mass_mention_rule: {max_mentions: 1}\n"
+        "caps_rule: {max_caps_ratio: 0.7, min_length: 5}\n"
+    )
+    automod = Automoderator(str(config), guild_config_dir=str(tmp_path / "guilds"))
+    automod.offload = ProcessOffload(workers=1, min_length=10, timeout=30)
+    author = Author(1, "user")
+    padding = " and some more words"
+
+    async def run():
+        automod.offload.start()
+        try:
+            messages = [
+                Message("badword" + padding, author, [author, author], []),
+                Message("hi all" + padding, author, [author, author], []),
+                Message("short", author, [], []),
+                Message("HELLO THERE EVERYONE", author, [], []),
+                Message("nothing to see" + padding, author, [], []),
+            ]
+            verdicts = await asyncio.gather(*(automod.evaluate_async(m) for m in messages))
+            return [rule.name if rule else None for rule in verdicts]
+        finally:
+            automod.offload.close()
+
+    assert asyncio.run(run()) == ["badword_rule", "mass_mention_rule", None, "caps_rule", None]
+
+
+def test_timeout_reports_failure():
+    pool = ProcessOffload(workers=1, min_length=0, timeout=0)
+
+    async def run():
+        pool.start()
+        try:
+            return await pool.first_match(PLAN, "a badword")
+        finally:
+            pool.close()
+
+    assert asyncio.run(run()) is offload.FAILED
+    assert pool.timeouts == 1
+
+
+def test_timeout_skips_offloaded_rules_without_caching(tmp_path):
+    config = tmp_path / "automod.yaml"
+    config.write_text("badword_rule: {bad_words: [badword]}\n")
+    automod = Automoderator(str(config), guild_config_dir=str(tmp_path / "guilds"))
+    automod.offload = ProcessOffload(workers=1, min_length=10, timeout=0)
+    author = Author(1, "user")
+    message = Message("badword and some padding text here", author, [], [])
+
+    async def run():
+        automod.offload.start()
+        pool = automod.offload._pool
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(pool, int)
+        processes = list(pool._processes.values())
+        # A worker stuck on some earlier message.
+        stuck = loop.run_in_executor(pool, time.sleep, 60)
+        await asyncio.sleep(0.2)
+        try:
+            verdict = await automod.evaluate_async(message)
+        finally:
+            automod.offload.close()
+        # The timeout killed the stuck worker instead of leaving it running.
+        for process in processes:
+            process.join(5)
+        alive = [process.is_alive() for process in processes]
+        if not any(alive):
+            await asyncio.gather(stuck, return_exceptions=True)
+        return verdict, alive
+
+    verdict, alive = asyncio.run(run())
+    assert alive == [False]
+    assert verdict is None and len(automod.verdict_cache) == 0
+    # The next copy is checked again instead of being answered as clean.
+    assert automod.evaluate(Message(message.content, Author(2, "other"), [], [])).name == "badword_rule"
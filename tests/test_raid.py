@@ -0,0 +1,60 @@
+from collections import namedtuple
+from datetime import datetime, timedelta, timezone
+
+from src.automoderation.raid import RaidDetector, RaidSettings, name_skeleton
+
+DummyGuild = namedtuple("DummyGuild", ["id"])
+DummyMember = namedtuple("DummyMember", ["guild", "name", "created_at", "avatar"])
+
+
+def bot_account(guild, i):
+    created = datetime(2026, 10, 1, 12, 0, tzinfo=timezone.utc) + timedelta(minutes=i)
+    return DummyMember(guild, f"Sp4mBot{i}", datetime.now(timezone.utc) - timedelta(hours=1) if i % 2 else created, None)
+
+
+def regular_member(guild, i):
+    created = datetime(2020, 1, 1, tzinfo=timezone.utc) + timedelta(days=97 * i)
+    return DummyMember(guild, f"person{chr(97 + i % 26)}{i}", created, "avatar")
+
+
+def test_raid_raises_a_single_alert(clock):
+    detector = RaidDetector(clock=clock)
+    settings = RaidSettings()
+    guild = DummyGuild(1)
+    reports = []
+    for i in range(50):
+        reports.append(detector.observe(bot_account(guild, i), settings))
+        clock.now += 0.05
+    alerts = [r for r in reports if r is not None]
+    assert len(alerts) == 1
+    assert alerts[0].guild_id == 1 and alerts[0].no_avatar == alerts[0].joins
+
+
+def test_organic_joins_do_not_alert(clock):
+    detector = RaidDetector(clock=clock)
+    settings = RaidSettings()
+    guild = DummyGuild(1)
+    for i in range(40):
+        assert detector.observe(regular_member(guild, i), settings) is None
+        clock.now += 3
+
+
+def test_alert_rearms_after_cooldown(clock):
+    detector = RaidDetector(clock=clock)
+    settings = RaidSettings(cooldown=60)
+    guild = DummyGuild(1)
+
+    def burst():
+        found = 0
+        for i in range(20):
+            found += detector.observe(bot_account(guild, i), settings) is not None
+            clock.now += 0.1
+        return found
+
+    assert burst() == 1
+    clock.now += 120
+    assert burst() == 1
+
+
+def test_name_skeleton():
+    assert name_skeleton("Sp4mBot_123") == "spambot"
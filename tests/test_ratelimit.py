@@ -0,0 +1,31 @@
+from src.automoderation.ratelimit import SpamTracker
+
+
+def test_triggers_at_threshold_within_window(clock):
+    tracker = SpamTracker(clock=clock)
+    results = []
+    for _ in range(3):
+        results.append(tracker.hit("user", 2000, 3))
+        clock.now += 500
+    assert results == [False, False, True]
+    clock.now += 5000
+    assert tracker.hit("user", 2000, 3) is False
+
+
+def test_keys_are_independent(clock):
+    tracker = SpamTracker(clock=clock)
+    for _ in range(2):
+        tracker.hit((1, None, 42), 1000, 3)
+    assert tracker.hit((2, None, 42), 1000, 3) is False
+    assert tracker.hit((1, None, 42), 1000, 3) is True
+
+
+def test_memory_is_capped_and_idle_keys_swept(clock):
+    tracker = SpamTracker(max_entries=10, sweep_every=1_000_000, clock=clock)
+    for user in range(50):
+        tracker.hit(user, 1000, 5)
+    assert len(tracker) == 10
+    clock.now += 5000
+    tracker.hit("fresh", 1000, 5)
+    tracker.sweep()
+    assert len(tracker) == 1
@@ -0,0 +1,75 @@
+from collections import namedtuple
+
+import yaml
+
+from src.automoderation.automod import Automoderator
+from src.automoderation.features import MessageFeatures
+from src.automoderation.rules import compile_rules
+from src.automoderation.verdicts import MISS, VerdictCache
+
+Author = namedtuple("Author", ["id", "name"])
+
+
+class Message:
+    def __init__(self, id, content, author, mentions=()):
+        self.id = id
+        self.content = content
+        self.author = author
+        self.attachments = []
+        self.mentions = list(mentions)
+
+
+def make_automod(tmp_path, config):
+    path = tmp_path / "automod.yaml"
+    path.write_text(yaml.dump(config))
+    return Automoderator(str(path))
+
+
+def test_cache_is_keyed_by_plan_and_content():
+    plan, other = compile_rules({"caps_rule": {}}), compile_rules({"caps_rule": {}})
+    cache = VerdictCache(max_entries=2)
+    hello = MessageFeatures("hello")
+    cache.put(plan, hello, None)
+    assert cache.get(plan, MessageFeatures("hello")) is None
+    assert cache.get(plan, MessageFeatures("HELLO")) is MISS
+    assert cache.get(plan, MessageFeatures("hello", mentions=9)) is MISS
+    assert cache.get(other, hello) is MISS
+    cache.put(plan, MessageFeatures("a"), "caps_rule")
+    cache.put(plan, MessageFeatures("b"), None)
+    assert len(cache) == 2 and cache.get(plan, hello) is MISS
+    assert cache.hits == 1 and cache.misses == 4
+
+
+def test_repeats_skip_content_rules_but_not_spam(tmp_path):
+    automod = make_automod(tmp_path, {
+        "badword_rule": {"bad_words": ["badword"]},
+        "spam_rule": {"spam_interval": 60, "spam_threshold": 3},
+    })
+    spammer = Author(1, "spammer")
+    verdicts = [automod.evaluate(Message(i, "same old copypasta", spammer)) for i in range(3)]
+    assert [rule and rule.name for rule in verdicts] == [None, None, "spam_rule"]
+    assert automod.verdict_cache.hits == 2
+
+    assert automod.evaluate(Message(10, "a badword", Author(2, "other"))).name == "badword_rule"
+    assert automod.evaluate(Message(11, "a badword", Author(3, "another"))).name == "badword_rule"
+    assert automod.verdict_cache.hits == 3
+
+    # A reload gets a new plan, which starts without verdicts.
+    automod.load_config()
+    automod.evaluate(Message(12, "a badword", Author(4, "fourth")))
+    assert automod.verdict_cache.hits == 3
+
+
+def test_edits_are_checked_without_counting_as_messages(tmp_path):
+    automod = make_automod(tmp_path, {
+        "badword_rule": {"bad_words": ["badword"]},
+        "spam_rule": {"spam_interval": 60, "spam_threshold": 2},
+    })
+    author = Author(1, "editor")
+    message = Message(1, "hello", author)
+    assert automod.evaluate(message) is None
+    for _ in range(3):
+        assert automod.evaluate(message, stateful=False) is None
+    message.content = "hello badword"
+    assert automod.evaluate(message, stateful=False).name == "badword_rule"
+    assert len(automod.spam_tracker) == 1
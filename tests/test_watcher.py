@@ -0,0 +1,56 @@
+import asyncio
+import os
+
+import yaml
+
+from src.automoderation.automod import Automoderator
+from src.automoderation.watcher import ConfigWatcher
+
+
+def write(path, data):
+    with open(path, "w") as f:
+        yaml.dump(data, f)
+
+
+def test_reloads_after_writes_settle(tmp_path):
+    config_path = tmp_path / "automod_config.yaml"
+    write(config_path, {"mass_mention_rule": {"max_mentions": 5}})
+    automod = Automoderator(str(config_path))
+
+    async def scenario():
+        watcher = ConfigWatcher(automod, interval=0.01, debounce=0.05)
+        watcher.start()
+        await asyncio.sleep(0.05)
+        write(config_path, {"mass_mention_rule": {"max_mentions": 1}})
+        os.utime(config_path, ns=(1, 1))
+        await asyncio.sleep(0.3)
+        await watcher.stop()
+
+    asyncio.run(scenario())
+    assert automod.plan.get("mass_mention_rule").max_mentions == 1
+
+
+def test_invalid_edit_keeps_previous_plan(tmp_path):
+    config_path = tmp_path / "automod_config.yaml"
+    write(config_path, {"mass_mention_rule": {"max_mentions": 5}})
+    automod = Automoderator(str(config_path))
+    watcher = ConfigWatcher(automod)
+    before = watcher.snapshot()
+    config_path.write_text("mass_mention_rule: [unclosed")
+    after = watcher.snapshot()
+    asyncio.run(watcher.apply(before, after))
+    assert automod.plan.get("mass_mention_rule").max_mentions == 5
+
+
+def test_guild_file_change_recompiles_cached_guild(tmp_path):
+    config_path = tmp_path / "automod_config.yaml"
+    write(config_path, {"mass_mention_rule": {"max_mentions": 5}})
+    guild_dir = tmp_path / "guilds"
+    guild_dir.mkdir()
+    automod = Automoderator(str(config_path), guild_config_dir=str(guild_dir))
+    assert automod.guild_configs.get(100) is automod.plan
+    watcher = ConfigWatcher(automod)
+    before = watcher.snapshot()
+    write(guild_dir / "100.yaml", {"mass_mention_rule": {"max_mentions": 2}})
+    asyncio.run(watcher.apply(before, watcher.snapshot()))
+    assert automod.guild_configs.get(100).get("mass_mention_rule").max_mentions == 2
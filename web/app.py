@@ -3,13 +3,14 @@ from flask_discord import DiscordOAuth2Session, requires_authorization, Unauthor
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from flask_talisman import Talisman
-import yaml
 import os
 from dotenv import load_dotenv
 import logging
 from functools import wraps
 import secrets
-from datetime import timedelta
+import sys
+import time
+from datetime import datetime, timedelta
 
 # Load environment variables
 load_dotenv()
@@ -56,6 +57,40 @@ limiter = Limiter(
 )
 
 CONFIG_FILE = os.path.join(os.path.dirname(__file__), "..", "config", "automod_config.yaml")
+CONFIG_DB = os.getenv('AUTOMOD_CONFIG_DB') or os.path.join(os.path.dirname(__file__), "..", "data", "automod_config.db")
+
+# The config store and rule compiler are shared with the bot.
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+from automoderation.config_store import ConfigStore
+from automoderation.modlog import ModLog
+from automoderation.rules import RULE_ORDER, compile_rules
+
+config_store = ConfigStore(CONFIG_DB)
+modlog = ModLog(os.getenv('AUTOMOD_LOG_DB') or os.path.join(os.path.dirname(__file__), "..", "data", "modlog.db"))
+
+# Seconds a session's Discord identity and admin status are reused before
+# asking Discord again. Logging out drops them immediately.
+IDENTITY_TTL = int(os.getenv('WEB_IDENTITY_TTL') or 300)
+
+def current_identity(refresh=False):
+    """Return this session's cached identity, fetching it from Discord if stale.
+
+    The identity is a dict with the user's ``id``, ``username`` and
+    ``admin`` status, kept in the (signed) session cookie so page loads
+    don't need any Discord API calls until it expires.
+    """
+    identity = session.get('identity')
+    if identity and not refresh and identity.get('expires', 0) > time.time():
+        return identity
+    user = discord.fetch_user()
+    identity = {
+        'id': str(user.id),
+        'username': user.username,
+        'admin': fetch_admin_status(user),
+        'expires': time.time() + IDENTITY_TTL,
+    }
+    session['identity'] = identity
+    return identity
 
 @app.route("/")
 def index():
@@ -65,8 +100,8 @@ def index():
     
     if discord.authorized:
         try:
-            user = discord.fetch_user()
-            logger.info(f"User is authorized: {user.username}")
+            identity = current_identity()
+            logger.info(f"User is authorized: {identity['username']}")
             return redirect(url_for("config"))
         except Exception as e:
             logger.error(f"Error fetching user: {e}")
@@ -90,9 +125,9 @@ def callback():
     try:
         discord.callback()
         
-        # Test if we can fetch user
-        user = discord.fetch_user()
-        logger.info(f"OAuth2 successful - User: {user.username} (ID: {user.id})")
+        # Test if we can fetch user, and cache who they are for this session
+        identity = current_identity(refresh=True)
+        logger.info(f"OAuth2 successful - User: {identity['username']} (ID: {identity['id']})")
         
         # Force session to be permanent
         session.permanent = True
@@ -111,6 +146,7 @@ def logout():
     """Logout and revoke Discord session"""
     logger.info("User logging out")
     discord.revoke()
+    # Also drops the cached identity, so the next login asks Discord again.
     session.clear()
     flash("You have been logged out.", "info")
     return redirect(url_for("index"))
@@ -127,45 +163,50 @@ def is_admin():
     if not discord.authorized:
         return False
     try:
-        user = discord.fetch_user()
-        logger.info(f"Checking admin status for user: {user.username}")
-        
-        # Get user's guilds
-        guilds = discord.fetch_guilds()
-        guild_id = app.config['DISCORD_GUILD_ID']
-        
-        # Check if user is in the target guild
-        user_guild = next((g for g in guilds if str(g.id) == str(guild_id)), None)
-        if not user_guild:
-            logger.warning(f"User not in guild {guild_id}")
-            return False
-        
-        # Fix: Convert permissions to int first
-        permissions = user_guild.permissions
-        if hasattr(permissions, 'value'):
-            # If it's a Permissions object with a value attribute
-            permissions_int = permissions.value
-        else:
-            # Try to convert to int
-            permissions_int = int(permissions)
-        
-        is_admin = bool(permissions_int & 0x8)  # ADMINISTRATOR permission
-        logger.info(f"User {user.username} admin status: {is_admin} (permissions: {permissions_int})")
-        return is_admin
+        return current_identity()['admin']
     except Exception as e:
         logger.error(f"Failed to check admin status: {e}")
         logger.exception("Full traceback:")
         return False
 
+def fetch_admin_status(user):
+    """Ask Discord whether ``user`` is an admin in the configured guild.
+
+    Raises on API errors so a failed lookup is never cached as "not admin".
+    """
+    logger.info(f"Checking admin status for user: {user.username}")
+    
+    # Get user's guilds
+    guilds = discord.fetch_guilds()
+    guild_id = app.config['DISCORD_GUILD_ID']
+    
+    # Check if user is in the target guild
+    user_guild = next((g for g in guilds if str(g.id) == str(guild_id)), None)
+    if not user_guild:
+        logger.warning(f"User not in guild {guild_id}")
+        return False
+    
+    # Fix: Convert permissions to int first
+    permissions = user_guild.permissions
+    if hasattr(permissions, 'value'):
+        # If it's a Permissions object with a value attribute
+        permissions_int = permissions.value
+    else:
+        # Try to convert to int
+        permissions_int = int(permissions)
+    
+    is_admin = bool(permissions_int & 0x8)  # ADMINISTRATOR permission
+    logger.info(f"User {user.username} admin status: {is_admin} (permissions: {permissions_int})")
+    return is_admin
+
 @app.route('/config', methods=['GET', 'POST'])
 @requires_authorization
 def config():
     """Main configuration page"""
     # Debug info
     try:
-        user = discord.fetch_user()
-        logger.info(f"Config page accessed by: {user.username}")
-    except:
+        logger.info(f"Config page accessed by: {current_identity()['username']}")
+    except Exception:
         pass
     
     if not is_admin():
@@ -173,55 +214,158 @@ def config():
         return redirect(url_for("logout"))
 
     if request.method == 'POST':
-        # Load current config or start with an empty dict
+        base_version, current = load_config()
+        try:
+            form_version = int(request.form.get('version', base_version))
+            changes = config_changes_from_form(current)
+        except ValueError as e:
+            flash(f"Invalid value: {e}", "error")
+            return redirect(url_for('config'))
+
+        # Don't overwrite rules someone else changed after this form was
+        # loaded. Only rules edited on this form can conflict; the others
+        # just keep the newer settings.
+        loaded = config_store.config_at(form_version) if form_version != base_version else current
+        edited = {rule for rule, settings in config_changes_from_form(loaded).items() if settings != loaded.get(rule)}
+        conflicts = set()
+        for rule in config_store.changed_rules(form_version, base_version) & set(changes):
+            if changes.pop(rule) != current.get(rule) and rule in edited:
+                conflicts.add(rule)
+        if conflicts:
+            flash(f"Not saved, changed by someone else meanwhile: {', '.join(sorted(conflicts))}", "warning")
+
+        identity = current_identity()
         try:
-            with open(CONFIG_FILE, 'r') as f:
-                config_data = yaml.safe_load(f) or {}
+            version = config_store.commit(
+                changes,
+                author=f"{identity['username']} ({identity['id']})",
+                message="Edited in web panel",
+                validate=compile_rules,
+            )
+        except ValueError as e:
+            flash(f"Invalid configuration: {e}", "error")
+            return redirect(url_for('config'))
         except Exception as e:
-            logger.error(f"Failed to load config: {e}")
-            config_data = {}
+            logger.error(f"Failed to save config: {e}")
+            flash('Failed to save configuration.', 'error')
+            return redirect(url_for('config'))
+
+        if version is None:
+            flash('No changes to save.', 'info')
+        else:
+            flash(f'Configuration updated successfully (version {version})!', 'success')
+            logger.info(f"Configuration updated to version {version}")
+        return redirect(url_for('config'))
+    else:
+        version, config_data = load_config()
+        return render_template('config.html', config=config_data, version=version)
 
-        # Update config from form input
-        bad_words = request.form.get('bad_words', '')
-        config_data['badword_rule'] = {"bad_words": [w.strip() for w in bad_words.split(',') if w.strip()]}
+def load_config():
+    """Return ``(version, config)`` from the store, importing config file edits first"""
+    try:
+        config_store.sync_file(CONFIG_FILE, validate=compile_rules)
+    except Exception as e:
+        logger.warning(f"Failed to sync {CONFIG_FILE} into the config store: {e}")
+    return config_store.current()
 
-        blocked_links = request.form.get('blocked_links', '')
-        config_data['link_blocking_rule'] = {"blocked_links": [l.strip() for l in blocked_links.split(',') if l.strip()]}
+def config_changes_from_form(current):
+    """Build the new settings of every rule on the form.
 
-        max_mentions = int(request.form.get('max_mentions', 5))
-        config_data['mass_mention_rule'] = {"max_mentions": max_mentions}
+    Options the form doesn't show are kept from the current settings. Only
+    rules whose settings actually differ are written by the store.
+    """
+    def section(name, **values):
+        return {**(current.get(name) or {}), **values}
 
-        max_caps_ratio = float(request.form.get('max_caps_ratio', 0.7))
-        min_length = int(request.form.get('min_length', 10))
-        config_data['caps_rule'] = {"max_caps_ratio": max_caps_ratio, "min_length": min_length}
+    def split(field):
+        return [v.strip() for v in request.form.get(field, '').split(',') if v.strip()]
 
-        blocked_filetypes = request.form.get('blocked_filetypes', '')
-        config_data['attachment_rule'] = {"blocked_filetypes": [ft.strip() for ft in blocked_filetypes.split(',') if ft.strip()]}
+    return {
+        'badword_rule': section('badword_rule', bad_words=split('bad_words')),
+        'link_blocking_rule': section('link_blocking_rule', blocked_links=split('blocked_links')),
+        'mass_mention_rule': section('mass_mention_rule', max_mentions=int(request.form.get('max_mentions', 5))),
+        'caps_rule': section(
+            'caps_rule',
+            max_caps_ratio=float(request.form.get('max_caps_ratio', 0.7)),
+            min_length=int(request.form.get('min_length', 10)),
+        ),
+        'attachment_rule': section('attachment_rule', blocked_filetypes=split('blocked_filetypes')),
+        'spam_rule': section(
+            'spam_rule',
+            spam_interval=int(request.form.get('spam_interval', 10)),
+            spam_threshold=int(request.form.get('spam_threshold', 5)),
+        ),
+    }
 
-        spam_interval = int(request.form.get('spam_interval', 10))
-        spam_threshold = int(request.form.get('spam_threshold', 5))
-        config_data['spam_rule'] = {"spam_interval": spam_interval, "spam_threshold": spam_threshold}
+@app.route('/config/history')
+@requires_authorization
+def config_history():
+    """Audit log of config changes"""
+    if not is_admin():
+        flash("You need to be a server administrator to access this page.", "error")
+        return redirect(url_for("logout"))
+    commits = [
+        c._replace(created_at=datetime.fromtimestamp(c.created_at).strftime('%Y-%m-%d %H:%M:%S'))
+        for c in config_store.history()
+    ]
+    return render_template('history.html', commits=commits, version=config_store.version())
 
-        # Write the updated configuration back to the YAML file
-        try:
-            os.makedirs(os.path.dirname(CONFIG_FILE), exist_ok=True)
-            with open(CONFIG_FILE, 'w') as f:
-                yaml.dump(config_data, f)
-            flash('Configuration updated successfully!', 'success')
-            logger.info("Configuration updated successfully")
-        except Exception as e:
-            logger.error(f"Failed to save config: {e}")
-            flash('Failed to save configuration.', 'error')
-        
-        return redirect(url_for('config'))
+@app.route('/config/rollback/<int:version>', methods=['POST'])
+@requires_authorization
+def config_rollback(version):
+    """Restore the config as it was at ``version``"""
+    if not is_admin():
+        flash("You need to be a server administrator to access this page.", "error")
+        return redirect(url_for("logout"))
+    identity = current_identity()
+    try:
+        new_version = config_store.rollback(
+            version, author=f"{identity['username']} ({identity['id']})", validate=compile_rules
+        )
+    except ValueError as e:
+        flash(f"Can't roll back to version {version}: {e}", "error")
+        return redirect(url_for('config_history'))
+    if new_version is None:
+        flash(f"The configuration already matches version {version}.", "info")
     else:
-        try:
-            with open(CONFIG_FILE, 'r') as f:
-                config_data = yaml.safe_load(f) or {}
-        except Exception as e:
-            logger.warning(f"Failed to load config, using defaults: {e}")
-            config_data = {}
-        return render_template('config.html', config=config_data)
+        flash(f"Rolled back to version {version} (now version {new_version}).", "success")
+    return redirect(url_for('config_history'))
+
+@app.route('/modlog')
+@requires_authorization
+def moderation_log():
+    """Recent moderation actions in the configured guild, filterable by user, rule and date"""
+    if not is_admin():
+        flash("You need to be a server administrator to access this page.", "error")
+        return redirect(url_for("logout"))
+    filters = {
+        'user_id': request.args.get('user_id', '').strip(),
+        'rule': request.args.get('rule', ''),
+        'since': request.args.get('since', ''),
+        'until': request.args.get('until', ''),
+    }
+    try:
+        user_id = int(filters['user_id']) if filters['user_id'] else None
+        # Dates select whole days; "until" includes the day it names.
+        since = datetime.strptime(filters['since'], '%Y-%m-%d').timestamp() if filters['since'] else None
+        until = (datetime.strptime(filters['until'], '%Y-%m-%d') + timedelta(days=1)).timestamp() \
+            if filters['until'] else None
+    except ValueError:
+        flash("User ids must be numbers and dates YYYY-MM-DD.", "error")
+        user_id = since = until = None
+    guild_id = app.config['DISCORD_GUILD_ID']
+    events = [
+        e._replace(timestamp=datetime.fromtimestamp(e.timestamp).strftime('%Y-%m-%d %H:%M:%S'))
+        for e in modlog.query(
+            guild_id=int(guild_id) if guild_id else None,
+            user_id=user_id,
+            rule=filters['rule'] or None,
+            since=since,
+            until=until,
+            limit=200,
+        )
+    ]
+    return render_template('modlog.html', events=events, filters=filters, rules=RULE_ORDER)
 
 @app.route('/debug')
 def debug_session():